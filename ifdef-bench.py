@@ -0,0 +1,271 @@
+#!/usr/bin/env python
+# -*- Mode: Python; indent-tabs-mode: nil -*-
+# vi: set ts=4 sw=4 expandtab:
+#
+# The MIT License
+#
+# Copyright (c) 2011 Alexander Macdonald
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import os
+import sys
+import imp
+import json
+import time
+import random
+import shutil
+import tempfile
+import cStringIO
+import optparse
+import ifdef
+from ifdef.parser import *
+
+# the tools are scripts rather than modules, so load the parts of them
+# being measured straight from their files (without leaving compiled
+# copies of them behind)
+tooldir = os.path.dirname(os.path.abspath(__file__))
+dontwritebytecode = sys.dont_write_bytecode
+sys.dont_write_bytecode = True
+try:
+    rewriter = imp.load_source("ifdefrewriter", os.path.join(tooldir, "ifdef-rewriter.py"))
+    stats = imp.load_source("ifdefstats", os.path.join(tooldir, "ifdef-stats.py"))
+finally:
+    sys.dont_write_bytecode = dontwritebytecode
+
+# ------------------------------------------------------------------------------
+# Synthetic corpus
+# ------------------------------------------------------------------------------
+
+# Generates C-like sources full of conditionals. Everything comes from a
+# random.Random seeded with opts.seed, so the same options always give
+# byte for byte the same corpus.
+class CorpusGenerator:
+    def __init__(self, opts):
+        self.opts = opts
+        self.random = random.Random(opts.seed)
+        self.macros = ["BENCH_MACRO_%d" % i for i in xrange(opts.macros)]
+
+    def term(self):
+        r = self.random
+        m = r.choice(self.macros)
+        kind = r.randint(0, 3)
+        if kind == 0:
+            return "defined(%s)" % m
+        elif kind == 1:
+            return "!defined(%s)" % m
+        elif kind == 2:
+            return m
+        return "%s >= %d" % (m, r.randint(0, 9))
+
+    def expr(self):
+        e = self.term()
+        for i in xrange(self.random.randint(1, self.opts.complexity) - 1):
+            e = "(%s) %s (%s)" % (e, self.random.choice(["&&", "||"]), self.term())
+        return e
+
+    def code(self):
+        r = self.random
+        line = "    int v%d = %d" % (r.randint(0, 9999), r.randint(0, 9999))
+        while len(line) < self.opts.linelength - 12:
+            line += " + v%d" % r.randint(0, 9999)
+        return line + ";"
+
+    def opening(self):
+        r = self.random
+        kind = r.randint(0, 2)
+        if kind == 0:
+            return "#ifdef %s" % r.choice(self.macros)
+        elif kind == 1:
+            return "#ifndef %s" % r.choice(self.macros)
+        return "#if %s" % self.expr()
+
+    def file(self, dst):
+        r = self.random
+        # one entry per open conditional, saying whether it has had an #else
+        open = []
+        for i in xrange(self.opts.lines):
+            if r.random() >= self.opts.density:
+                dst.write(self.code() + "\n")
+            elif len(open) < self.opts.depth and (len(open) == 0 or r.random() < 0.5):
+                dst.write(self.opening() + "\n")
+                open.append(False)
+            elif not open[-1] and r.random() < 0.3:
+                if r.random() < 0.5:
+                    dst.write("#elif %s\n" % self.expr())
+                else:
+                    dst.write("#else\n")
+                    open[-1] = True
+            else:
+                dst.write("#endif\n")
+                open.pop()
+        for i in open:
+            dst.write("#endif\n")
+
+    def generate(self, dir):
+        files = []
+        for i in xrange(self.opts.files):
+            path = os.path.join(dir, "bench%d.c" % i)
+            dst = open(path, 'w')
+            self.file(dst)
+            dst.close()
+            files.append(path)
+        return files
+
+def countcorpus(files):
+    (lines, directives) = (0, 0)
+    for file in files:
+        for line in open(file, 'r'):
+            lines += 1
+            if parseline(line) is not None:
+                directives += 1
+    return (lines, directives)
+
+# ------------------------------------------------------------------------------
+# Benchmarks
+# ------------------------------------------------------------------------------
+
+# Each benchmark runs over the whole corpus and returns the seconds spent
+# in the part being measured. The expression cache starts empty every
+# time, as it would for a run of the tools without --expr-cache.
+
+def benchparse(files, opts):
+    exprcache.clear()
+    start = time.time()
+    for file in files:
+        parsefile(file)
+    return time.time() - start
+
+def benchstats(files, opts):
+    exprcache.clear()
+    seconds = 0.0
+    for file in files:
+        root = parsefile(file)
+        start = time.time()
+        stats.computestats(root, {})
+        seconds += time.time() - start
+    return seconds
+
+def benchrewrite(files, opts):
+    exprcache.clear()
+    # half the macros are set, half of those on and half off
+    ropts = optparse.Values({"updatecomments": True, "diff": None})
+    ropts.values = {}
+    for (i, m) in enumerate(CorpusGenerator(opts).macros[::2]):
+        ropts.values[m] = DefinedValue([1]) if i % 2 == 0 else None
+    seconds = 0.0
+    for file in files:
+        root = parsefile(file)
+        start = time.time()
+        rewriter.serializeifdefs(root.children, cStringIO.StringIO(), ropts, rewriter.TidyResult(file))
+        seconds += time.time() - start
+    return seconds
+
+benchmarks = [
+    ("parse", benchparse),
+    ("stats", benchstats),
+    ("rewrite", benchrewrite),
+]
+
+# the options that decide what the corpus looks like; a baseline is only
+# comparable with a run over the same corpus
+corpusoptions = ["seed", "files", "lines", "depth", "density", "complexity", "linelength", "macros"]
+
+def compare(results, baseline, tolerance):
+    # returns False if anything got slower by more than tolerance
+    ok = True
+    if baseline["corpus"] != results["corpus"]:
+        print "# warning: the baseline was measured on a different corpus"
+    for (name, result) in sorted(results["benchmarks"].items()):
+        if name not in baseline["benchmarks"]:
+            continue
+        before = baseline["benchmarks"][name]["linespersec"]
+        ratio = result["linespersec"] / max(before, 1e-9)
+        print "%-8s %6.2fx baseline (%.0f lines/s before)" % (name, ratio, before)
+        if tolerance is not None and ratio < 1.0 - tolerance:
+            print "# %s is more than %.0f%% slower than the baseline" % (name, 100 * tolerance)
+            ok = False
+    return ok
+
+# ------------------------------------------------------------------------------
+# Main Entrypoint
+# ------------------------------------------------------------------------------
+if __name__ == "__main__":
+    optParser = optparse.OptionParser(usage='usage: %%prog [ options ] [ benchmark ... ]\n\nGenerates a synthetic corpus and measures parse, stats and rewrite\nthroughput over it. Benchmarks are %s; all are run if none\nare given.' % ", ".join(name for (name, f) in benchmarks))
+    optParser.set_defaults()
+    optParser.add_option( '--seed', dest="seed", default=1, type="int")
+    optParser.add_option( '--files', dest="files", default=20, type="int")
+    optParser.add_option( '--lines', dest="lines", default=5000, type="int", help="lines per file")
+    optParser.add_option( '--depth', dest="depth", default=4, type="int", help="maximum conditional nesting")
+    optParser.add_option( '--density', dest="density", default=0.1, type="float", help="fraction of lines that are directives")
+    optParser.add_option( '--complexity', dest="complexity", default=3, type="int", help="maximum terms in an #if/#elif expression")
+    optParser.add_option( '--line-length', dest="linelength", default=60, type="int")
+    optParser.add_option( '--macros', dest="macros", default=200, type="int")
+    optParser.add_option( '-r', '--repeat', dest="repeat", default=3, type="int", help="runs of each benchmark, the best is reported")
+    optParser.add_option( '--corpus', dest="corpus", default=None, help="generate the corpus here and keep it")
+    optParser.add_option( '--save-baseline', dest="savebaseline", default=None)
+    optParser.add_option( '-b', '--baseline', dest="baseline", default=None)
+    optParser.add_option( '--tolerance', dest="tolerance", default=None, type="float", help="fail if anything is this much slower than the baseline, e.g. 0.1")
+    (opts, args) = optParser.parse_args()
+    if opts.depth < 1:
+        optParser.error("--depth must be at least 1")
+
+    selected = [(name, f) for (name, f) in benchmarks if len(args) == 0 or name in args]
+    if len(selected) == 0:
+        optParser.error("unknown benchmark(s) %s" % ", ".join(args))
+
+    dir = opts.corpus
+    if dir is None:
+        dir = tempfile.mkdtemp(prefix="ifdef-bench")
+    elif not os.path.isdir(dir):
+        os.makedirs(dir)
+    try:
+        files = CorpusGenerator(opts).generate(dir)
+        (lines, directives) = countcorpus(files)
+        print "# corpus: %d files, %d lines, %d directives (seed %d)" % (len(files), lines, directives, opts.seed)
+
+        results = {
+            "version": ifdef.__version__,
+            "corpus": dict((k, getattr(opts, k)) for k in corpusoptions),
+            "benchmarks": {},
+        }
+        for (name, f) in selected:
+            seconds = min(f(files, opts) for i in xrange(max(opts.repeat, 1)))
+            results["benchmarks"][name] = {
+                "seconds": seconds,
+                "linespersec": lines / max(seconds, 1e-9),
+                "directivespersec": directives / max(seconds, 1e-9),
+            }
+            print "%-8s %8.3fs %10.0f lines/s %10.0f directives/s" % (name, seconds, lines / max(seconds, 1e-9), directives / max(seconds, 1e-9))
+    finally:
+        if opts.corpus is None:
+            shutil.rmtree(dir)
+
+    if opts.savebaseline is not None:
+        dst = open(opts.savebaseline, 'w')
+        json.dump(results, dst, indent=2, sort_keys=True)
+        dst.write("\n")
+        dst.close()
+
+    if opts.baseline is not None:
+        src = open(opts.baseline, 'r')
+        baseline = json.load(src)
+        src.close()
+        if not compare(results, baseline, opts.tolerance):
+            exit(1)
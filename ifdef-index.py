@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+# -*- Mode: Python; indent-tabs-mode: nil -*-
+# vi: set ts=4 sw=4 expandtab:
+#
+# The MIT License
+#
+# Copyright (c) 2011 Alexander Macdonald
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import os
+import sys
+import sqlite3
+import logging
+import optparse
+import ifdef
+from ifdef.parser import *
+from ifdef.manifest import hashfile, manifestkey
+from ifdef.condition import Conditions
+from ifdef.sources import findsources
+
+schema = """
+CREATE TABLE IF NOT EXISTS meta (version TEXT);
+CREATE TABLE IF NOT EXISTS files (id INTEGER PRIMARY KEY, path TEXT UNIQUE, mtime REAL, size INTEGER, hash TEXT);
+CREATE TABLE IF NOT EXISTS branches (id INTEGER PRIMARY KEY, file INTEGER, startline INTEGER, endline INTEGER, depth INTEGER, context TEXT);
+CREATE TABLE IF NOT EXISTS uses (macro TEXT, branch INTEGER, polarity INTEGER, direct INTEGER);
+CREATE INDEX IF NOT EXISTS uses_macro ON uses (macro, polarity);
+CREATE INDEX IF NOT EXISTS uses_branch ON uses (branch);
+CREATE INDEX IF NOT EXISTS branches_file ON branches (file);
+"""
+
+def opendb(file):
+    db = sqlite3.connect(file)
+    db.text_factory = str
+    db.executescript(schema)
+    row = db.execute("SELECT version FROM meta").fetchone()
+    if row is None or row[0] != ifdef.__version__:
+        # written by some other version, start again
+        db.executescript("DELETE FROM meta; DELETE FROM files; DELETE FROM branches; DELETE FROM uses;")
+        db.execute("INSERT INTO meta VALUES (?)", (ifdef.__version__,))
+        db.commit()
+    return db
+
+# ------------------------------------------------------------------------------
+# Building the index
+# ------------------------------------------------------------------------------
+
+# Breaks a condition down into the macros it requires to be defined
+# (polarity 1) or undefined (polarity 0). Macros that are used in some
+# other way, such as inside a comparison or one side of an ||, are
+# reported with a polarity of None.
+def literals(e, positive=True):
+    if isinstance(e, AndExpr) and positive or isinstance(e, OrExpr) and not positive:
+        return literals(e.args[0], positive) + literals(e.args[1], positive)
+    elif isinstance(e, NotExpr):
+        return literals(e.args[0], not positive)
+    elif isinstance(e, DefinedExpr):
+        return [(e.args[0], int(positive))]
+    elif isinstance(e, basestring):
+        return [(e, int(positive))]
+    return [(str(t), None) for t in gettokens(e) if isinstance(t, basestring)]
+
+def conjunction(conds):
+    if len(conds) == 0:
+        return None
+    e = conds[0]
+    for c in conds[1:]:
+        e = AndExpr([e, c])
+    return e
+
+def walkbranches(x, depth, context, rows):
+    # each branch is controlled by its own condition and the negation of
+    # every condition before it in the same if/elif/else chain
+    previous = []
+    for b in x.children:
+        own = [NotExpr([c]) for c in previous]
+        if b.cond is not None and b.cond.expr != "":
+            c = parseexpr(b.cond.expr)
+            own.append(c)
+            previous.append(c)
+        rows.append((b.startpos, b.endpos, depth, own, context))
+        for child in b.children:
+            if isinstance(child, Ifdef):
+                walkbranches(child, depth + 1, context + own, rows)
+
+def indexfile(db, file):
+    rows = []
+    root = parsefile(file)
+    for child in root.children[0].children:
+        if isinstance(child, Ifdef):
+            walkbranches(child, 1, [], rows)
+
+    # files are recorded by their manifest key, so that "a.h" and "./a.h"
+    # share one entry
+    path = manifestkey(file)
+    st = os.stat(file)
+    db.execute("DELETE FROM uses WHERE branch IN (SELECT branches.id FROM branches JOIN files ON branches.file = files.id WHERE files.path = ?)", (path,))
+    db.execute("DELETE FROM branches WHERE file IN (SELECT id FROM files WHERE path = ?)", (path,))
+    db.execute("INSERT OR REPLACE INTO files (path, mtime, size, hash) VALUES (?, ?, ?, ?)", (path, st.st_mtime, st.st_size, hashfile(file)))
+    fileid = db.execute("SELECT id FROM files WHERE path = ?", (path,)).fetchone()[0]
+
+    uses = []
+    for (startline, endline, depth, own, context) in rows:
+        e = conjunction(context + own)
+        c = db.execute("INSERT INTO branches (file, startline, endline, depth, context) VALUES (?, ?, ?, ?, ?)",
+                       (fileid, startline, endline, depth, printexpr(e) if e is not None else ""))
+        branch = c.lastrowid
+        seen = set()
+        for (conds, direct) in [(own, 1), (context, 0)]:
+            for cond in conds:
+                for (macro, polarity) in literals(cond):
+                    if (macro, polarity) not in seen:
+                        seen.add((macro, polarity))
+                        uses.append((macro, branch, polarity, direct))
+    db.executemany("INSERT INTO uses VALUES (?, ?, ?, ?)", uses)
+
+def current(db, file):
+    path = manifestkey(file)
+    row = db.execute("SELECT mtime, size, hash FROM files WHERE path = ?", (path,)).fetchone()
+    if row is None:
+        return False
+    try:
+        st = os.stat(file)
+    except OSError:
+        # gone, so reindexing will fail and drop it
+        return False
+    if st.st_size != row[1]:
+        return False
+    if st.st_mtime == row[0]:
+        return True
+    if hashfile(file) != row[2]:
+        return False
+    db.execute("UPDATE files SET mtime = ? WHERE path = ?", (st.st_mtime, path))
+    return True
+
+def removefile(db, file):
+    file = manifestkey(file)
+    db.execute("DELETE FROM uses WHERE branch IN (SELECT branches.id FROM branches JOIN files ON branches.file = files.id WHERE files.path = ?)", (file,))
+    db.execute("DELETE FROM branches WHERE file IN (SELECT id FROM files WHERE path = ?)", (file,))
+    db.execute("DELETE FROM files WHERE path = ?", (file,))
+
+def updateindex(db, files, prune):
+    seen = set()
+    for file in files:
+        seen.add(manifestkey(file))
+        if current(db, file):
+            continue
+        print "Indexing %s" % file
+        try:
+            indexfile(db, file)
+        except KeyboardInterrupt:
+            exit(0)
+        except:
+            print "-- Error with file %s:" % file
+            print sys.exc_info()[1]
+            removefile(db, file)
+    if prune:
+        for (file,) in db.execute("SELECT path FROM files").fetchall():
+            if file not in seen:
+                removefile(db, file)
+    db.commit()
+
+# ------------------------------------------------------------------------------
+# Queries
+# ------------------------------------------------------------------------------
+
+# Prints the branches picked out by the where subquery, or only those
+# whose context passes keep if it is given.
+def printbranches(db, where, args, keep=None):
+    rows = db.execute("SELECT files.path, branches.startline, branches.endline, branches.depth, branches.context FROM branches JOIN files ON branches.file = files.id WHERE branches.id IN (%s) ORDER BY files.path, branches.startline" % where, args)
+    for row in rows:
+        if keep is None or keep(row[4]):
+            print "%s:%d-%d depth %d: %s" % row
+
+def macrouses(db, macro):
+    printbranches(db, "SELECT branch FROM uses WHERE macro = ? AND direct = 1", (macro,))
+
+# The index doesn't tell "#if X" from "#ifdef X" (see literals), so
+# neither do queries: X used as a condition is taken as defined(X).
+def asdefined(e):
+    if isinstance(e, (AndExpr, OrExpr, NotExpr)):
+        return type(e)([asdefined(a) for a in e.args])
+    elif isinstance(e, basestring):
+        return DefinedExpr([e])
+    return e
+
+def conditionquery(db, query):
+    # code that is only reached when the query holds, given the conditions
+    # of the branch itself and of the ones around it. Any branch using one
+    # of the query's macros is a candidate, and is kept if its context
+    # implies the query.
+    try:
+        expr = parseexpr(query)
+    except Exception:
+        print "-- Query '%s' can't be parsed" % query
+        return
+    macros = sorted(set(macro for (macro, polarity) in literals(expr)))
+    if len(macros) == 0:
+        print "-- Query '%s' names no macros" % query
+        return
+    conditions = Conditions()
+    unwanted = conditions.neg(conditions.expr(asdefined(expr)))
+    def implies(context):
+        c = conditions.expr(asdefined(parseexpr(context)))
+        return conditions.conj(c, unwanted) == conditions.false
+    printbranches(db, "SELECT branch FROM uses WHERE macro IN (%s)" % ", ".join("?" * len(macros)), macros, implies)
+
+# ------------------------------------------------------------------------------
+# Main Entrypoint
+# ------------------------------------------------------------------------------
+if __name__ == "__main__":
+    optParser = optparse.OptionParser(usage='usage: %prog [ -b ] [ -u macro | -q condition ] [ files ]\n\nWith -b the index is brought up to date with the given files, or\nwith every file ending in c/cpp/mm/h under the current directory\nif none are given.')
+    optParser.set_defaults()
+    optParser.add_option( '-b', '--build', dest="build", default=False, action="store_true")
+    optParser.add_option( '-u', '--uses', dest="uses", default=None)
+    optParser.add_option( '-q', '--query', dest="query", default=None)
+    optParser.add_option( '--db', dest="db", default="ifdefindex.db")
+    (opts, args) = optParser.parse_args()
+    # lepl logs the expressions it fails to parse, but a bad query is
+    # reported by conditionquery
+    logging.getLogger("lepl").addHandler(logging.NullHandler())
+
+    db = opendb(opts.db)
+
+    if opts.build:
+        if len(args) == 0:
+            updateindex(db, findsources([]), True)
+        else:
+            updateindex(db, args, False)
+
+    if opts.uses is not None:
+        macrouses(db, opts.uses)
+    if opts.query is not None:
+        conditionquery(db, opts.query)
+    db.close()
@@ -25,148 +25,629 @@
 # THE SOFTWARE.
 
 import os
-import shutil
-import tempfile
 import re
 import sys
+import mmap
+import time
+import shutil
+import tempfile
+import filecmp
+import difflib
+import signal
+import itertools
+import cStringIO
+import multiprocessing
 import optparse
+import ifdef
 from ifdef.parser import *
+from ifdef.profile import Profile
+from ifdef.condition import Conditions, OpaqueExpr
+from ifdef.vcs import changedfiles
+from ifdef.sources import SOURCE_EXTENSIONS, findsources
 
-def serializeifdefs(xs, dst, opts):
-    # we only tag the else/endif with the conditional if it
-    # is further than 'threshold' lines away from the
-    # if/ifdef/ifndef/elif that declared it.
-    threshold = 4
+class TidyResult:
+    def __init__(self, file):
+        self.file = file
+        self.skipped = False
+        self.changed = False
+        self.removed = 0
+        self.rewritten = 0
+        self.error = None
+        self.cachehits = 0
+        self.cachemisses = 0
+        self.fastparses = 0
+        self.newexprs = None
+        self.edits = None
+        self.diff = None
+        self.seconds = 0.0
+        self.profile = None
 
+def serializeifdefs(xs, dst, opts, result, context=None):
     for x in xs:
         if isinstance(x, Ifdef):
-
-            rewrite = True
-            d = x.children[0].cond.expr
-            if len(opts.enabled) > 0 or len(opts.disabled) > 0:
-                found = False
-                if d is None:
-                    continue
-                for n in opts.enabled + opts.disabled:
-                    if d.find(n) >= 0:
-                        found = True
-                        break
-                if found:
-                    newcond = expr.parse(d)[0]
-                    for n in opts.enabled:
-                        newcond = substitutevalue(newcond, n, DefinedValue(1))
-                    for n in opts.disabled:
-                        newcond = substitutevalue(newcond, n, None)
-                    newcond = evalexpr(newcond)
-                    
-                    if len(x.children) == 1:
-                        if newcond is False or newcond is None:
-                            # simple removal
-                            continue
-                        elif newcond is True:
-                            # preserve contents of if, removing ifdefs
-                            serializeifdefs(x.children[0].children, dst, opts)
-                            continue
-                        else:
-                            # re-write expr!
-                            x.children[0].cond.expr = newcond
-                    if len(x.children) == 2 and x.children[1].cond == None:
-                        if newcond is False or newcond is None:
-                            # remove if, preserve else
-                            serializeifdefs(x.children[1].children, dst, opts)
-                            continue
-                        elif newcond is True:
-                            # preserve contents of if, remove ifdefs and else block
-                            serializeifdefs(x.children[0].children, dst, opts)
-                            continue
-                        else:
-                            # re-write expr!
-                            x.children[0].cond.expr = newcond
-                else:
-                    rewrite = False
-            
-            if rewrite:
-                prevbranch = None
-                for b in x.children:
-                    d = b.cond
-                    if d is None:  
-                        # This is an "else" branch
-                        d = parseline(b.startline)
-                        if opts.updatecomments:
-                            d.comment = ""
-                            if b.startpos - prevbranch.startpos > threshold:
-                                e = printifdefexpr(prevbranch.cond).strip()
-                                if prevbranch.cond.token in ["ifndef", "ifdef"]:
-                                    e = "%s %s" % (prevbranch.cond.token, e)
-                                d.comment = "// " + e
-        
-                    dst.write(printifdef(d) + "\n")
-                    serializeifdefs(b.children, dst, opts)
-                    prevbranch = b
-                if opts.updatecomments:
-                    d = parseline(x.children[-1].endline)
-                    d.comment = ""
-                    if x.children[-1].endpos - x.children[-1].startpos > threshold:
-                        c = x.children[-2].cond if x.children[-1].cond is None else x.children[-1].cond
-                        e = printifdefexpr(c).strip()
-                        if c.token in ["ifndef", "ifdef"]:
-                            e = "%s %s" % (c.token, e)
-                        d.comment = "// " + e
-                    dst.write(printifdef(d) + "\n")
-                else:
-                    dst.write(x.children[-1].endline)
+            start = dst.tell()
+            if context is None:
+                rewritten = serializeifdef(x, dst, opts, result)
             else:
-                for b in x.children:
-                    dst.write(b.startline)
-                    serializeifdefs(b.children, dst, opts)
-                dst.write(x.children[-1].endline)
-                
+                rewritten = solveifdef(x, dst, opts, result, context)
+            if rewritten and result.edits is not None:
+                # remember which lines this replaced, and with what, so
+                # that a diff can be made without comparing whole files
+                end = x.children[-1].endpos + directivelines(x.children[-1].endline) - 1
+                result.edits.append((x.children[0].startpos - 1, end, start, dst.tell()))
         elif isinstance(x, Branch):
-            serializeifdefs(x.children, dst, opts)
+            serializeifdefs(x.children, dst, opts, result, context)
         else:
             dst.write(x)
 
-def tidyifdefs(file, opts):
-    print "Tidying ifdefs in %s" % file
-    dst = tempfile.NamedTemporaryFile()
+def toplevel(opts):
+    # the context of a conditional that isn't nested in any other
+    return conditions.true if opts.solve else None
+
+def branchcontext(contexts, i):
+    return None if contexts is None else contexts[i]
+
+# Writes out a single Ifdef, returning True if it was rewritten in any
+# way or False if it was copied through unchanged. contexts, if given,
+# are what is known to hold inside each of its branches (see solveifdef).
+def serializeifdef(x, dst, opts, result, contexts=None):
+    rewrite = True
+    d = x.children[0].cond.expr
+    if len(opts.values) > 0:
+        if d is None:
+            return True
+        if not getidentifiers(d).isdisjoint(opts.values):
+            newcond = evalexpr(parseexpr(d), opts.values)
+            
+            if len(x.children) == 1:
+                if newcond is False or newcond is None:
+                    # simple removal
+                    result.removed += 1
+                    return True
+                elif newcond is True:
+                    # preserve contents of if, removing ifdefs
+                    result.rewritten += 1
+                    serializeifdefs(x.children[0].children, dst, opts, result, branchcontext(contexts, 0))
+                    return True
+                else:
+                    # re-write expr!
+                    x.children[0].cond.expr = newcond
+            if len(x.children) == 2 and x.children[1].cond == None:
+                if newcond is False or newcond is None:
+                    # remove if, preserve else
+                    result.removed += 1
+                    serializeifdefs(x.children[1].children, dst, opts, result, branchcontext(contexts, 1))
+                    return True
+                elif newcond is True:
+                    # preserve contents of if, remove ifdefs and else block
+                    result.removed += 1
+                    serializeifdefs(x.children[0].children, dst, opts, result, branchcontext(contexts, 0))
+                    return True
+                else:
+                    # re-write expr!
+                    x.children[0].cond.expr = newcond
+        else:
+            rewrite = False
     
+    if rewrite:
+        result.rewritten += 1
+        writeifdef(x, dst, opts, result, contexts)
+        return True
+    else:
+        for (i, b) in enumerate(x.children):
+            dst.write(b.startline)
+            serializeifdefs(b.children, dst, opts, result, branchcontext(contexts, i))
+        dst.write(x.children[-1].endline)
+    return False
+
+# Writes out an Ifdef from its (possibly rewritten) directives.
+def writeifdef(x, dst, opts, result, contexts=None):
+    # we only tag the else/endif with the conditional if it
+    # is further than 'threshold' lines away from the
+    # if/ifdef/ifndef/elif that declared it.
+    threshold = 4
+
+    prevbranch = None
+    for (i, b) in enumerate(x.children):
+        d = b.cond
+        if d is None:  
+            # This is an "else" branch
+            d = parseline(b.startline)
+            if opts.updatecomments:
+                d.comment = ""
+                if b.startpos - prevbranch.startpos > threshold:
+                    e = printifdefexpr(prevbranch.cond).strip()
+                    if prevbranch.cond.token in ["ifndef", "ifdef"]:
+                        e = "%s %s" % (prevbranch.cond.token, e)
+                    d.comment = "// " + e
+
+        dst.write(printifdef(d) + "\n")
+        serializeifdefs(b.children, dst, opts, result, branchcontext(contexts, i))
+        prevbranch = b
+    if opts.updatecomments:
+        d = parseline(x.children[-1].endline)
+        d.comment = ""
+        if x.children[-1].endpos - x.children[-1].startpos > threshold:
+            c = x.children[-2].cond if x.children[-1].cond is None else x.children[-1].cond
+            e = printifdefexpr(c).strip()
+            if c.token in ["ifndef", "ifdef"]:
+                e = "%s %s" % (c.token, e)
+            d.comment = "// " + e
+        dst.write(printifdef(d) + "\n")
+    else:
+        dst.write(x.children[-1].endline)
+
+# ------------------------------------------------------------------------------
+# Context-aware simplification (--solve)
+# ------------------------------------------------------------------------------
+
+# Set by --solve, see ifdef.condition
+conditions = None
+
+# Looks at a conditional in its context: what is known to hold where it
+# appears, i.e. the conditions of the branches it is nested in. Each of
+# its branches is reached only if the ones before it weren't taken, so a
+# branch that can't be taken there is dropped, and one that must be taken
+# if reached becomes the #else and ends the chain (or, if it is the first
+# left, replaces the whole conditional). Anything that doesn't change
+# shape is written out as usual, with the contexts passed down to the
+# conditionals nested in it.
+def solveifdef(x, dst, opts, result, context):
+    reach = context
+    survivors = []
+    changed = False
+    for b in x.children:
+        if b.cond is None:
+            e = True
+        elif b.cond.expr == "":
+            e = b.cond.expr
+        else:
+            try:
+                e = parseexpr(b.cond.expr)
+            except Exception:
+                # left as written, so nothing is assumed about it
+                e = OpaqueExpr(b.cond.expr)
+            else:
+                if not getidentifiers(b.cond.expr).isdisjoint(opts.values):
+                    e = evalexpr(e, opts.values)
+                    changed = True
+        c = conditions.expr(e)
+        taken = conditions.conj(reach, c)
+        reach = conditions.conj(reach, conditions.neg(c))
+        if taken == conditions.false:
+            changed = True
+            continue
+        survivors.append((b, e, taken))
+        if reach == conditions.false:
+            changed = changed or b.cond is not None or b is not x.children[-1]
+            break
+
+    if not changed:
+        return serializeifdef(x, dst, opts, result, [taken for (b, e, taken) in survivors])
+
+    result.removed += len(x.children) - len(survivors)
+    if len(survivors) == 0:
+        return True
+    result.rewritten += 1
+    if len(survivors) == 1 and reach == conditions.false:
+        # always taken, so only its contents are left
+        (b, e, taken) = survivors[0]
+        serializeifdefs(b.children, dst, opts, result, taken)
+        return True
+
+    y = Ifdef()
+    for (i, (b, e, taken)) in enumerate(survivors):
+        if b.cond is None:
+            n = Branch(b.startpos, None, b.startline)
+        elif i == len(survivors) - 1 and reach == conditions.false:
+            n = Branch(b.startpos, None, b.cond.hash + "else\n")
+        else:
+            token = "if" if i == 0 else "elif"
+            n = Branch(b.startpos, Directive(b.cond.hash, token, e, b.cond.comment), b.startline)
+        n.children = b.children
+        y.children.append(n)
+    y.children[-1].endpos = x.children[-1].endpos
+    y.children[-1].endline = x.children[-1].endline
+    writeifdef(y, dst, opts, result, [taken for (b, e, taken) in survivors])
+    return True
+
+def samecontents(data, output):
+    if len(data) != len(output):
+        return False
+    for i in xrange(0, len(output), 1 << 20):
+        if data[i:i + (1 << 20)] != output[i:i + (1 << 20)]:
+            return False
+    return True
+
+# Unified diff support. Outside of the conditionals that were rewritten
+# the output is a verbatim copy of the input, so the diff is made from
+# the recorded edits alone: each is the range of original lines a
+# conditional occupied and the range of output it was replaced with.
+
+def diffrange(start, length):
+    if length == 1:
+        return "%d" % (start + 1)
+    elif length == 0:
+        return "%d,0" % start
+    return "%d,%d" % (start + 1, length)
+
+def difflines(dst, prefix, lines):
+    for line in lines:
+        dst.write(prefix + line)
+        if not line.endswith("\n"):
+            dst.write("\n\\ No newline at end of file\n")
+
+# Splits text into lines, keeping their ends. Only "\n" ends a line, as
+# in the rewriting itself; str.splitlines would also break at a bare "\r"
+# and throw the line numbers off.
+linesregex = re.compile(r"[^\n]*\n|[^\n]+")
+
+def makediff(file, data, edits, output, context=3):
+    oldlines = linesregex.findall(data[:])
+
+    # the edits of nested conditionals are recorded before that of the
+    # conditional around them, which covers them. Within an edit only
+    # the lines that actually differ are changes.
+    changes = []
+    covered = 0
+    for (a, b, start, end) in sorted(edits, key=lambda e: (e[0], -e[1])):
+        if a < covered:
+            continue
+        covered = b
+        new = linesregex.findall(output[start:end])
+        matcher = difflib.SequenceMatcher(None, oldlines[a:b], new, False)
+        for (tag, i1, i2, j1, j2) in matcher.get_opcodes():
+            if tag != "equal":
+                changes.append((a + i1, a + i2, new[j1:j2]))
+    if len(changes) == 0:
+        return ""
+
+    # changes close enough for their context to overlap share a hunk
+    hunks = [[changes[0]]]
+    for change in changes[1:]:
+        if change[0] - hunks[-1][-1][1] <= 2 * context:
+            hunks[-1].append(change)
+        else:
+            hunks.append([change])
+
+    name = os.path.normpath(file)
+    dst = cStringIO.StringIO()
+    if os.path.isabs(name):
+        dst.write("--- %s\n+++ %s\n" % (name, name))
+    else:
+        dst.write("--- a/%s\n+++ b/%s\n" % (name, name))
+    offset = 0
+    for hunk in hunks:
+        start = max(0, hunk[0][0] - context)
+        end = min(len(oldlines), hunk[-1][1] + context)
+        delta = sum(len(new) - (b - a) for (a, b, new) in hunk)
+        dst.write("@@ -%s +%s @@\n" % (diffrange(start, end - start), diffrange(start + offset, end - start + delta)))
+        pos = start
+        for (a, b, new) in hunk:
+            difflines(dst, " ", oldlines[pos:a])
+            difflines(dst, "-", oldlines[a:b])
+            difflines(dst, "+", new)
+            pos = b
+        difflines(dst, " ", oldlines[pos:end])
+        offset += delta
+    return dst.getvalue()
+
+def affected(dir, opts):
+    if len(opts.values) == 0 or opts.solve:
+        return True
+    return not getidentifiers(dir.expr).isdisjoint(opts.values)
+
+def copyrange(data, dst, start, end):
+    # a piece at a time, so that a long stretch of a mapped file
+    # isn't copied into memory all at once
+    while start < end:
+        dst.write(data[start:min(end, start + (1 << 20))])
+        start += 1 << 20
+
+def streamifdefs(file, data, dst, opts, result):
+    # Rewrites data into dst as it is scanned. Anything outside a
+    # conditional that needs rewriting is copied straight through; a
+    # conditional that does is built up as a tree until its matching
+    # endif and then serialised, so when data is a mapped file memory
+    # use depends on the size of the blocks being rewritten rather than
+    # the size of the file.
+    builder = None
+    # conditionals being copied straight through that are still open
+    depth = 0
+    # everything before this has been written or given to the builder
+    done = 0
+    for (linestart, lineend, pos) in finddirectives(data):
+        dir = parseline(data, linestart, lineend)
+        if dir is None:
+            continue
+        if builder is None:
+            if dir.token in ["elif", "else", "endif"]:
+                if depth == 0:
+                    # fail the file just as building the whole tree would
+                    raise unmatched(dir, pos, file)
+                if dir.token == "endif":
+                    depth -= 1
+                continue
+            if dir.token not in ["if", "ifdef", "ifndef"]:
+                continue
+            if not affected(dir, opts):
+                depth += 1
+                continue
+            copyrange(data, dst, done, linestart)
+            builder = TreeBuilder(file)
+        elif done != linestart:
+            builder.text(buffer(data, done, linestart - done), pos)
+        builder.directive(dir, buffer(data, linestart, lineend - linestart), pos)
+        done = lineend
+        if builder.depth() == 0:
+            serializeifdefs(builder.root.children, dst, opts, result, toplevel(opts))
+            builder = None
+
+    if builder is not None:
+        # never closed, which will fail below just as it would
+        # for the whole file
+        if done != len(data):
+            builder.text(buffer(data, done, len(data) - done), 0)
+        serializeifdefs(builder.root.children, dst, opts, result, toplevel(opts))
+    else:
+        copyrange(data, dst, done, len(data))
+
+def rewritefile(file, opts, result):
+    data = readfile(file, opts.mmap)
     try:
-        root = parsefile(file)
-        serializeifdefs(root.children, dst, opts)
+        if opts.prefilter is not None and opts.prefilter.search(data) is None:
+            # none of the macros we know about appear anywhere, so
+            # there is nothing to rewrite
+            result.skipped = True
+            return
+        root = parsedata(data, file)
+        dst = cStringIO.StringIO()
+        if opts.diff is not None:
+            result.edits = []
+        serializeifdefs(root.children, dst, opts, result, toplevel(opts))
+        del root
 
-        # close the output file, then replace the
-        # source with the cleaned file
+        # only touch the source if something actually changed, so
+        # untouched files keep their mtime
+        if result.removed > 0 or result.rewritten > 0:
+            output = dst.getvalue()
+            if opts.diff is not None:
+                result.diff = makediff(file, data, result.edits, output)
+                result.changed = len(result.diff) > 0
+            else:
+                result.changed = not samecontents(data, output)
+        result.edits = None
+    finally:
+        # the map has to go before the file is rewritten
+        if isinstance(data, mmap.mmap):
+            data.close()
+    if result.changed and opts.diff is None:
+        writefile(file, output)
+
+def writefile(file, output):
+    out = open(file, 'w')
+    out.write(output)
+    out.close()
+
+def streamfile(file, opts, result):
+    data = readfile(file, True)
+    dst = None
+    try:
+        if opts.prefilter is not None and opts.prefilter.search(data) is None:
+            result.skipped = True
+            return
+        dst = tempfile.NamedTemporaryFile()
+        streamifdefs(file, data, dst, opts, result)
         dst.flush()
-        shutil.copyfile(dst.name, file)
+        if result.removed > 0 or result.rewritten > 0:
+            result.changed = not filecmp.cmp(dst.name, file, shallow=False)
+        if result.changed:
+            copyfile(dst.name, file)
+    finally:
+        if isinstance(data, mmap.mmap):
+            data.close()
+        if dst is not None:
+            dst.close()
+
+def copyfile(src, dst):
+    shutil.copyfile(src, dst)
+
+def tidyifdefs(file, opts):
+    result = TidyResult(file)
+    (hits, misses, fast) = (exprcache.hits, exprcache.misses, parsecounts.fast)
+    start = time.time()
+    
+    try:
+        if opts.stream:
+            streamfile(file, opts, result)
+        else:
+            rewritefile(file, opts, result)
     except KeyboardInterrupt:
         exit(0)
     except:
-        print " -- Failed to parse %s: %s" % (file, sys.exc_info()[0])
-        print sys.exc_info()
-    dst.close()
+        result.error = "%s: %s" % (sys.exc_info()[0].__name__, sys.exc_info()[1])
+    result.cachehits = exprcache.hits - hits
+    result.cachemisses = exprcache.misses - misses
+    result.fastparses = parsecounts.fast - fast
+    if profile is not None:
+        result.seconds = time.time() - start
+        result.profile = profile.take()
+    return result
+
+# ------------------------------------------------------------------------------
+# Profiling
+# ------------------------------------------------------------------------------
+
+# Set by --profile. Workers are forked after the functions below have
+# been wrapped, so they inherit the wrapped versions and their own copy
+# of the profile, which tidyifdefs empties into each result.
+profile = None
+
+def startprofile():
+    global profile
+    profile = Profile()
+    parsephases = {
+        "parseline": "parseline",
+        "parseexpr": ("exprparse", "expressions parsed"),
+    }
+    profile.instrument(vars(ifdef.parser), parsephases)
+    profile.instrument(globals(), dict(parsephases,
+        readfile = ("read", "bytes read", lambda args, data: len(data)),
+        parsedata = "scan",
+        evalexpr = "eval",
+        serializeifdefs = "serialize",
+        streamifdefs = "stream",
+        samecontents = "compare",
+        makediff = "diff",
+        writefile = ("write", "bytes written", lambda args, r: len(args[1])),
+        copyfile = ("write", "files copied")))
+    TreeBuilder.directive = profile.wrap("scan", TreeBuilder.directive, "directives")
+
+# ------------------------------------------------------------------------------
+# Worker processes
+# ------------------------------------------------------------------------------
+
+# The expression parser is built when ifdef.parser is imported, so each
+# forked worker inherits a ready-made parser and only the per-run options
+# need to be handed over once at startup.
+workeropts = None
+
+def initworker(opts):
+    global workeropts
+    workeropts = opts
+    # let the parent deal with ^C
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # hand newly parsed expressions back so the parent can persist them
+    if opts.exprcache is not None:
+        exprcache.new = {}
+
+def tidyworker(file):
+    result = tidyifdefs(file, workeropts)
+    if exprcache.new is not None:
+        result.newexprs = exprcache.takenew()
+    return result
 
 # ------------------------------------------------------------------------------
 # Main Entrypoint
 # ------------------------------------------------------------------------------
 if __name__ == "__main__":
-    optParser = optparse.OptionParser(usage='usage: %prog [ files ]\n\nIf no files are given then a recursive search for files ending\nwith c/cpp/mm/h is performed in the current directory.')
+    optParser = optparse.OptionParser(usage='usage: %prog [ -e macro[=value] ] [ -d macro ] [ files ]\n\n-e says a macro is always defined, and -e macro=value that it is always\ndefined as that integer; only then is its value used in comparisons and\narithmetic. -d says a macro is never defined.\n\nIf no files are given then a recursive search for files ending\nwith c/cpp/mm/h is performed in the current directory. With\n--since REV only the files that git says have changed since REV\nare looked at.')
     optParser.set_defaults()
     optParser.add_option( '-e', '--always-enabled', dest="enabled", default = [], action="append")
     optParser.add_option( '-d', '--always-disabled', dest="disabled", default = [], action="append")
     optParser.add_option( '-i', '--ignore-file', dest="ignored", default = [], action="append")
     optParser.add_option( '-u', '--dont-update-comments', dest="updatecomments", default = True, action="store_false")    
+    optParser.add_option( '-j', '--jobs', dest="jobs", default = 1, type="int")
+    optParser.add_option( '-m', '--mmap', dest="mmap", default = False, action="store_true")
+    optParser.add_option( '-s', '--stream', dest="stream", default = False, action="store_true")
+    optParser.add_option( '--solve', dest="solve", default = False, action="store_true")
+    optParser.add_option( '--since', dest="since", default = None)
+    optParser.add_option( '--diff', dest="diff", default = None)
+    optParser.add_option( '--profile', dest="profile", default = False, action="store_true")
+    optParser.add_option( '--profile-top', dest="profiletop", default = 10, type="int")
+    optParser.add_option( '--profile-json', dest="profilejson", default = None)
+    optParser.add_option( '--expr-cache', dest="exprcache", default = None)
+    optParser.add_option( '--expr-cache-size', dest="exprcachesize", default = 100000, type="int")
     (opts, args) = optParser.parse_args()
+    if opts.diff is not None and opts.stream:
+        optParser.error("--diff can't be used with --stream")
+    changed = None
+    if opts.since is not None:
+        if len(args) > 0:
+            optParser.error("files can't be given with --since")
+        try:
+            changed = changedfiles(opts.since, SOURCE_EXTENSIONS)
+        except (OSError, RuntimeError), e:
+            optParser.error(str(e))
+
+    # with --diff nothing is written back; the patch goes to the given
+    # file, or to stdout in which case progress goes to stderr
+    (patch, log) = (None, sys.stdout)
+    if opts.diff == "-":
+        (patch, log) = (sys.stdout, sys.stderr)
+    elif opts.diff is not None:
+        patch = open(opts.diff, 'w')
 
-    if len(args) == 0:
-        for (path, dirs, files) in os.walk("."):
-            for file in files:
-                if file in opts.ignored:
-                    continue
-                if any(file.endswith(x) for x in [".c", ".cpp", ".h", ".mm"]):
-                    fullpath = "%s/%s" % (path, file)
-                    tidyifdefs(fullpath, opts)
+    # what each of the given macros is known to be
+    try:
+        opts.values = macrovalues(opts.enabled, opts.disabled)
+    except ValueError:
+        optParser.error("-e takes NAME or NAME=integer")
+
+    # a single pattern matching any of the given macros as a whole
+    # identifier, used to avoid parsing files that can't possibly be
+    # affected
+    opts.prefilter = None
+    if opts.solve:
+        # a conditional can be dead because of the ones around it, whether
+        # or not any of the given macros are involved
+        conditions = Conditions()
+    elif len(opts.values) > 0:
+        opts.prefilter = re.compile(r"(?<![A-Za-z0-9_])(?:%s)(?![A-Za-z0-9_])" % "|".join(re.escape(n) for n in opts.values))
+
+    exprcache.maxsize = opts.exprcachesize
+    if opts.exprcache is not None:
+        exprcache.load(opts.exprcache, ifdef.__version__)
+
+    if opts.profile or opts.profilejson is not None:
+        startprofile()
+    started = time.time()
+
+    files = findsources(args, opts.ignored, changed)
+    pool = None
+    if opts.jobs > 1:
+        pool = multiprocessing.Pool(opts.jobs, initworker, (opts,))
+        results = pool.imap(tidyworker, files, 4)
     else:
-        for fullpath in args:
-            if file in opts.ignored:
+        results = itertools.imap(lambda file: tidyifdefs(file, opts), files)
+
+    (total, skipped, changed, removed, errors) = (0, 0, 0, 0, 0)
+    (cachehits, cachemisses, fastparses) = (0, 0, 0)
+    try:
+        for result in results:
+            total += 1
+            if result.profile is not None:
+                profile.merge(result.profile)
+                profile.addfile(result.file, result.seconds)
+            if result.skipped:
+                skipped += 1
                 continue
-            tidyifdefs(fullpath, opts)
\ No newline at end of file
+            print >>log, "Tidying ifdefs in %s" % result.file
+            if result.error is not None:
+                print >>log, " -- Failed to parse %s: %s" % (result.file, result.error)
+                errors += 1
+            if result.diff:
+                patch.write(result.diff)
+            changed += result.changed
+            removed += result.removed
+            cachehits += result.cachehits
+            cachemisses += result.cachemisses
+            fastparses += result.fastparses
+            if result.newexprs:
+                exprcache.merge(result.newexprs)
+    except KeyboardInterrupt:
+        if pool is not None:
+            pool.terminate()
+        exit(0)
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+    if patch is not None and patch is not sys.stdout:
+        patch.close()
+    if opts.exprcache is not None:
+        exprcache.save(opts.exprcache, ifdef.__version__)
+
+    print >>log, "%d files, %d skipped, %d changed, %d branches removed, %d errors" % (total, skipped, changed, removed, errors)
+    print >>log, "expression cache: %d hits, %d misses" % (cachehits, cachemisses)
+    parses = fastparses + cachehits + cachemisses
+    print >>log, "expression parser: %d of %d by fast path (%.1f%%)" % (fastparses, parses, 100.0 * fastparses / max(parses, 1))
+
+    if profile is not None:
+        wall = time.time() - started
+        for (name, n) in [("files", total), ("files skipped", skipped), ("files changed", changed), ("cache hits", cachehits), ("cache misses", cachemisses), ("fast parses", fastparses)]:
+            profile.count(name, n)
+        if opts.profile:
+            profile.report(log, wall, opts.profiletop)
+        if opts.profilejson is not None:
+            profile.dump(opts.profilejson, wall, opts.profiletop)
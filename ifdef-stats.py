@@ -29,71 +29,206 @@ import shutil
 import tempfile
 import re
 import sys
+import time
 import optparse
+import ifdef
 from ifdef.parser import *
+from ifdef.manifest import Manifest, addstats, manifestkey
+from ifdef.profile import Profile
+from ifdef.vcs import changedfiles
+from ifdef.sources import SOURCE_EXTENSIONS, issource
 
-def computestats(x, sizemap):
-    if isinstance(x, Ifdef):
-        for c in x.children:
-            computestats(c, sizemap)
-    elif isinstance(x, Branch):
-        if x.cond is not None:
-            tokens = gettokens(expr.parse((x.cond.expr))[0])
-            for t in tokens:
-                t = str(t)
-                if t not in sizemap:
-                    sizemap[t] = 0
-                if x.size is None:
-                    print "FAIL!"
-                sizemap[t] += x.size
-        for c in x.children:
-            computestats(c, sizemap) 
+# Works out, for every macro, how many lines of code it controls. Lines
+# are counted from the line numbers of the directives, so a branch spans
+# the lines between its directive and the next one of its conditional,
+# and its own lines are that span less the bodies of any conditionals
+# nested in it. A macro's direct lines are those whose innermost branch
+# depends on it; its transitive lines are all those inside any branch
+# that depends on it, each counted once however deeply it is nested.
+def branchlines(b):
+    # the lines between a branch's directive, which may take up more
+    # than one, and the next
+    return max(b.endpos - b.startpos - directivelines(b.startline), 0)
+
+def computestats(x, sizemap, enclosing=frozenset()):
+    # an elif or else is only reached when the branches before it
+    # aren't taken, so it depends on their macros too
+    tokens = frozenset()
+    for b in x.children:
+        if b.cond is not None:
+            tokens = tokens | frozenset(str(t) for t in gettokens(parseexpr(b.cond.expr)))
+        span = branchlines(b)
+        own = span
+        for c in b.children:
+            if isinstance(c, Ifdef):
+                own -= sum(branchlines(n) for n in c.children)
+                computestats(c, sizemap, enclosing | tokens)
+        for t in tokens:
+            (transitive, direct) = sizemap.get(t, (0, 0))
+            if t not in enclosing:
+                transitive += span
+            sizemap[t] = (transitive, direct + own)
 
 def stats(file, sizemap):
     print "Gathering stats for %s" % file
+    start = time.time()
     try:
         root = parsefile(file)
-        calculatesizes(root)
         computestats(root, sizemap)
     except KeyboardInterrupt:
         exit(0)
     except:
         print "-- Error with file %s:" % file
         print sys.exc_info()[1]
+        return False
+    finally:
+        if profile is not None:
+            profile.addfile(file, time.time() - start)
+    return True
+
+# current is whether the manifest is up to date for the file, when the
+# caller has already asked it (which may mean hashing the file)
+def cachedstats(file, manifest, current=None):
+    if not os.path.exists(file):
+        stats(file, {})
+        return {}
+    if current is None:
+        current = manifest.current(file)
+    if current:
+        return manifest.stats(file)
+    sizemap = {}
+    ok = stats(file, sizemap)
+    manifest.update(file, sizemap, ok)
+    return sizemap
+
+def incrementalstats(manifest):
+    # only reparse files whose fingerprint changed, then rebuild the
+    # stats of the directories they live in from the manifest
+    seen = set()
+    dirty = set()
+    for (path, dirs, files) in os.walk("."):
+        for file in files:
+            if issource(file):
+                fullpath = "%s/%s" % (path, file)
+                seen.add(manifestkey(fullpath))
+                if not manifest.current(fullpath):
+                    cachedstats(fullpath, manifest, False)
+                    dirty.add(path)
+    for file in manifest.files.keys():
+        if file not in seen:
+            manifest.remove(file)
+            dirty.add(os.path.dirname("./" + file))
+    for (path, sizemap) in sorted(manifest.dirstats(dirty).items()):
+        outfile = path + "/ifdefstats.txt"
+        if len(sizemap) == 0 and os.path.exists(outfile):
+            os.remove(outfile)
+        dumpstats(sizemap, outfile)
+
+# one "transitive direct macro" line per macro, ordered by transitive lines
+def formatstats(sizemap, reverse=False):
+    ss = sorted([(v,k) for (k,v) in sizemap.items()], reverse=reverse)
+    return ["%d %d %s" % (t, d, k) for ((t, d), k) in ss]
+
+def changedstats(files, manifest):
+    # only the directories holding files that changed need their stats
+    # redoing, from every source file still in them
+    dirs = set(os.path.dirname(file) for file in files)
+    if manifest is not None:
+        for file in files:
+            if file in manifest and not os.path.exists(file):
+                manifest.remove(file)
+    for path in sorted(dirs):
+        sizemap = {}
+        if os.path.isdir(path):
+            for file in sorted(os.listdir(path)):
+                if issource(file):
+                    fullpath = "%s/%s" % (path, file)
+                    if manifest is not None:
+                        addstats(sizemap, cachedstats(fullpath, manifest))
+                    else:
+                        stats(fullpath, sizemap)
+        outfile = path + "/ifdefstats.txt"
+        if len(sizemap) == 0 and os.path.exists(outfile):
+            os.remove(outfile)
+        dumpstats(sizemap, outfile)
 
 def dumpstats(sizemap, outfile):
     if len(sizemap) == 0:
         return
     print "Dumping stats to %s" % outfile
     out = open(outfile, 'w')
-    ss = sorted([(v,k) for (k,v) in sizemap.items()])
-    for s in ss:
-        out.write("%d %s\n" % s)
+    out.write("# transitive direct macro\n")
+    for s in formatstats(sizemap):
+        out.write(s + "\n")
     out.close()
 
 def accumulatestats(sizemap, infile):
     for line in open(infile, 'r').readlines():
         if line.startswith("#"):
             continue
-        size = int(line.split()[0])
-        token = line.split()[1]
-        if token not in sizemap:
-            sizemap[token] = size
-        else:
-            sizemap[token] += size
+        bits = line.split()
+        if len(bits) == 2:
+            # written before direct and transitive lines were told apart
+            bits = [bits[0], bits[0], bits[1]]
+        addstats(sizemap, {bits[2]: (int(bits[0]), int(bits[1]))})
+
+# Set by --profile, see startprofile
+profile = None
+
+def startprofile():
+    global profile
+    profile = Profile()
+    profile.instrument(vars(ifdef.parser), {
+        "readfile": ("read", "bytes read", lambda args, data: len(data)),
+        "parsedata": "scan",
+        "parseline": "parseline",
+        "parseexpr": ("exprparse", "expressions parsed"),
+    })
+    profile.instrument(globals(), {
+        "parseexpr": ("exprparse", "expressions parsed"),
+        "computestats": "stats",
+        "dumpstats": "write",
+    })
+    TreeBuilder.directive = profile.wrap("scan", TreeBuilder.directive, "directives")
 
 # ------------------------------------------------------------------------------
 # Main Entrypoint
 # ------------------------------------------------------------------------------
 if __name__ == "__main__":
-    optParser = optparse.OptionParser(usage='usage: %prog [ files ]\n\nIf no files are given then a recursive search for files ending\nwith c/cpp/mm/h is performed in the current directory.')
+    optParser = optparse.OptionParser(usage='usage: %prog [ files ]\n\nIf no files are given then a recursive search for files ending\nwith c/cpp/mm/h is performed in the current directory. With\n--since REV only the files that git says have changed since REV\nare looked at.')
     optParser.set_defaults()
     optParser.add_option( '-m', '--merge-stats', dest="mergestats", default=False, action="store_true")
     optParser.add_option( '-t', '--generate-ifdef-tester', dest="generatetester", default=False, action="store_true")
+    optParser.add_option( '-M', '--manifest', dest="manifest", default=None)
+    optParser.add_option( '--since', dest="since", default=None)
+    optParser.add_option( '--profile', dest="profile", default=False, action="store_true")
+    optParser.add_option( '--profile-top', dest="profiletop", default=10, type="int")
+    optParser.add_option( '--profile-json', dest="profilejson", default=None)
+    optParser.add_option( '--expr-cache', dest="exprcache", default=None)
+    optParser.add_option( '--expr-cache-size', dest="exprcachesize", default=100000, type="int")
     (opts, args) = optParser.parse_args()
+
+    if opts.profile or opts.profilejson is not None:
+        startprofile()
+    started = time.time()
+
+    exprcache.maxsize = opts.exprcachesize
+    if opts.exprcache is not None:
+        exprcache.load(opts.exprcache, ifdef.__version__)
     
     sizemap = {}
+
+    manifest = None
+    if opts.manifest is not None:
+        manifest = Manifest()
+        manifest.load(opts.manifest, ifdef.__version__)
     
+    if opts.mergestats and manifest is not None:
+        print "# merging stats from %s" % opts.manifest
+        for s in formatstats(manifest.totalstats(), True):
+            print s
+        exit(0)
+
     if opts.mergestats:
         for (path, dirs, files) in os.walk("."):
             for file in files:
@@ -101,9 +236,8 @@ if __name__ == "__main__":
                 if file == "ifdefstats.txt":
                     print "# merging stats from %s" % fullpath
                     accumulatestats(sizemap, fullpath)
-        ss = sorted([(v,k) for (k,v) in sizemap.items()], reverse=True)
-        for s in ss:
-            print "%d %s" % s
+        for s in formatstats(sizemap, True):
+            print s
         exit(0)
     
     if opts.generatetester:
@@ -127,17 +261,45 @@ if __name__ == "__main__":
             print "#endif\n"
         exit(0)
 
-    if len(args) == 0:
+    if opts.since is not None:
+        try:
+            changed = changedfiles(opts.since, SOURCE_EXTENSIONS)
+        except (OSError, RuntimeError), e:
+            optParser.error(str(e))
+        changedstats(changed, manifest)
+    elif len(args) == 0 and manifest is not None:
+        incrementalstats(manifest)
+    elif len(args) == 0:
         for (path, dirs, files) in os.walk("."):
             for file in files:
-                if any(file.endswith(x) for x in [".c", ".cpp", ".h", ".mm"]):
+                if issource(file):
                     fullpath = "%s/%s" % (path, file)
                     stats(fullpath, sizemap)
             dumpstats(sizemap, path + "/ifdefstats.txt")
             sizemap = {}
     else:
         for fullpath in args:
-            stats(fullpath, sizemap)
-        ss = sorted([(v,k) for (k,v) in sizemap.items()])
-        for s in ss:
-            print "%d %s" % s
+            if manifest is not None:
+                addstats(sizemap, cachedstats(fullpath, manifest))
+            else:
+                stats(fullpath, sizemap)
+        for s in formatstats(sizemap):
+            print s
+
+    if manifest is not None:
+        manifest.save(opts.manifest, ifdef.__version__)
+    if opts.exprcache is not None:
+        exprcache.save(opts.exprcache, ifdef.__version__)
+    print "# expression cache: %d hits, %d misses" % (exprcache.hits, exprcache.misses)
+    parses = parsecounts.fast + exprcache.hits + exprcache.misses
+    print "# expression parser: %d of %d by fast path (%.1f%%)" % (parsecounts.fast, parses, 100.0 * parsecounts.fast / max(parses, 1))
+
+    if profile is not None:
+        # stderr, so the stats themselves can still be redirected
+        wall = time.time() - started
+        for (name, n) in [("files", len(profile.files)), ("cache hits", exprcache.hits), ("cache misses", exprcache.misses), ("fast parses", parsecounts.fast)]:
+            profile.count(name, n)
+        if opts.profile:
+            profile.report(sys.stderr, wall, opts.profiletop)
+        if opts.profilejson is not None:
+            profile.dump(opts.profilejson, wall, opts.profiletop)
@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+# -*- Mode: Python; indent-tabs-mode: nil -*-
+# vi: set ts=4 sw=4 expandtab:
+#
+# The MIT License
+#
+# Copyright (c) 2011 Alexander Macdonald
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import os
+import re
+import sys
+import shlex
+import signal
+import itertools
+import multiprocessing
+import optparse
+from ifdef.parser import *
+from ifdef.sources import findsources
+
+# Each configuration is written the way the rewriter is run, a name
+# followed by its -e/-d options, e.g. "sku1 -e FOO -d BAR".
+configParser = optparse.OptionParser(usage='usage: name [ -e macro[=value] ] [ -d macro ]')
+configParser.add_option( '-e', '--always-enabled', dest="enabled", action="append")
+configParser.add_option( '-d', '--always-disabled', dest="disabled", action="append")
+
+def parseconfig(spec):
+    words = shlex.split(spec, True)
+    if len(words) == 0:
+        return None
+    # fresh lists each time, append would otherwise share the defaults
+    (copts, rest) = configParser.parse_args(words[1:], optparse.Values({"enabled": [], "disabled": []}))
+    if len(rest) > 0:
+        configParser.error("unexpected '%s' in configuration %s" % (" ".join(rest), words[0]))
+    try:
+        return (words[0], macrovalues(copts.enabled, copts.disabled))
+    except ValueError:
+        configParser.error("-e takes NAME or NAME=integer in configuration %s" % words[0])
+
+def readconfigs(file):
+    configs = []
+    for line in open(file, 'r'):
+        config = parseconfig(line)
+        if config is not None:
+            configs.append(config)
+    return configs
+
+# Walks the tree once for all configurations. sure and maybe are the
+# configurations in which the code is known to be compiled and those in
+# which it might be; lines are added up per (sure, maybe) pair, so the
+# work per piece of text doesn't depend on the number of configurations.
+def countlive(xs, sure, maybe, masks, counts):
+    for x in xs:
+        if isinstance(x, Ifdef):
+            # the configurations in which no earlier branch is (or might be) taken
+            (restsure, restmaybe) = (sure, maybe)
+            for b in x.children:
+                if b.cond is None:
+                    (t, f) = (masks.all, 0)
+                else:
+                    (t, f) = evalmasks(parseexpr(b.cond.expr), masks)
+                countlive(b.children, restsure & t, restmaybe & ~f, masks, counts)
+                restsure &= f
+                restmaybe &= ~t
+        elif isinstance(x, Branch):
+            countlive(x.children, sure, maybe, masks, counts)
+        else:
+            key = (sure, maybe)
+            counts[key] = counts.get(key, 0) + str(x).count("\n")
+
+# A header wrapped in "#ifndef X" / "#define X" ... "#endif" is only
+# ever skipped when it has already been included, so the guard says
+# nothing about a configuration; left as a condition on X, which no
+# configuration mentions, it would make the whole file undecided.
+# Returns the guard's Ifdef if the file has one: it has to be the only
+# conditional at the top level, with nothing but blanks and comments
+# around it, no else or elif, and a #define of the same macro first
+# thing inside.
+commentregex = re.compile(r'/\*.*?\*/|//[^\n]*', re.S)
+guardregex = re.compile(r'!defined\((\w+)\)$')
+
+def uncommented(text):
+    return commentregex.sub("", str(text)).strip()
+
+def includeguard(root):
+    guard = None
+    for x in root.children[0].children:
+        if isinstance(x, Ifdef):
+            if guard is not None:
+                return None
+            guard = x
+        elif uncommented(x) != "":
+            return None
+    if guard is None or len(guard.children) != 1 or guard.children[0].cond.token != "ifndef":
+        return None
+    name = guardregex.match(guard.children[0].cond.expr)
+    body = guard.children[0].children
+    if name is None or len(body) == 0 or isinstance(body[0], Ifdef):
+        return None
+    define = re.match(r'#[ \t]*define[ \t]+%s\b' % name.group(1), uncommented(body[0]))
+    return guard if define is not None else None
+
+class WhatIfResult:
+    def __init__(self, file):
+        self.file = file
+        self.counts = {}
+        self.error = None
+
+def whatif(file, masks, guards=True):
+    result = WhatIfResult(file)
+    try:
+        root = parsefile(file)
+        xs = root.children
+        guard = includeguard(root) if guards else None
+        if guard is not None:
+            # counted as a plain branch, the guarded code is taken in
+            # every configuration
+            top = root.children[0].children
+            i = top.index(guard)
+            xs = top[:i] + guard.children + top[i + 1:]
+        countlive(xs, masks.all, masks.all, masks, result.counts)
+    except KeyboardInterrupt:
+        exit(0)
+    except:
+        result.error = "%s: %s" % (sys.exc_info()[0].__name__, sys.exc_info()[1])
+    return result
+
+def report(configs, counts):
+    print "# configuration live dead undecided"
+    for (i, (name, values)) in enumerate(configs):
+        bit = 1 << i
+        (live, dead, undecided) = (0, 0, 0)
+        for ((sure, maybe), lines) in counts.items():
+            if sure & bit:
+                live += lines
+            elif maybe & bit:
+                undecided += lines
+            else:
+                dead += lines
+        print "%s %d %d %d" % (name, live, dead, undecided)
+
+# ------------------------------------------------------------------------------
+# Worker processes
+# ------------------------------------------------------------------------------
+
+workermasks = None
+workerguards = True
+
+def initworker(configs, guards):
+    global workermasks, workerguards
+    workermasks = ConfigMasks([values for (name, values) in configs])
+    workerguards = guards
+    # let the parent deal with ^C
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+def whatifworker(file):
+    return whatif(file, workermasks, workerguards)
+
+# ------------------------------------------------------------------------------
+# Main Entrypoint
+# ------------------------------------------------------------------------------
+if __name__ == "__main__":
+    optParser = optparse.OptionParser(usage='usage: %prog -c config [ -c config ... ] [ files ]\n\nReports how many lines of code each configuration compiles, after\nparsing each file only once. A configuration is a name followed by\n-e/-d options, e.g. -c "sku1 -e FOO -d BAR", and -C reads them one\nper line from a file. The include guard of a header (a leading #ifndef X\nand #define X around the whole file) counts as taken in every\nconfiguration unless --no-guards is given. If no files are given then\na recursive search for files ending with c/cpp/mm/h is performed in the\ncurrent directory.')
+    optParser.set_defaults()
+    optParser.add_option( '-c', '--config', dest="configs", default = [], action="append")
+    optParser.add_option( '-C', '--config-file', dest="configfiles", default = [], action="append")
+    optParser.add_option( '-i', '--ignore-file', dest="ignored", default = [], action="append")
+    optParser.add_option( '-j', '--jobs', dest="jobs", default = 1, type="int")
+    optParser.add_option( '--no-guards', dest="guards", default = True, action="store_false")
+    (opts, args) = optParser.parse_args()
+
+    configs = [c for c in (parseconfig(s) for s in opts.configs) if c is not None]
+    for file in opts.configfiles:
+        configs += readconfigs(file)
+    if len(configs) == 0:
+        optParser.error("no configurations given")
+
+    files = findsources(args, opts.ignored)
+    pool = None
+    if opts.jobs > 1:
+        pool = multiprocessing.Pool(opts.jobs, initworker, (configs, opts.guards))
+        results = pool.imap(whatifworker, files, 4)
+    else:
+        masks = ConfigMasks([values for (name, values) in configs])
+        results = itertools.imap(lambda file: whatif(file, masks, opts.guards), files)
+
+    counts = {}
+    (total, errors) = (0, 0)
+    try:
+        for result in results:
+            total += 1
+            print "# Evaluating %s" % result.file
+            if result.error is not None:
+                print "# -- Failed to parse %s: %s" % (result.file, result.error)
+                errors += 1
+            for (key, lines) in result.counts.items():
+                counts[key] = counts.get(key, 0) + lines
+    except KeyboardInterrupt:
+        if pool is not None:
+            pool.terminate()
+        exit(0)
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+    print "# %d files, %d configurations, %d errors" % (total, len(configs), errors)
+    report(configs, counts)
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- Mode: Python; indent-tabs-mode: nil -*-
+# vi: set ts=4 sw=4 expandtab:
+#
+# The MIT License
+#
+# Copyright (c) 2011 Alexander Macdonald
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+# Tests for the ifdef tools. Run with:
+#   python -m unittest ifdef._test.cache ifdef._test.condition ifdef._test.index ifdef._test.parser ifdef._test.rewriter ifdef._test.stats ifdef._test.whatif
+
+import os
+import sys
+import shutil
+import tempfile
+import subprocess
+import unittest
+
+# The directory holding the ifdef-*.py tools.
+toolsdir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+# A test that runs one of the tools (named by tool, eg "ifdef-index.py")
+# over files in a directory of its own, which is removed afterwards.
+class ToolTest(unittest.TestCase):
+    tool = None
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def path(self, file):
+        return os.path.join(self.dir, file)
+
+    def write(self, file, text):
+        dst = open(self.path(file), "w")
+        dst.write(text)
+        dst.close()
+
+    def read(self, file):
+        src = open(self.path(file))
+        try:
+            return src.read()
+        finally:
+            src.close()
+
+    # Runs the tool in the test's directory, returning what it printed
+    # (to stdout and stderr).
+    def runtool(self, *args):
+        run = subprocess.Popen([sys.executable, os.path.join(toolsdir, self.tool)] + list(args), cwd=self.dir,
+                               stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        return run.communicate()[0]
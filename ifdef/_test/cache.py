@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- Mode: Python; indent-tabs-mode: nil -*-
+# vi: set ts=4 sw=4 expandtab:
+#
+# The MIT License
+#
+# Copyright (c) 2011 Alexander Macdonald
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from ifdef.cache import ExprCache
+from ifdef.parser import parseexpr
+
+class ExprCacheTest(unittest.TestCase):
+    def test_lru(self):
+        cache = ExprCache(maxsize=3)
+        for key in "abc":
+            cache[key] = key.upper()
+        # a lookup makes "a" the most recently used, so "b" goes first
+        self.assertEqual(cache["a"], "A")
+        cache["d"] = "D"
+        self.assertEqual(list(cache.entries), ["c", "a", "d"])
+        # setting an existing key refreshes it without evicting anything
+        cache["c"] = "C"
+        self.assertEqual(list(cache.entries), ["a", "d", "c"])
+        cache["e"] = "E"
+        self.assertEqual(list(cache.entries), ["d", "c", "e"])
+        self.assertEqual(len(cache), 3)
+
+    def test_counters(self):
+        cache = ExprCache()
+        cache["a"] = "A"
+        cache["a"]
+        cache["a"]
+        self.assertRaises(KeyError, lambda: cache["b"])
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
+        cache.clear()
+        self.assertEqual((len(cache), cache.hits, cache.misses), (0, 0, 0))
+
+    def test_new(self):
+        cache = ExprCache()
+        cache["a"] = "A"
+        self.assertEqual(cache.takenew(), None)
+        cache["b"] = "B"
+        cache.merge({"c": "C"})
+        self.assertEqual(cache.takenew(), {"b": "B"})
+        self.assertEqual(cache.takenew(), {})
+        self.assertEqual(len(cache), 3)
+
+class ExprCacheFileTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.file = os.path.join(self.dir, "cache")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def saved(self, version):
+        cache = ExprCache()
+        cache["defined(FOO)"] = parseexpr("defined(FOO)")
+        cache["BAR"] = parseexpr("BAR")
+        cache.save(self.file, version)
+
+    def test_load(self):
+        self.saved("1.0")
+        cache = ExprCache()
+        cache.load(self.file, "1.0")
+        self.assertEqual(list(cache.entries), ["defined(FOO)", "BAR"])
+        # loaded expressions are the shared nodes the parser would give
+        self.assertTrue(cache["defined(FOO)"] is parseexpr("defined(FOO)"))
+
+    def test_version(self):
+        self.saved("1.0")
+        cache = ExprCache()
+        cache["BAZ"] = parseexpr("BAZ")
+        cache.load(self.file, "1.1")
+        self.assertEqual(list(cache.entries), ["BAZ"])
+
+    def test_missing(self):
+        cache = ExprCache()
+        cache.load(self.file, "1.0")
+        self.assertEqual(len(cache), 0)
+
+    def test_corrupt(self):
+        dst = open(self.file, "wb")
+        dst.write("not a pickle")
+        dst.close()
+        cache = ExprCache()
+        cache.load(self.file, "1.0")
+        self.assertEqual(len(cache), 0)
+        # and the next save replaces it
+        self.saved("1.0")
+        cache.load(self.file, "1.0")
+        self.assertEqual(len(cache), 2)
+
+if __name__ == "__main__":
+    unittest.main()
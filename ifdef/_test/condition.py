@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- Mode: Python; indent-tabs-mode: nil -*-
+# vi: set ts=4 sw=4 expandtab:
+#
+# The MIT License
+#
+# Copyright (c) 2011 Alexander Macdonald
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import unittest
+
+from ifdef.parser import parseexpr
+from ifdef.condition import Conditions, OpaqueExpr
+
+class ConditionsTest(unittest.TestCase):
+    def setUp(self):
+        self.conditions = Conditions()
+
+    def cond(self, text):
+        return self.conditions.expr(parseexpr(text))
+
+    def test_equivalent(self):
+        # equivalent conditions are the same node
+        self.assertEqual(self.cond("A && B"), self.cond("B && A"))
+        self.assertEqual(self.cond("!(A || B)"), self.cond("!A && !B"))
+        self.assertEqual(self.cond("defined(A) && A"), self.cond("A"))
+        self.assertNotEqual(self.cond("A"), self.cond("defined(A)"))
+
+    def test_contradiction(self):
+        c = self.conditions
+        self.assertEqual(c.conj(self.cond("defined(A)"), self.cond("!defined(A)")), c.false)
+        # a macro's value can only be non-zero if it is defined
+        self.assertEqual(c.conj(self.cond("A"), self.cond("!defined(A)")), c.false)
+        self.assertEqual(c.disj(self.cond("B"), self.cond("!B")), c.true)
+
+    def test_opaque(self):
+        c = self.conditions
+        # comparisons and literal numbers are atoms of their own
+        self.assertNotEqual(self.cond("0"), c.false)
+        self.assertNotEqual(self.cond("A > 1"), self.cond("A"))
+        self.assertEqual(self.cond("A > 1"), self.cond("A > 1"))
+        # as is text the grammar can't read, compared as written
+        prereq = c.expr(OpaqueExpr("__GNUC_PREREQ (4, 0)"))
+        self.assertEqual(prereq, c.expr(OpaqueExpr("__GNUC_PREREQ (4, 0)")))
+        self.assertNotEqual(prereq, c.expr(OpaqueExpr("__GNUC_PREREQ (4, 1)")))
+        self.assertEqual(c.conj(prereq, c.neg(prereq)), c.false)
+
+if __name__ == "__main__":
+    unittest.main()
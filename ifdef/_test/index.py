@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- Mode: Python; indent-tabs-mode: nil -*-
+# vi: set ts=4 sw=4 expandtab:
+#
+# The MIT License
+#
+# Copyright (c) 2011 Alexander Macdonald
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import os
+import unittest
+
+from ifdef._test import ToolTest
+
+class IndexTest(ToolTest):
+    tool = "ifdef-index.py"
+
+    def setUp(self):
+        ToolTest.setUp(self)
+        os.mkdir(self.path("sub"))
+        self.write("a.h", "int a;\n#ifdef FOO\nint b;\n#endif\n#if BAR\nint c;\n#endif\n")
+        self.write("sub/b.c", "#ifndef BAR\nint d;\n#endif\n")
+
+    # Runs ifdef-index.py, returning its output as a list of lines.
+    def index(self, *args):
+        return self.runtool(*args).splitlines()
+
+    def test_build(self):
+        self.assertEqual(self.index("-b"), ["Indexing ./a.h", "Indexing ./sub/b.c"])
+        self.assertEqual(self.index("-u", "BAR"), ["a.h:5-7 depth 1: BAR", "sub/b.c:1-3 depth 1: !defined(BAR)"])
+        self.assertEqual(self.index("-q", "!defined(BAR)"), ["sub/b.c:1-3 depth 1: !defined(BAR)"])
+
+    def test_bad_query(self):
+        self.index("-b")
+        self.assertEqual(self.index("-q", "FOO ||"), ["-- Query 'FOO ||' can't be parsed"])
+        self.assertEqual(self.index("-q", "1"), ["-- Query '1' names no macros"])
+
+    def test_or_query(self):
+        self.write("c.h", ("#ifdef FOO\nint e;\n#endif\n"
+                           "#ifdef BAR\nint f;\n#endif\n"
+                           "#if FOO && !defined(BAR)\nint g;\n#endif\n"
+                           "#if BAR || FOO\nint h;\n#endif\n"
+                           "#if FOO || BAZ\nint i;\n#endif\n"))
+        self.index("-b", "c.h")
+        self.assertEqual(self.index("-q", "FOO || BAR"), ["c.h:1-3 depth 1: defined(FOO)",
+                                                          "c.h:4-6 depth 1: defined(BAR)",
+                                                          "c.h:7-9 depth 1: FOO && !defined(BAR)",
+                                                          "c.h:10-12 depth 1: BAR || FOO"])
+        # and a conjunction is only the code under both
+        self.assertEqual(self.index("-q", "FOO && !BAR"), ["c.h:7-9 depth 1: FOO && !defined(BAR)"])
+
+    def test_paths(self):
+        # however a file is named, it has one entry
+        self.index("-b")
+        self.assertEqual(self.index("-b", "a.h", "sub/../a.h", "./sub/b.c"), [])
+        self.assertEqual(self.index("-u", "BAR"), ["a.h:5-7 depth 1: BAR", "sub/b.c:1-3 depth 1: !defined(BAR)"])
+
+    def test_update(self):
+        self.index("-b")
+        self.write("a.h", "#if BAR\nint c;\n#endif\n")
+        self.assertEqual(self.index("-b"), ["Indexing ./a.h"])
+        self.assertEqual(self.index("-u", "BAR"), ["a.h:1-3 depth 1: BAR", "sub/b.c:1-3 depth 1: !defined(BAR)"])
+        self.assertEqual(self.index("-u", "FOO"), [])
+
+    def test_prune(self):
+        self.index("-b")
+        os.remove(self.path("sub/b.c"))
+        # files given by name leave the rest of the index alone
+        self.index("-b", "a.h")
+        self.assertEqual(self.index("-u", "BAR"), ["a.h:5-7 depth 1: BAR", "sub/b.c:1-3 depth 1: !defined(BAR)"])
+        self.assertEqual(self.index("-b"), [])
+        self.assertEqual(self.index("-u", "BAR"), ["a.h:5-7 depth 1: BAR"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- Mode: Python; indent-tabs-mode: nil -*-
+# vi: set ts=4 sw=4 expandtab:
+#
+# The MIT License
+#
+# Copyright (c) 2011 Alexander Macdonald
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import copy
+import mmap
+import pickle
+import cPickle
+import tempfile
+import unittest
+
+from ifdef.parser import finddirectives, parsedata, parser, parsesimple, normaliseexpr, \
+    AndExpr, OrExpr, NotExpr, DefinedExpr
+
+# The directives finddirectives finds in text, with their line numbers.
+def directives(text):
+    return [(text[start:end], pos) for (start, end, pos) in finddirectives(text)]
+
+class FindDirectivesTest(unittest.TestCase):
+    def test_plain(self):
+        text = "#if FOO\nint a;\n  # else\nint b;\n#endif"
+        self.assertEqual(directives(text), [("#if FOO\n", 1), ("  # else\n", 3), ("#endif", 5)])
+
+    def test_continued_directive(self):
+        text = "#define A \\\n  1\n#if FOO \\\r\n  && BAR\n#endif\n"
+        self.assertEqual(directives(text), [("#define A \\\n  1\n", 1), ("#if FOO \\\r\n  && BAR\n", 3), ("#endif\n", 5)])
+
+    def test_continued_code(self):
+        # the '#' line carries on from the code, so is not a directive
+        self.assertEqual(directives("int a = 1; \\\n#if FOO\n#endif\n"), [("#endif\n", 3)])
+        self.assertEqual(directives("int a = 1; \\\r\n#if FOO\n#endif\n"), [("#endif\n", 3)])
+        self.assertEqual(directives("\\\n#if FOO\n#endif\n"), [("#endif\n", 3)])
+
+    def test_block_comment(self):
+        text = "int a; /* one\n#if FOO\n   two */\n#ifdef BAR\n/* three */\n#endif\n"
+        self.assertEqual(directives(text), [("#ifdef BAR\n", 4), ("#endif\n", 6)])
+
+    def test_comment_in_directive(self):
+        text = "#if FOO /* one\n#else\n */\nint a;\n#endif // two\n"
+        self.assertEqual(directives(text), [("#if FOO /* one\n#else\n */\n", 1), ("#endif // two\n", 5)])
+
+    def test_comment_before_directive(self):
+        # block comments before the '#', even ones that start on an
+        # earlier line, don't stop it starting a directive
+        text = "/* one */ #if FOO\nint a;\n/* two\n # three */ #endif\n"
+        self.assertEqual(directives(text), [("/* one */ #if FOO\n", 1), ("/* two\n # three */ #endif\n", 3)])
+        text = "int a;\n/* one\n */ /* two */ #if FOO\n#endif\n"
+        self.assertEqual(directives(text), [("/* one\n */ /* two */ #if FOO\n", 2), ("#endif\n", 4)])
+        # but anything else does
+        self.assertEqual(directives("int a; /* one */ #if FOO\n#endif\n"), [("#endif\n", 2)])
+
+    def test_comment_before_directive_tree(self):
+        # the if and its endif are matched up rather than the endif failing
+        text = "int a;\n/* one */ #if FOO\nint b;\n/* two\n */ #endif\nint c;\n"
+        root = parsedata(text, "test.c")
+        top = root.children[0].children
+        self.assertEqual(len(top), 3)
+        branch = top[1].children[0]
+        self.assertEqual(branch.cond.token, "if")
+        self.assertEqual(branch.cond.expr, "FOO")
+        self.assertEqual(str(branch.startline), "/* one */ #if FOO\n")
+        self.assertEqual(str(branch.endline), "/* two\n */ #endif\n")
+        self.assertEqual([str(child) for child in branch.children], ["int b;\n"])
+
+    def test_literals(self):
+        # comment markers in literals don't open anything
+        text = "char *a = \"/*\";\n#if FOO\nchar b = '\\'';\n#endif\n"
+        self.assertEqual(directives(text), [("#if FOO\n", 2), ("#endif\n", 4)])
+
+    def test_mmap(self):
+        text = "int a; /* one\n#if FOO\n */\n#if BAR\n#endif\n"
+        src = tempfile.TemporaryFile()
+        try:
+            src.write(text)
+            src.flush()
+            data = mmap.mmap(src.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                self.assertEqual([(data[start:end], pos) for (start, end, pos) in finddirectives(data)], directives(text))
+            finally:
+                data.close()
+        finally:
+            src.close()
+
+class ParseSimpleTest(unittest.TestCase):
+    # What the lepl grammar makes of text.
+    def slow(self, text):
+        return parser(normaliseexpr(text))[0]
+
+    def test_same(self):
+        # the fast path gives the very node the grammar does
+        for text in ["defined X", "defined(X)", "defined ( X )", "!defined(X)", "! defined X",
+                     "!X", "X", "  _x1  ", "defined", "0", "42", "!0"]:
+            self.assertTrue(parsesimple(text) is self.slow(text), text)
+
+    def test_fall_through(self):
+        # anything more is left to the grammar
+        for text in ["A && B", "defined(X) || Y", "!(X)", "X == 1", "X(1)"]:
+            self.assertEqual(parsesimple(text), None, text)
+
+class ASTNodeTest(unittest.TestCase):
+    def test_shared(self):
+        a = AndExpr([DefinedExpr(["X"]), NotExpr(["Y"])])
+        self.assertTrue(a is AndExpr([DefinedExpr(["X"]), NotExpr(["Y"])]))
+        # the type and the types of the arguments tell nodes apart
+        self.assertFalse(OrExpr(a.args) is a)
+        self.assertFalse(NotExpr([1]) is NotExpr([True]))
+
+    def test_copy(self):
+        a = OrExpr([DefinedExpr(["X"]), AndExpr(["Y", 1])])
+        for other in [copy.copy(a), copy.deepcopy(a), pickle.loads(pickle.dumps(a)),
+                      cPickle.loads(cPickle.dumps(a, cPickle.HIGHEST_PROTOCOL))]:
+            self.assertTrue(other is a)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+# -*- Mode: Python; indent-tabs-mode: nil -*-
+# vi: set ts=4 sw=4 expandtab:
+#
+# The MIT License
+#
+# Copyright (c) 2011 Alexander Macdonald
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import re
+import unittest
+
+from ifdef._test import ToolTest
+
+# Applies a unified diff of a single file to text. Like the rewriter,
+# only "\n" ends a line.
+def applydiff(text, patch):
+    lines = re.compile(r"[^\n]*\n|[^\n]+")
+    old = lines.findall(text)
+    new = []
+    pos = 0
+    for line in lines.findall(patch)[2:]:
+        if line.startswith("@@"):
+            (start, length) = re.match(r"@@ -(\d+)(?:,(\d+))?", line).groups()
+            start = int(start) - (length != "0")
+            new.extend(old[pos:start])
+            pos = start
+        elif line.startswith(" "):
+            new.append(old[pos])
+            pos += 1
+        elif line.startswith("-"):
+            pos += 1
+        elif line.startswith("+"):
+            new.append(line[1:])
+        elif line.startswith("\\") and last.startswith("+"):
+            new[-1] = new[-1][:-1]
+        last = line
+    return "".join(new + old[pos:])
+
+class RewriterTest(ToolTest):
+    tool = "ifdef-rewriter.py"
+
+    # Runs ifdef-rewriter.py over a single file holding text, returning
+    # the file's contents afterwards and whether the run reported an error.
+    def rewrite(self, text, *args):
+        self.write("t.h", text)
+        output = self.runtool(*(args + ("t.h",)))
+        return (self.read("t.h"), "1 errors" in output)
+
+    # The patch ifdef-rewriter.py --diff gives for a single file holding text.
+    def rewritediff(self, text, *args):
+        self.write("t.h", text)
+        self.runtool(*(("--diff", "t.diff") + args + ("t.h",)))
+        return self.read("t.diff")
+
+class DiffTest(RewriterTest):
+    def check(self, text, *args):
+        patch = self.rewritediff(text, *args)
+        self.assertNotEqual(patch, "")
+        self.assertEqual(applydiff(text, patch), self.rewrite(text, *args)[0])
+
+    def test_plain(self):
+        self.check("int a;\n#ifdef FOO\nint b;\n#else\nint c;\n#endif\nint d;\n", "-e", "FOO")
+
+    def test_bare_cr(self):
+        # a bare "\r" doesn't end a line, so doesn't move the patch
+        self.check("int a; /* old\rmac */\nint b;\n#ifdef FOO\nint c;\n#else\nint d;\n#endif\nint e;\n", "-e", "FOO")
+
+    def test_no_newline(self):
+        self.check("int a;\n#ifdef FOO\nint b;\n#endif", "-d", "FOO")
+
+class ValuesTest(RewriterTest):
+    text = ("#if __GNUC__ >= 4\nmodern();\n#else\nold();\n#endif\n"
+            "#if VERSION == 2\nv2();\n#endif\n"
+            "#if defined(VERSION) && FOO\nx();\n#endif\n")
+
+    def test_defined(self):
+        # -e only says a macro is defined, not what it is
+        expected = self.text.replace("defined(VERSION) && ", "")
+        self.assertEqual(self.rewrite(self.text, "-e", "__GNUC__", "-e", "VERSION"), (expected, False))
+        self.assertEqual(self.rewrite(self.text, "-e", "VERSION", "--solve"), (expected, False))
+
+    def test_value(self):
+        self.assertEqual(self.rewrite(self.text, "-e", "__GNUC__=3", "-e", "VERSION=2"),
+                         ("old();\nv2();\n#if FOO\nx();\n#endif\n", False))
+
+class PrefilterTest(RewriterTest):
+    def test_skipped(self):
+        self.write("a.h", "#ifdef FOO\nint a;\n#endif\n")
+        self.write("b.h", "#ifdef BAR\nint b;\n#endif\n")
+        self.write("c.c", "int c;\n")
+        output = self.runtool("-e", "FOO", "a.h", "b.h", "c.c")
+        self.assertTrue("3 files, 2 skipped, 1 changed" in output)
+        self.assertEqual(self.read("a.h"), "int a;\n")
+        self.assertEqual(self.read("b.h"), "#ifdef BAR\nint b;\n#endif\n")
+
+    def test_substring(self):
+        # FOO inside a longer identifier is neither the macro nor a reason
+        # to skip a file that uses the macro too
+        text = "#ifdef FOO_BAR\nint a;\n#endif\n#if XFOO\nint b;\n#endif\n"
+        self.assertEqual(self.rewrite(text, "-e", "FOO"), (text, False))
+        self.assertTrue("1 files, 1 skipped, 0 changed" in self.runtool("-e", "FOO", "t.h"))
+        self.assertEqual(self.rewrite(text + "#ifndef FOO\nint c;\n#endif\n", "-e", "FOO"), (text, False))
+        self.assertEqual(self.rewrite("int FOOD;\n#if defined(FOO)\nint a;\n#endif\n", "-d", "FO", "-d", "FOO"),
+                         ("int FOOD;\n", False))
+
+class SolveTest(RewriterTest):
+    def check(self, text, expected, *args):
+        self.assertEqual(self.rewrite(text, "--solve", *args), (expected, False))
+
+    def test_contradiction(self):
+        # the inner #ifndef can't hold inside the #ifdef
+        self.check("#ifdef A\n#ifndef A\nint x;\n#else\nint y;\n#endif\n#endif\n",
+                   "#ifdef A\nint y;\n#endif // ifdef A\n")
+        self.check("#if defined(A) && B\n#if !defined(A)\nint x;\n#elif B\nint y;\n#else\nint z;\n#endif\n#endif\n",
+                   "#if defined(A) && B\nint y;\n#endif // defined(A) && B\n")
+
+    def test_elif(self):
+        text = "#if FOO\nint a;\n#elif BAR\nint b;\n#elif BAZ\nint c;\n#else\nint d;\n#endif\n"
+        # a false first branch makes the next the #if
+        self.check(text, "#if BAR\nint b;\n#elif BAZ\nint c;\n#else\nint d;\n#endif\n", "-d", "FOO")
+        # and a true one is all that's left
+        self.check(text, "int b;\n", "-d", "FOO", "-e", "BAR=1")
+
+    def test_elif_else(self):
+        # a true #elif becomes the #else and ends the chain
+        self.check("#if BAZ\nint a;\n#elif FOO\nint b;\n#elif BAR\nint c;\n#else\nint d;\n#endif\n",
+                   "#if BAZ\nint a;\n#else\nint c;\n#endif\n", "-d", "FOO", "-e", "BAR=1")
+
+    def test_unparsed(self):
+        # conditions the grammar can't read are copied through, and don't
+        # stop the rest of the file being solved
+        prereq = "#if __GNUC_PREREQ (4, 0)\nint g;\n#endif\n"
+        self.check(prereq + "#ifdef FOO\nint a;\n#else\nint b;\n#endif\n", prereq + "int a;\n", "-e", "FOO")
+        self.check("#ifdef A\n#if __GNUC_PREREQ (4, 0)\nint g;\n#elif FOO\nint a;\n#endif\n#endif\n",
+                   "#ifdef A\n#if __GNUC_PREREQ (4, 0)\nint g;\n#endif\n#endif\n", "-d", "FOO")
+        # but the same text is the same condition
+        self.check("#if __GNUC_PREREQ (4, 0)\n#if __GNUC_PREREQ (4, 0)\nint g;\n#else\nint h;\n#endif\n#endif\n",
+                   "#if __GNUC_PREREQ (4, 0)\nint g;\n#endif\n", "-d", "FOO")
+
+class UnmatchedTest(RewriterTest):
+    def check(self, token):
+        text = "int a;\n#%s\nint b;\n#ifdef FOO\nint c;\n#endif\n" % token
+        tree = self.rewrite(text, "-e", "FOO")
+        stream = self.rewrite(text, "-e", "FOO", "--stream")
+        # both fail the file and leave it alone
+        self.assertEqual(tree, (text, True))
+        self.assertEqual(stream, tree)
+
+    def test_endif(self):
+        self.check("endif")
+
+    def test_else(self):
+        self.check("else")
+
+    def test_elif(self):
+        self.check("elif FOO")
+
+    def test_matched(self):
+        # conditionals that are left alone still have to be matched up
+        other = "#ifdef OTHER\nint x;\n#else\nint y;\n#endif\n"
+        text = other + "int a;\n#ifdef FOO\nint b;\n#else\nint c;\n#endif\n" + other
+        expected = (other + "int a;\nint b;\n" + other, False)
+        self.assertEqual(self.rewrite(text, "-e", "FOO"), expected)
+        self.assertEqual(self.rewrite(text, "-e", "FOO", "--stream"), expected)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# -*- Mode: Python; indent-tabs-mode: nil -*-
+# vi: set ts=4 sw=4 expandtab:
+#
+# The MIT License
+#
+# Copyright (c) 2011 Alexander Macdonald
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import os
+import subprocess
+import unittest
+import cPickle as pickle
+
+from ifdef._test import ToolTest
+
+class StatsTest(ToolTest):
+    tool = "ifdef-stats.py"
+
+    # Runs ifdef-stats.py over a single file holding text, returning the
+    # (transitive, direct) lines of each macro.
+    def stats(self, text):
+        self.write("t.h", text)
+        self.runtool()
+        result = {}
+        for line in self.read("ifdefstats.txt").splitlines():
+            if not line.startswith("#"):
+                (transitive, direct, macro) = line.split()
+                result[macro] = (int(transitive), int(direct))
+        return result
+
+    def test_flat(self):
+        self.assertEqual(self.stats("#ifdef A\nint a;\nint b;\n#endif\n"), {"A": (2, 2)})
+
+    def test_nested(self):
+        # A's direct lines are those not in the inner conditional (whose
+        # directives count as A's); an #elif or #else depends on the
+        # macros of the branches before it too
+        text = ("#ifdef A\n"        # 1
+                "int a;\n"
+                "#if B\n"           # 3
+                "int b;\n"
+                "#elif C\n"         # 5
+                "int c;\n"
+                "int c2;\n"
+                "#else\n"           # 8
+                "int d;\n"
+                "#endif\n"          # 10
+                "int e;\n"
+                "#endif\n")         # 12
+        self.assertEqual(self.stats(text), {"A": (10, 6), "B": (4, 4), "C": (3, 3)})
+
+    def test_repeated(self):
+        # a macro used again inside a branch that already depends on it
+        # has those lines as direct ones, but only counts them once as
+        # transitive ones
+        text = ("#ifdef A\n"        # 1
+                "int a;\n"
+                "#if B\n"           # 3
+                "int b;\n"
+                "#elif C\n"         # 5
+                "int c;\n"
+                "int c2;\n"
+                "#else\n"           # 8
+                "#if A && D\n"      # 9
+                "int d;\n"
+                "#endif\n"          # 11
+                "#endif\n"          # 12
+                "int e;\n"
+                "#endif\n")         # 14
+        self.assertEqual(self.stats(text), {"A": (12, 7), "B": (6, 5), "C": (5, 4), "D": (1, 1)})
+
+class IncrementalTest(ToolTest):
+    tool = "ifdef-stats.py"
+
+    def setUp(self):
+        ToolTest.setUp(self)
+        os.mkdir(self.path("sub"))
+        self.write("a.h", "#ifdef A\nint a;\n#endif\n")
+        self.write("sub/b.h", "#ifdef B\nint b;\nint c;\n#endif\n")
+
+    # Runs ifdef-stats.py with a manifest, returning the files it parsed
+    # and the stats it left in each directory.
+    def stats(self, *args):
+        output = self.runtool("-M", "manifest", *args)
+        parsed = [line.split()[-1] for line in output.splitlines() if line.startswith("Gathering stats for")]
+        result = {}
+        for dir in [".", "sub"]:
+            if os.path.exists(self.path(dir + "/ifdefstats.txt")):
+                result[dir] = [line for line in self.read(dir + "/ifdefstats.txt").splitlines() if not line.startswith("#")]
+        return (sorted(parsed), result)
+
+    def test_unchanged(self):
+        first = self.stats()
+        self.assertEqual(first, (["./a.h", "./sub/b.h"], {".": ["1 1 A"], "sub": ["2 2 B"]}))
+        self.assertEqual(self.stats(), ([], first[1]))
+
+    def test_edited(self):
+        self.stats()
+        # the same size, so only the contents tell
+        self.write("a.h", "#ifdef C\nint a;\n#endif\n")
+        os.utime(self.path("a.h"), (1, 1))
+        self.assertEqual(self.stats(), (["./a.h"], {".": ["1 1 C"], "sub": ["2 2 B"]}))
+        # and touching it without a change is not one
+        os.utime(self.path("a.h"), (2, 2))
+        self.assertEqual(self.stats(), ([], {".": ["1 1 C"], "sub": ["2 2 B"]}))
+
+    def test_deleted(self):
+        self.stats()
+        os.remove(self.path("sub/b.h"))
+        self.assertEqual(self.stats(), ([], {".": ["1 1 A"]}))
+
+    def test_version(self):
+        self.stats()
+        # a manifest written by another version is started again
+        src = open(self.path("manifest"), "rb")
+        (version, files) = pickle.load(src)
+        src.close()
+        dst = open(self.path("manifest"), "wb")
+        pickle.dump(("0.0", files), dst)
+        dst.close()
+        self.assertEqual(self.stats()[0], ["./a.h", "./sub/b.h"])
+        # as is one that can't be read
+        self.write("manifest", "garbage")
+        self.assertEqual(self.stats()[0], ["./a.h", "./sub/b.h"])
+
+    def test_since(self):
+        git = ["git", "-c", "user.name=test", "-c", "user.email=test@example.com"]
+        for args in [["init", "-q"], ["add", "."], ["commit", "-q", "-m", "start"]]:
+            subprocess.check_call(git + args, cwd=self.dir)
+        self.stats()
+        self.write("sub/c.h", "#ifdef B\nint d;\n#endif\n")
+        # only the new file is parsed, and only its directory redone
+        self.assertEqual(self.stats("--since", "HEAD"), (["./sub/c.h"], {".": ["1 1 A"], "sub": ["3 3 B"]}))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- Mode: Python; indent-tabs-mode: nil -*-
+# vi: set ts=4 sw=4 expandtab:
+#
+# The MIT License
+#
+# Copyright (c) 2011 Alexander Macdonald
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import unittest
+
+from ifdef.parser import parseexpr, evalmasks, macrovalues, ConfigMasks
+from ifdef._test import ToolTest
+
+class EvalMasksTest(unittest.TestCase):
+    def setUp(self):
+        # one bit per configuration: A and B 1, A 1 and B off, A off,
+        # nothing known, and A defined as something unknown with B 0
+        self.masks = ConfigMasks([macrovalues(["A=1", "B=1"], []), macrovalues(["A=1"], ["B"]),
+                                  macrovalues([], ["A"]), {}, macrovalues(["A", "B=0"], [])])
+
+    # The configurations in which text is true and those in which it is
+    # false, as bits.
+    def eval(self, text):
+        return evalmasks(parseexpr(text), self.masks)
+
+    def test_logical(self):
+        self.assertEqual(self.eval("A && B"), (0b00001, 0b10110))
+        self.assertEqual(self.eval("A || B"), (0b00011, 0b00000))
+        self.assertEqual(self.eval("!A"), (0b00100, 0b00011))
+        self.assertEqual(self.eval("B || !A"), (0b00101, 0b00010))
+
+    def test_defined(self):
+        self.assertEqual(self.eval("defined(A)"), (0b10011, 0b00100))
+        self.assertEqual(self.eval("!defined(B)"), (0b00010, 0b10001))
+        # nothing says whether C is defined
+        self.assertEqual(self.eval("defined(C)"), (0, 0))
+        self.assertEqual(self.eval("defined(C) || defined(A)"), (0b10011, 0b00000))
+
+    def test_opaque(self):
+        # comparisons are worked out for each set of values taken, and an
+        # undefined macro compares as 0; one that is only known to be
+        # defined decides nothing
+        self.assertEqual(self.eval("A == 1"), (0b00011, 0b00100))
+        self.assertEqual(self.eval("A + 1 == 2"), (0b00011, 0b00100))
+        self.assertEqual(self.eval("A > 1"), (0, 0b00111))
+        self.assertEqual(self.eval("C > 1"), (0, 0))
+
+class WhatIfTest(ToolTest):
+    tool = "ifdef-whatif.py"
+
+    def setUp(self):
+        ToolTest.setUp(self)
+        self.write("a.c", ("int a;\n"
+                           "#ifdef FOO\n"
+                           "int b;\n"
+                           "int c;\n"
+                           "#else\n"
+                           "int d;\n"
+                           "#endif\n"
+                           "#if BAR\n"
+                           "int e;\n"
+                           "#endif\n"))
+        self.write("b.h", ("/* guarded */\n"
+                           "#ifndef B_H\n"
+                           "#define B_H\n"
+                           "#if FOO && BAZ\n"
+                           "int f;\n"
+                           "#endif\n"
+                           "#endif\n"))
+
+    # Runs ifdef-whatif.py in the test's directory, returning the live,
+    # dead and undecided lines of each configuration.
+    def whatif(self, *args):
+        result = {}
+        for line in self.runtool("-c", "on -e FOO -d BAR", "-c", "off -d FOO -e BAR=1", *args).splitlines():
+            if not line.startswith("#"):
+                (name, live, dead, undecided) = line.split()
+                result[name] = (int(live), int(dead), int(undecided))
+        return result
+
+    def test_serial(self):
+        # "int f;" depends on BAZ with FOO on and is dead with it off
+        self.assertEqual(self.whatif(), {"on": (5, 2, 1), "off": (5, 3, 0)})
+
+    def test_jobs(self):
+        self.assertEqual(self.whatif("-j", "2"), self.whatif())
+
+    def test_guards(self):
+        # the guard is an ordinary condition on B_H, which neither
+        # configuration mentions, so its #define is undecided
+        self.assertEqual(self.whatif("--no-guards"), {"on": (4, 2, 2), "off": (4, 3, 1)})
+        # and so it is when there is code after it
+        self.write("b.h", "#ifndef B_H\n#define B_H\n#endif\nint g;\n")
+        self.assertEqual(self.whatif(), {"on": (4, 2, 1), "off": (4, 2, 1)})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- Mode: Python; indent-tabs-mode: nil -*-
+# vi: set ts=4 sw=4 expandtab:
+#
+# The MIT License
+#
+# Copyright (c) 2011 Alexander Macdonald
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import os
+import cPickle as pickle
+from collections import OrderedDict
+
+# ------------------------------------------------------------------------------
+# Expression cache
+# ------------------------------------------------------------------------------
+
+# An LRU map from normalised expression text to parsed expression. The
+# same handful of conditions turn up over and over across a tree, so this
+# saves going back to lepl for every directive. The contents can be saved
+# to disk between runs; a saved cache is only reused by the tool version
+# that wrote it.
+class ExprCache:
+    def __init__(self, maxsize=100000):
+        self.entries = OrderedDict()
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        # entries added since the last takenew(), if anyone is asking
+        self.new = None
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __getitem__(self, key):
+        try:
+            value = self.entries.pop(key)
+        except KeyError:
+            self.misses += 1
+            raise
+        self.entries[key] = value
+        self.hits += 1
+        return value
+
+    def __setitem__(self, key, value):
+        self.add(key, value)
+        if self.new is not None:
+            self.new[key] = value
+
+    def add(self, key, value):
+        if key in self.entries:
+            del self.entries[key]
+        elif len(self.entries) >= self.maxsize:
+            self.entries.popitem(last=False)
+        self.entries[key] = value
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def merge(self, entries):
+        for (key, value) in entries.items():
+            self.add(key, value)
+
+    def takenew(self):
+        new = self.new
+        self.new = {}
+        return new
+
+    def load(self, file, version):
+        if not os.path.exists(file):
+            return
+        try:
+            src = open(file, 'rb')
+            try:
+                (v, entries) = pickle.load(src)
+            finally:
+                src.close()
+        except Exception:
+            # a corrupt cache is thrown away
+            return
+        if v != version:
+            return
+        for (key, value) in entries:
+            self.add(key, value)
+
+    def save(self, file, version):
+        dst = open(file, 'wb')
+        pickle.dump((version, self.entries.items()), dst, pickle.HIGHEST_PROTOCOL)
+        dst.close()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# -*- Mode: Python; indent-tabs-mode: nil -*-
+# vi: set ts=4 sw=4 expandtab:
+#
+# The MIT License
+#
+# Copyright (c) 2011 Alexander Macdonald
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from ifdef.parser import *
+
+# ------------------------------------------------------------------------------
+# Condition engine
+# ------------------------------------------------------------------------------
+
+# An #if condition the expression grammar can't read (such as a call of a
+# function-like macro), kept as its text. It is an opaque atom like any
+# other and prints as it was written.
+class OpaqueExpr(object):
+    __slots__ = ('text',)
+
+    def __init__(self, text):
+        self.text = text
+
+    def __eq__(self, other):
+        return type(other) is OpaqueExpr and other.text == self.text
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.text)
+
+    def __str__(self):
+        return self.text
+
+# Conditions are kept as reduced ordered binary decision diagrams, so two
+# conditions are equivalent exactly when they are the same node, and a
+# condition can never be true exactly when it is the false node. Nodes are
+# ints indexing a table of (variable, low, high) triples; 0 and 1 are the
+# false and true leaves. Variables are numbered in the order their atoms
+# are first seen.
+#
+# The atoms are defined(X) for each macro X, the value of each macro used
+# as a number (which can only be non-zero if the macro is defined), and
+# anything else, such as comparisons and literal numbers, as an opaque
+# atom of its own. Literal numbers are left opaque on purpose: #if 0 is a
+# common way of commenting code out, not a condition to be simplified.
+class Conditions:
+    def __init__(self):
+        self.false = 0
+        self.true = 1
+        self.nodes = [None, None]
+        self.unique = {}
+        self.atoms = {}
+        self.andcache = {}
+        self.notcache = {}
+        self.exprcache = {}
+
+    def node(self, var, low, high):
+        if low == high:
+            return low
+        key = (var, low, high)
+        n = self.unique.get(key)
+        if n is None:
+            n = self.unique[key] = len(self.nodes)
+            self.nodes.append(key)
+        return n
+
+    def atom(self, atom):
+        var = self.atoms.get(atom)
+        if var is None:
+            var = self.atoms[atom] = len(self.atoms)
+        return self.node(var, self.false, self.true)
+
+    def conj(self, a, b):
+        if a == self.false or b == self.false:
+            return self.false
+        elif a == self.true or a == b:
+            return b
+        elif b == self.true:
+            return a
+        key = (a, b) if a < b else (b, a)
+        n = self.andcache.get(key)
+        if n is None:
+            (va, la, ha) = self.nodes[a]
+            (vb, lb, hb) = self.nodes[b]
+            if va == vb:
+                n = self.node(va, self.conj(la, lb), self.conj(ha, hb))
+            elif va < vb:
+                n = self.node(va, self.conj(la, b), self.conj(ha, b))
+            else:
+                n = self.node(vb, self.conj(a, lb), self.conj(a, hb))
+            self.andcache[key] = n
+        return n
+
+    def neg(self, a):
+        if a <= self.true:
+            return 1 - a
+        n = self.notcache.get(a)
+        if n is None:
+            (v, l, h) = self.nodes[a]
+            n = self.notcache[a] = self.node(v, self.neg(l), self.neg(h))
+            self.notcache[n] = a
+        return n
+
+    def disj(self, a, b):
+        return self.neg(self.conj(self.neg(a), self.neg(b)))
+
+    # Turns a parsed (and possibly partly evaluated) expression into a
+    # condition.
+    def expr(self, e):
+        key = (type(e), e)
+        n = self.exprcache.get(key)
+        if n is None:
+            n = self.exprcache[key] = self.build(e)
+        return n
+
+    def build(self, e):
+        if e is True:
+            return self.true
+        elif e is False or e is None:
+            return self.false
+        elif isinstance(e, AndExpr):
+            return self.conj(self.expr(e.args[0]), self.expr(e.args[1]))
+        elif isinstance(e, OrExpr):
+            return self.disj(self.expr(e.args[0]), self.expr(e.args[1]))
+        elif isinstance(e, NotExpr):
+            return self.neg(self.expr(e.args[0]))
+        elif isinstance(e, DefinedExpr) and isinstance(e.args[0], basestring):
+            return self.atom(("defined", e.args[0]))
+        elif isinstance(e, basestring):
+            return self.conj(self.atom(("defined", e)), self.atom(("value", e)))
+        return self.atom(("opaque", type(e), e))
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- Mode: Python; indent-tabs-mode: nil -*-
+# vi: set ts=4 sw=4 expandtab:
+#
+# The MIT License
+#
+# Copyright (c) 2011 Alexander Macdonald
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import os
+import hashlib
+import cPickle as pickle
+
+# ------------------------------------------------------------------------------
+# Per-file stats manifest
+# ------------------------------------------------------------------------------
+
+def hashfile(file):
+    h = hashlib.sha1()
+    src = open(file, 'rb')
+    while True:
+        block = src.read(1 << 16)
+        if not block:
+            break
+        h.update(block)
+    src.close()
+    return h.hexdigest()
+
+# Stats map each macro to a (transitive, direct) pair of line counts.
+def addstats(total, stats):
+    for (k, (transitive, direct)) in stats.items():
+        (t, d) = total.get(k, (0, 0))
+        total[k] = (t + transitive, d + direct)
+
+class FileEntry:
+    def __init__(self, mtime, size, hash, stats, ok):
+        self.mtime = mtime
+        self.size = size
+        self.hash = hash
+        self.stats = stats
+        self.ok = ok
+
+# Files are recorded under their path relative to the working directory, so
+# that "foo.h", "./foo.h" and "sub/../foo.h" all share one entry.
+def manifestkey(file):
+    return os.path.normpath(os.path.relpath(file))
+
+# Remembers the per-macro stats of every source file along with enough of a
+# fingerprint (mtime, size and content hash) to tell whether the file needs
+# to be looked at again. Files that failed to parse are always redone.
+class Manifest:
+    def __init__(self):
+        self.files = {}
+
+    def __len__(self):
+        return len(self.files)
+
+    def __contains__(self, file):
+        return manifestkey(file) in self.files
+
+    def stats(self, file):
+        return self.files[manifestkey(file)].stats
+
+    def current(self, file):
+        entry = self.files.get(manifestkey(file))
+        if entry is None or not entry.ok:
+            return False
+        st = os.stat(file)
+        if st.st_size != entry.size:
+            return False
+        if st.st_mtime == entry.mtime:
+            return True
+        # touched but possibly not modified
+        if hashfile(file) != entry.hash:
+            return False
+        entry.mtime = st.st_mtime
+        return True
+
+    def update(self, file, stats, ok):
+        st = os.stat(file)
+        self.files[manifestkey(file)] = FileEntry(st.st_mtime, st.st_size, hashfile(file), stats, ok)
+
+    def remove(self, file):
+        del self.files[manifestkey(file)]
+
+    def dirstats(self, dirs):
+        # total up the stats of the files directly inside each of dirs
+        totals = dict((d, {}) for d in dirs)
+        bykey = dict((manifestkey(d), sizemap) for (d, sizemap) in totals.items())
+        for (file, entry) in self.files.items():
+            sizemap = bykey.get(os.path.dirname(file) or ".")
+            if sizemap is not None:
+                addstats(sizemap, entry.stats)
+        return totals
+
+    def totalstats(self):
+        sizemap = {}
+        for entry in self.files.values():
+            addstats(sizemap, entry.stats)
+        return sizemap
+
+    def load(self, file, version):
+        if not os.path.exists(file):
+            return
+        try:
+            src = open(file, 'rb')
+            try:
+                (v, files) = pickle.load(src)
+            finally:
+                src.close()
+        except Exception:
+            # a corrupt manifest is thrown away
+            return
+        if v == version:
+            self.files = files
+
+    def save(self, file, version):
+        dst = open(file, 'wb')
+        pickle.dump((version, self.files), dst, pickle.HIGHEST_PROTOCOL)
+        dst.close()
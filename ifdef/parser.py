@@ -28,30 +28,54 @@ import os
 import shutil
 import tempfile
 import re
+import mmap
+import weakref
 import optparse
 from lepl import *
+from ifdef.cache import ExprCache
 
 # ------------------------------------------------------------------------------
 # Expression parser
 # ------------------------------------------------------------------------------
 
+# Expression nodes are immutable and hash-consed: constructing a node that
+# is structurally identical to one that is still alive hands back the
+# existing object, so repeated sub-expressions within a file (and across
+# files handled by the same process) are shared, and nodes can be compared
+# and used as keys by identity. Identifier strings are interned.
+astnodes = weakref.WeakValueDictionary()
+
 class ASTNode(object):
-    def __init__(self, pr):
-        self.args = pr
-class ExprNode(ASTNode): pass
-class AndExpr(ExprNode): pass
-class OrExpr(ExprNode):  pass
-class NotExpr(ExprNode): pass
-class ArithExpr(ExprNode): pass
-class EqExpr(ArithExpr): pass
-class AddExpr(ArithExpr): pass
-class NotEqExpr(ArithExpr): pass
-class GtEqExpr(ArithExpr): pass
-class LtEqExpr(ArithExpr): pass
-class GtExpr(ArithExpr): pass
-class LtExpr(ArithExpr): pass
-class DefinedValue(ASTNode): pass
-class DefinedExpr(ASTNode): pass
+    __slots__ = ('args', '__weakref__')
+
+    def __new__(cls, pr):
+        args = tuple(intern(a) if type(a) is str else a for a in pr)
+        # include the types so that, say, 1 and True aren't conflated
+        key = (cls, args, tuple(type(a) for a in args))
+        node = astnodes.get(key)
+        if node is None:
+            node = object.__new__(cls)
+            node.args = args
+            astnodes[key] = node
+        return node
+
+    def __reduce__(self):
+        return (self.__class__, (self.args,))
+
+class ExprNode(ASTNode): __slots__ = ()
+class AndExpr(ExprNode): __slots__ = ()
+class OrExpr(ExprNode):  __slots__ = ()
+class NotExpr(ExprNode): __slots__ = ()
+class ArithExpr(ExprNode): __slots__ = ()
+class EqExpr(ArithExpr): __slots__ = ()
+class AddExpr(ArithExpr): __slots__ = ()
+class NotEqExpr(ArithExpr): __slots__ = ()
+class GtEqExpr(ArithExpr): __slots__ = ()
+class LtEqExpr(ArithExpr): __slots__ = ()
+class GtExpr(ArithExpr): __slots__ = ()
+class LtExpr(ArithExpr): __slots__ = ()
+class DefinedValue(ASTNode): __slots__ = ()
+class DefinedExpr(ASTNode): __slots__ = ()
 
 expr = Delayed()
 basicexpr = Delayed()
@@ -59,7 +83,8 @@ bracketedexpr = Drop(Token("\(")) & expr & Drop(Token("\)"))
 number = Token("[0-9]+") >> int
 hexnumber = Token("0x[a-zA-Z0-9]+") >> str
 strlit = Token("'.*'") >> str
-ident = Token("[a-zA-Z_]+[a-zA-Z0-9_]*")
+# identifiers come back from lepl as unicode, which can't be interned
+ident = Token("[a-zA-Z_]+[a-zA-Z0-9_]*") >> (lambda s: intern(str(s)))
 definedexpr = Drop(Token("defined")) & (ident | (Drop(Token("\(")) & ident & Drop(Token("\)")))) > DefinedExpr
 notexpr = Drop(Token("!")) & basicexpr > NotExpr
 basicexpr += definedexpr | ident | strlit | hexnumber | number | notexpr | bracketedexpr
@@ -84,42 +109,115 @@ group3 += orexpr | group2
 
 expr += group3
 expr.config.no_direct_eval()
-expr.config.left_memoize()
+# The memo tables otherwise keep every result of every parse for the life
+# of the process. A bounded table keeps memory (and lookups) flat.
+expr.config.left_memoize(MemoTable(4096))
+
+# Compiling the lexer is most of the cost of building the parser, which
+# every process pays on import. If IFDEF_PARSER_CACHE names a directory
+# the compiled lexer is kept there and loaded by later runs instead.
+if os.environ.get("IFDEF_PARSER_CACHE"):
+    expr.config.lexer(cache=os.environ["IFDEF_PARSER_CACHE"])
 
 #print "tokens: %s" % find_tokens(expr)
 parser = expr.get_parse()
 
-def printexpr(r, addBrackets=False):
-    if isinstance(r, OrExpr):
-        r = printexpr(r.args[0], not isinstance(r.args[0], OrExpr)) + " || " + printexpr(r.args[1], not isinstance(r.args[1], OrExpr))
-    elif isinstance(r, AndExpr):
-        r = printexpr(r.args[0], not isinstance(r.args[0], AndExpr)) + " && " + printexpr(r.args[1], not isinstance(r.args[1], AndExpr))
-    elif isinstance(r, GtEqExpr):
-        r = printexpr(r.args[0]) + " >= " + printexpr(r.args[1])
-    elif isinstance(r, LtEqExpr):
-        r = printexpr(r.args[0]) + " <= " + printexpr(r.args[1])
-    elif isinstance(r, GtExpr):
-        r = printexpr(r.args[0]) + " > " + printexpr(r.args[1])
-    elif isinstance(r, LtExpr):
-        r = printexpr(r.args[0]) + " < " + printexpr(r.args[1])
-    elif isinstance(r, EqExpr):
-        r = printexpr(r.args[0]) + " == " + printexpr(r.args[1])
-    elif isinstance(r, NotEqExpr):
-        r = printexpr(r.args[0]) + " != " + printexpr(r.args[1])
-    elif isinstance(r, AddExpr):
-        r = printexpr(r.args[0]) + " + " + printexpr(r.args[1])
-    elif isinstance(r, DefinedExpr):
-        return "defined(%s)" % r.args[0]
-    elif isinstance(r, NotExpr):
-        return "!%s" % printexpr(r.args[0], isinstance(r.args[0], ExprNode))
+exprcache = ExprCache()
+
+class ParseCounts:
+    def __init__(self):
+        # expressions handled without going near lepl or the cache
+        self.fast = 0
+
+parsecounts = ParseCounts()
+
+# Most conditions are a lone (possibly negated) macro, defined() test or
+# number. These are recognised directly and only anything more involved
+# is handed to the lepl grammar.
+simpleregex = re.compile(r"\s*(!?)\s*(?:defined\s*\(\s*([a-zA-Z_][a-zA-Z0-9_]*)\s*\)|defined\s+([a-zA-Z_][a-zA-Z0-9_]*)|([a-zA-Z_][a-zA-Z0-9_]*)|([0-9]+))\s*$")
+
+def parsesimple(e):
+    bits = simpleregex.match(e)
+    if bits is None:
+        return None
+    (negated, definedparen, defined, ident, number) = bits.groups()
+    if number is not None:
+        r = int(number)
+    elif ident is not None:
+        r = intern(str(ident))
     else:
-        return str(r)
+        r = DefinedExpr([definedparen or defined])
+    if negated:
+        r = NotExpr([r])
+    return r
+
+def normaliseexpr(e):
+    # whitespace is insignificant to the grammar, except inside
+    # character literals
+    if e.find("'") >= 0:
+        return e.strip()
+    return " ".join(e.split())
+
+def parseexpr(e):
+    r = parsesimple(e)
+    if r is not None:
+        parsecounts.fast += 1
+        return r
+    e = normaliseexpr(e)
+    try:
+        return exprcache[e]
+    except KeyError:
+        r = parser(e)[0]
+        if type(r) is str:
+            r = intern(r)
+        exprcache[e] = r
+        return r
+
+# Each of the walks over an expression below dispatches on the exact type
+# of the node through a table, rather than testing the node against every
+# class in turn.
+
+binaryops = {
+    OrExpr: " || ",
+    AndExpr: " && ",
+    GtEqExpr: " >= ",
+    LtEqExpr: " <= ",
+    GtExpr: " > ",
+    LtExpr: " < ",
+    EqExpr: " == ",
+    NotEqExpr: " != ",
+    AddExpr: " + ",
+}
+
+def printlogical(r, addBrackets):
+    # chains of the same operator don't need brackets
+    lhs = printexpr(r.args[0], type(r.args[0]) is not type(r))
+    rhs = printexpr(r.args[1], type(r.args[1]) is not type(r))
+    r = lhs + binaryops[type(r)] + rhs
+    return str("(%s)" % r if addBrackets else r)
 
+def printarith(r, addBrackets):
+    r = printexpr(r.args[0]) + binaryops[type(r)] + printexpr(r.args[1])
     return str("(%s)" % r if addBrackets else r)
 
+printers = {
+    OrExpr: printlogical,
+    AndExpr: printlogical,
+    DefinedExpr: lambda r, addBrackets: "defined(%s)" % r.args[0],
+    NotExpr: lambda r, addBrackets: "!%s" % printexpr(r.args[0], isinstance(r.args[0], ExprNode)),
+}
+for t in [GtEqExpr, LtEqExpr, GtExpr, LtExpr, EqExpr, NotEqExpr, AddExpr]:
+    printers[t] = printarith
+
+def printexpr(r, addBrackets=False):
+    printer = printers.get(type(r))
+    if printer is None:
+        return str(r)
+    return printer(r, addBrackets)
+
 def printifdefexpr(ifdef):
     if isinstance(ifdef.expr, basestring) and ifdef.expr != "":
-        ifdef.expr = parser(ifdef.expr)[0]
+        ifdef.expr = parseexpr(ifdef.expr)
     e = ifdef.expr
     if ifdef.token in ["if", "ifdef", "ifndef"]:
         if isinstance(ifdef.expr, DefinedExpr):
@@ -136,128 +234,222 @@ def printifdef(ifdef):
         s = " " + s
     return ifdef.hash + ifdef.token + s
 
-def evalexpr(r):
-    if isinstance(r, OrExpr):
-        lhs = evalexpr(r.args[0])
-        rhs = evalexpr(r.args[1])
-        if lhs is None or lhs == False:
-            return rhs
-        elif rhs is None or rhs == False:
-            return lhs
-        elif lhs == True or rhs == True:
-            return True
-        return OrExpr([lhs,rhs])
-    elif isinstance(r, AndExpr):
-        lhs = evalexpr(r.args[0])
-        rhs = evalexpr(r.args[1])
-        if lhs is None or lhs is True:
-            return rhs
-        elif rhs is None or rhs is True:
-            return lhs
-        elif lhs is False or rhs is False:
-            return False
-        return AndExpr([lhs,rhs])
-    elif isinstance(r, EqExpr):
-        lhs = evalexpr(r.args[0])
-        rhs = evalexpr(r.args[1])
-        return EqExpr([lhs,rhs])
-    elif isinstance(r, NotEqExpr):
-        lhs = evalexpr(r.args[0])
-        rhs = evalexpr(r.args[1])
-        return NotEqExpr([lhs,rhs])
-    elif isinstance(r, LtEqExpr):
-        lhs = evalexpr(r.args[0])
-        rhs = evalexpr(r.args[1])
-        return LtEqExpr([lhs,rhs])
-    elif isinstance(r, GtEqExpr):
-        lhs = evalexpr(r.args[0])
-        rhs = evalexpr(r.args[1])
-        return GtEqExpr([lhs,rhs])
-    elif isinstance(r, LtExpr):
-        lhs = evalexpr(r.args[0])
-        rhs = evalexpr(r.args[1])
-        return LtExpr([lhs,rhs])
-    elif isinstance(r, GtExpr):
-        lhs = evalexpr(r.args[0])
-        rhs = evalexpr(r.args[1])
-        return GtExpr([lhs,rhs])
-    elif isinstance(r, AddExpr):
-        lhs = evalexpr(r.args[0])
-        rhs = evalexpr(r.args[1])
-        return AddExpr([lhs,rhs])
-    elif isinstance(r, NotExpr):
-        operand = evalexpr(r.args[0])
-        if operand is False or operand is True:
-            return not operand
-        elif operand is None:
-            return None
-        return NotExpr([operand])
-    elif isinstance(r, DefinedExpr):
-        if isinstance(r.args[0], DefinedValue):
-            return True
-        elif r.args[0] is None:
-            return False
+# Evaluates and simplifies an expression, following the preprocessor's
+# rules: an identifier that isn't defined is 0, and a result is true if it
+# is non-zero. Sub-expressions whose value is known are folded, including
+# arithmetic and comparisons once both sides are integers. If values is
+# given it maps macro names onto DefinedValue (for a macro that is always
+# defined, as the integer it holds or, if that is None, as something
+# unknown) or None (for one that is never defined, and so is 0), and
+# those substitutions are made in the same walk. The result is True,
+# False or whatever is left of the expression.
+def evalexpr(r, values=None):
+    return tological(evalvalue(r, values))
+
+def evalvalue(r, values):
+    evaluator = evaluators.get(type(r))
+    if evaluator is None:
+        return evalleaf(r, values)
+    return evaluator(r, values)
+
+def isinteger(v):
+    return type(v) in (int, long, bool)
+
+def tological(v):
+    if type(v) in (int, long):
+        return v != 0
+    return v
+
+def toarith(v):
+    if v is True or v is False:
+        return int(v)
+    return v
+
+def evalleaf(r, values):
+    if values is not None and isinstance(r, basestring) and r in values:
+        value = values[r]
+        if value is None:
+            return 0
+        elif value.args[0] is not None:
+            return value.args[0]
+        # defined, but as what isn't known
+        return r
     return r
 
+def evaland(r, values):
+    lhs = tological(evalvalue(r.args[0], values))
+    rhs = tological(evalvalue(r.args[1], values))
+    if lhs is False or rhs is False:
+        return False
+    elif lhs is True:
+        return rhs
+    elif rhs is True:
+        return lhs
+    return AndExpr([lhs,rhs])
+
+def evalor(r, values):
+    lhs = tological(evalvalue(r.args[0], values))
+    rhs = tological(evalvalue(r.args[1], values))
+    if lhs is True or rhs is True:
+        return True
+    elif lhs is False:
+        return rhs
+    elif rhs is False:
+        return lhs
+    return OrExpr([lhs,rhs])
+
+def evalnot(r, values):
+    operand = tological(evalvalue(r.args[0], values))
+    if operand is True or operand is False:
+        return not operand
+    return NotExpr([operand])
+
+def evaldefined(r, values):
+    arg = r.args[0]
+    if values is not None and isinstance(arg, basestring) and arg in values:
+        arg = values[arg]
+    if isinstance(arg, DefinedValue):
+        return True
+    elif arg is None:
+        return False
+    return r
+
+def makearith(op):
+    def evalarith(r, values):
+        lhs = toarith(evalvalue(r.args[0], values))
+        rhs = toarith(evalvalue(r.args[1], values))
+        if isinteger(lhs) and isinteger(rhs):
+            return op(lhs, rhs)
+        return type(r)([lhs,rhs])
+    return evalarith
+
+evaluators = {
+    AndExpr: evaland,
+    OrExpr: evalor,
+    NotExpr: evalnot,
+    DefinedExpr: evaldefined,
+    EqExpr: makearith(lambda a, b: a == b),
+    NotEqExpr: makearith(lambda a, b: a != b),
+    GtEqExpr: makearith(lambda a, b: a >= b),
+    LtEqExpr: makearith(lambda a, b: a <= b),
+    GtExpr: makearith(lambda a, b: a > b),
+    LtExpr: makearith(lambda a, b: a < b),
+    AddExpr: makearith(lambda a, b: a + b),
+}
+
+# The values (see evalexpr) that -e and -d options give: "-e NAME" only
+# says that NAME is defined, "-e NAME=VALUE" that it is defined as the
+# integer VALUE, and "-d NAME" that it never is. -e wins over -d. Raises
+# ValueError if a value isn't an integer.
+def macrovalues(enabled, disabled):
+    values = dict((n, None) for n in disabled)
+    for e in enabled:
+        (name, eq, value) = e.partition("=")
+        values[name] = DefinedValue([int(value, 0) if eq else None])
+    return values
+
+identregex = re.compile("[a-zA-Z_][a-zA-Z0-9_]*")
+
+def getidentifiers(e):
+    return set(identregex.findall(e))
+
+exprtypes = set([AndExpr, OrExpr, NotExpr, EqExpr, AddExpr, NotEqExpr, GtEqExpr, LtEqExpr, GtExpr, LtExpr])
+
 def gettokens(e):
-    if any(isinstance(e,t) for t in [ExprNode, ArithExpr]):
+    if type(e) in exprtypes:
         tokens = []
         for arg in e.args:
             tokens += gettokens(arg)
         return tokens
-    elif isinstance(e, DefinedExpr):
+    elif type(e) is DefinedExpr:
         return [e.args[0]]
     return [e]
 
 def substitutevalue(r, name, value):
-    if isinstance(r, OrExpr):
-        lhs = substitutevalue(r.args[0], name, value)
-        rhs = substitutevalue(r.args[1], name, value)
-        return OrExpr([lhs,rhs])
-    elif isinstance(r, AndExpr):
-        lhs = substitutevalue(r.args[0], name, value)
-        rhs = substitutevalue(r.args[1], name, value)
-        return AndExpr([lhs,rhs])
-    elif isinstance(r, GtEqExpr):
-        lhs = substitutevalue(r.args[0], name, value)
-        rhs = substitutevalue(r.args[1], name, value)
-        return GtEqExpr([lhs,rhs])
-    elif isinstance(r, LtEqExpr):
-        lhs = substitutevalue(r.args[0], name, value)
-        rhs = substitutevalue(r.args[1], name, value)
-        return LtEqExpr([lhs,rhs])
-    elif isinstance(r, GtExpr):
-        lhs = substitutevalue(r.args[0], name, value)
-        rhs = substitutevalue(r.args[1], name, value)
-        return GtExpr([lhs,rhs])
-    elif isinstance(r, LtExpr):
-        lhs = substitutevalue(r.args[0], name, value)
-        rhs = substitutevalue(r.args[1], name, value)
-        return LtExpr([lhs,rhs])
-    elif isinstance(r, EqExpr):
-        lhs = substitutevalue(r.args[0], name, value)
-        rhs = substitutevalue(r.args[1], name, value)
-        return EqExpr([lhs,rhs])
-    elif isinstance(r, NotEqExpr):
-        lhs = substitutevalue(r.args[0], name, value)
-        rhs = substitutevalue(r.args[1], name, value)
-        return NotEqExpr([lhs,rhs])
-    elif isinstance(r, AddExpr):
-        lhs = substitutevalue(r.args[0], name, value)
-        rhs = substitutevalue(r.args[1], name, value)
-        return AddExpr([lhs,rhs])
-    elif isinstance(r, DefinedExpr):
-        return DefinedExpr([substitutevalue(r.args[0], name, value)])
-    elif isinstance(r, NotExpr):
-        return NotExpr([substitutevalue(r.args[0], name, value)])
+    if type(r) in exprtypes or type(r) is DefinedExpr:
+        return type(r)([substitutevalue(arg, name, value) for arg in r.args])
     else:
         return value if str(r) == name else r
 
+# Evaluates expressions against many sets of values at once. Each set
+# of values (a configuration) is one bit, and evaluating an expression
+# gives back a pair of masks (t, f): the configurations in which it is
+# known to be true and those in which it is known to be false. Where a
+# bit is in neither the expression depends on macros the configuration
+# says nothing about.
+class ConfigMasks(object):
+    def __init__(self, configs):
+        self.configs = configs
+        self.all = (1 << len(configs)) - 1
+        self.defined = {}
+        self.undefined = {}
+        for (i, values) in enumerate(configs):
+            for (name, value) in values.items():
+                masks = self.undefined if value is None else self.defined
+                masks[name] = masks.get(name, 0) | (1 << i)
+        self.results = {}
+
+    def eval(self, r):
+        result = self.results.get(r)
+        if result is None:
+            evaluator = maskevaluators.get(type(r), evalmasksgeneric)
+            result = self.results[r] = evaluator(r, self)
+        return result
+
+def evalmasks(r, masks):
+    return masks.eval(r)
+
+def evalmasksand(r, masks):
+    (lt, lf) = masks.eval(r.args[0])
+    (rt, rf) = masks.eval(r.args[1])
+    return (lt & rt, lf | rf)
+
+def evalmasksor(r, masks):
+    (lt, lf) = masks.eval(r.args[0])
+    (rt, rf) = masks.eval(r.args[1])
+    return (lt | rt, lf & rf)
+
+def evalmasksnot(r, masks):
+    (t, f) = masks.eval(r.args[0])
+    return (f, t)
+
+def evalmasksdefined(r, masks):
+    arg = r.args[0]
+    if not isinstance(arg, basestring):
+        return evalmasksgeneric(r, masks)
+    return (masks.defined.get(arg, 0), masks.undefined.get(arg, 0))
+
+def evalmasksgeneric(r, masks):
+    # anything else (arithmetic, bare macro values) is evaluated once for
+    # every distinct combination of values its macros take
+    names = [t for t in gettokens(r) if isinstance(t, basestring)]
+    groups = {}
+    for (i, values) in enumerate(masks.configs):
+        key = tuple(values.get(n, n) for n in names)
+        groups.setdefault(key, [i, 0])[1] |= 1 << i
+    (t, f) = (0, 0)
+    for (i, bits) in groups.values():
+        result = evalexpr(r, masks.configs[i])
+        if result is True:
+            t |= bits
+        elif result is False:
+            f |= bits
+    return (t, f)
+
+maskevaluators = {
+    AndExpr: evalmasksand,
+    OrExpr: evalmasksor,
+    NotExpr: evalmasksnot,
+    DefinedExpr: evalmasksdefined,
+}
+
 # ------------------------------------------------------------------------------
 # Ifdef parser
 # ------------------------------------------------------------------------------
 
-class Branch:
+class Branch(object):
+    __slots__ = ('cond', 'startpos', 'endpos', 'startline', 'endline', 'children', 'size')
+
     def __init__(self, pos, cond, startline):
         self.cond = cond
         self.startpos = pos
@@ -270,12 +462,16 @@ class Branch:
     def __repr__(self):
         return "branch (%d,%d) '%s'" % (self.startpos, self.endpos, self.cond)
 
-class Ifdef:
+class Ifdef(object):
+    __slots__ = ('children', 'size')
+
     def __init__(self):
         self.children = list()
         self.size = None
 
-class Directive:
+class Directive(object):
+    __slots__ = ('hash', 'token', 'expr', 'comment')
+
     def __init__(self, hash, token, expr, comment):
         self.hash = hash
         self.token = token
@@ -283,72 +479,229 @@ class Directive:
         self.comment = comment
 
 # This regex contains three named groups, one for
-# the whitespace around and including the hash,
+# the whitespace around and including the hash (and
+# any block comments before it),
 # one for the preprocessor token and one for
-# the actual conditional expression
-regex = re.compile('(?P<hash>\s*#\s*)(?P<token>(ifdef)|(ifndef)|(if)|(elif)|(else)|(endif))(?P<contents>.*)')
+# the actual conditional expression. A directive can
+# run over several lines (see finddirectives), so the
+# contents take in everything up to the end.
+regex = re.compile('(?P<hash>(?:\s*/\*(?:[^*]|\*(?!/))*\*/)*\s*#\s*)(?P<token>(ifdef)|(ifndef)|(if)|(elif)|(else)|(endif))(?P<contents>.*)', re.S)
 
-def parseline(line):
+# a backslash at the end of a line joins it to the next one
+continuationregex = re.compile(r'\\\r?\n')
+
+def parseline(line, start=0, end=None):
     global regex
-    bits = regex.match(line)
+    bits = regex.match(line, start, len(line) if end is None else end)
     if bits is None:
         return None
         
     bits = bits.groupdict()
     hash = bits['hash']
     token = bits['token']
-    contents = bits['contents'].strip()
+    contents = bits['contents']
+    if contents.find("\\") >= 0:
+        contents = continuationregex.sub("", contents)
+    contents = contents.strip()
     
+    # Comments are taken in the order they appear, so that neither kind
+    # is mistaken for the start of one inside the other. One at the very
+    # end is kept as the directive's comment and any others are removed,
+    # leaving a space as the preprocessor would.
     comment = ""
-    commentpos = contents.find("//")
-    if commentpos >= 0:
-        comment = " // " + contents[commentpos+2:].strip()
-        contents = contents[0:commentpos].strip()
-
-    removed = True
-    while removed:
+    while True:
+        linepos = contents.find("//")
         commentpos = contents.find("/*")
-        if commentpos >= 0:
-            endpos = contents.find("*/")
-            if endpos == len(contents)-2 and comment == "":
-                comment = " // " + contents[commentpos+2:endpos].strip()
-            elif endpos == -1:
-                # multiline comment... ignore for now
-                contents = (contents[0:commentpos]).strip()
+        if linepos >= 0 and (commentpos < 0 or linepos < commentpos):
+            comment = " // " + contents[linepos+2:].strip()
+            contents = contents[0:linepos].strip()
+            break
+        elif commentpos < 0:
+            break
+        endpos = contents.find("*/", commentpos + 2)
+        if endpos == -1:
+            # never closed, so it runs to the end
+            endpos = len(contents)
+        if endpos >= len(contents) - 2 and comment == "":
+            text = contents[commentpos+2:endpos].strip()
+            if text.find("\n") >= 0:
+                comment = " /* " + text + " */"
             else:
-                contents = (contents[0:commentpos] + contents[endpos+2:]).strip()
-
-            removed = True
+                comment = " // " + text
+            contents = contents[0:commentpos].strip()
         else:
-            removed = False
+            contents = (contents[0:commentpos] + " " + contents[endpos+2:]).strip()
 
     return Directive(hash, token, contents, comment)
 
-def parsefile(file):
+def readfile(file, usemmap=False):
     src = open(file, 'r')
-    
-    root = Ifdef()
-    currentifdef = root
-    currentifdef.children.append(Branch(0, None, None))
-    currentstring = ""
-    activeifdefs = [currentifdef]
+    try:
+        if usemmap and os.fstat(src.fileno()).st_size > 0:
+            return mmap.mmap(src.fileno(), 0, access=mmap.ACCESS_READ)
+        return src.read()
+    finally:
+        src.close()
 
-    pos = 0
-    for line in src:
-        pos += 1
+def countlines(data, start, end):
+    if isinstance(data, str):
+        return data.count("\n", start, end)
+    # mmaps can't count, so do it a chunk at a time
+    n = 0
+    while start < end:
+        n += data[start:min(end, start + (1 << 20))].count("\n")
+        start += 1 << 20
+    return n
 
-        #print "Parsing line %d in file %s" % (pos, file)
+# ------------------------------------------------------------------------------
+# Directive lexer
+# ------------------------------------------------------------------------------
 
-        dir = parseline(line)
-        if dir is None:
-            currentstring += line
+# Finds directives the way the preprocessor would. A '#' only starts a
+# directive if it is the first thing on a line that isn't inside a
+# comment or a string or character literal, and the directive runs on
+# over backslash-continued lines and over any block comment that starts
+# on it. Lines that look like directives are found with one search and
+# are taken as they are unless a block comment might still be open, or
+# the line before is continued; only then is the text before them lexed
+# properly, comments and literals and all.
+
+# block comments (which may run over several lines) and blanks that can
+# come before the '#' of a directive
+leadingcomments = r'(?:[ \t\f\v]*/\*(?:[^*]|\*(?!/))*\*/)*[ \t\f\v]*'
+leadingregex = re.compile(leadingcomments)
+
+# starts a directive, when at the start of a line
+directiveregex = re.compile(leadingcomments + '#')
+
+# anything up to the newline before the next directive; a newline only
+# stops it if a directive follows, and comments and literals are taken
+# whole so that a '#' or newline inside them doesn't
+skipregex = re.compile(r"""(?:
+      [^/"'\\\n]+
+    | /\*.*?\*/
+    | /\*.*
+    | //(?:[^\\\n]|\\(?:\r\n|.))*
+    | /
+    | "(?:[^"\\\n]|\\(?:\r\n|.))*"?
+    | '(?:[^'\\\n]|\\(?:\r\n|.))*'?
+    | \\(?:\r\n|.)
+    | \\
+    | \n(?!""" + leadingcomments + r"""\#)
+    )*""", re.S | re.X)
+
+# the rest of a directive, up to but not including the newline that ends it
+directivebody = r"""(?:
+      [^/"'\\\n]+
+    | /\*.*?\*/
+    | /\*.*
+    | //(?:[^\\\n]|\\(?:\r\n|.))*
+    | /
+    | "(?:[^"\\\n]|\\(?:\r\n|.))*"?
+    | '(?:[^'\\\n]|\\(?:\r\n|.))*'?
+    | \\(?:\r\n|.)
+    | \\
+    )*"""
+
+# a whole directive, when its line holds a continuation or a comment
+directivelineregex = re.compile(leadingcomments + r"\#" + directivebody, re.S | re.X)
+
+def finddirectives(data):
+    # Yields (start, end, line number) for every directive, where end
+    # is just past the newline that finishes it.
+    #
+    # This jumps from one '#' to the next, so long stretches of plain
+    # code are skipped over at the speed of str.find. A line whose first
+    # non-blank character is a '#', or that has only block comments
+    # before it, is taken as a directive unless the line before it is
+    # continued, and runs to the next newline unless it has a backslash
+    # or a comment in it. It is only doubted if a block comment might be
+    # open in the gap since the last directive (only the last "/*" in it
+    # needs looking at); then the gap is lexed properly with skipregex
+    # and the directive that really follows is taken from there, which
+    # also finds one behind a comment that started on an earlier line.
+    pos = 1
+    counted = 0
+    isstr = isinstance(data, str)
+    size = len(data)
+    # everything before this has been scanned
+    linestart = 0
+    hashpos = data.find("#")
+    while hashpos >= 0:
+        start = data.rfind("\n", 0, hashpos) + 1
+        prefix = data[start:hashpos]
+        blank = not prefix.strip(" \t\f\v") or leadingregex.match(data, start, hashpos).end() == hashpos
+        # the line before is continued if a backslash ends it; if there is
+        # more than blanks and comments before the '#', it can still start
+        # a directive when it closes a comment opened on an earlier line
+        if blank and start and data[max(start - 3, 0):start - 1].rstrip("\r")[-1:] == "\\" or \
+                not blank and "*/" not in prefix:
+            hashpos = data.find("#", hashpos + 1)
             continue
-        elif currentstring != "":
-            if not isinstance(currentifdef.children[-1], Branch):
-                print "Fail at line %d in file %s: '%s'" % (pos, file, currentifdef.children[-1])
-            currentifdef.children[-1].children.append(currentstring)
-            currentstring = ""
-            
+        opened = data.rfind("/*", linestart, start)
+        if opened < 0 or data.find("*/", opened + 2, start) >= 0:
+            if not blank:
+                hashpos = data.find("#", hashpos + 1)
+                continue
+        else:
+            # lex up to the next line that really starts with a directive,
+            # which may be this one if it starts with the comment
+            match = directiveregex.match(data, linestart)
+            while match is None:
+                linestart = skipregex.match(data, linestart).end() + 1
+                if linestart > size:
+                    return
+                match = directiveregex.match(data, linestart)
+            start = linestart
+            hashpos = match.end() - 1
+        end = data.find("\n", hashpos)
+        if end < 0:
+            end = size
+        else:
+            line = data[hashpos:end]
+            if "\\" in line or "/*" in line:
+                end = directivelineregex.match(data, start).end()
+        if end < size:
+            end += 1
+        if isstr:
+            pos += data.count("\n", counted, start)
+        else:
+            pos += countlines(data, counted, start)
+        counted = start
+        yield (start, end, pos)
+        linestart = end
+        hashpos = data.find("#", end)
+
+def directivelines(line):
+    # how many lines a directive takes up
+    return max(str(line).count("\n"), 1)
+
+def parsefile(file, usemmap=False):
+    return parsedata(readfile(file, usemmap), file)
+
+# An else, elif or endif with no conditional open.
+def unmatched(dir, pos, file):
+    return IndexError("unmatched %s at line %d in file %s" % (dir.token, pos, file))
+
+# Builds the Ifdef/Branch tree one piece at a time, as the text between
+# directives and the directives themselves are found.
+class TreeBuilder:
+    def __init__(self, file):
+        self.file = file
+        self.root = Ifdef()
+        self.root.children.append(Branch(0, None, None))
+        self.activeifdefs = [self.root]
+
+    def depth(self):
+        return len(self.activeifdefs) - 1
+
+    def text(self, text, pos):
+        self.activeifdefs[-1].children[-1].children.append(text)
+
+    def directive(self, dir, line, pos):
+        if dir.token in ["elif", "else", "endif"] and self.depth() == 0:
+            raise unmatched(dir, pos, self.file)
+        currentifdef = self.activeifdefs[-1]
         if dir.token in ["if", "ifdef", "ifndef", "elif"]:
             if dir.token == "ifndef":
                 dir.expr = "!defined(%s)" % dir.expr
@@ -356,35 +709,45 @@ def parsefile(file):
                 dir.expr = "defined(%s)" % dir.expr
             
             if dir.token == "elif":
-                if currentifdef is None:
-                    print "Fail at line %d in file %s" % (pos, file)
                 currentifdef.children[-1].endpos = pos
                 currentifdef.children[-1].endline = line
             else:
                 newifdef = Ifdef()
                 currentifdef.children[-1].children.append(newifdef)
                 currentifdef = newifdef
-                activeifdefs.append(currentifdef)
+                self.activeifdefs.append(currentifdef)
             currentifdef.children.append(Branch(pos, dir, line))
         elif dir.token == "else":
-            if currentifdef is None:
-                    print "Fail at line %d in file %s" % (pos, file)
             currentifdef.children[-1].endpos = pos
             currentifdef.children[-1].endline = line
             currentifdef.children.append(Branch(pos, None, line))
         elif dir.token == "endif":
-            if currentifdef is None:
-                print "Fail at line %d in file %s" % (pos, file)
             currentifdef.children[-1].endpos = pos
             currentifdef.children[-1].endline = line
-            activeifdefs.pop()
-            currentifdef = activeifdefs[-1]
+            self.activeifdefs.pop()
+
+def parsedata(data, file):
+    builder = TreeBuilder(file)
+
+    # Text between directives is kept as a buffer (a view onto data)
+    # rather than copied out line by line, so the whole tree costs about
+    # one copy of the file.
+    textstart = 0
+    for (start, end, pos) in finddirectives(data):
+        #print "Parsing line %d in file %s" % (pos, file)
+
+        dir = parseline(data, start, end)
+        if dir is None:
+            continue
+        elif textstart != start:
+            builder.text(buffer(data, textstart, start - textstart), pos)
+        textstart = end
+        builder.directive(dir, buffer(data, start, end - start), pos)
     
-    if currentstring != "":
-        currentifdef.children[-1].children.append(currentstring)
+    if textstart != len(data):
+        builder.text(buffer(data, textstart, len(data) - textstart), 0)
             
-    src.close()
-    return root
+    return builder.root
 
 def calculatesizes(x):
     if isinstance(x, Ifdef) or isinstance(x, Branch):
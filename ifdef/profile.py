@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- Mode: Python; indent-tabs-mode: nil -*-
+# vi: set ts=4 sw=4 expandtab:
+#
+# The MIT License
+#
+# Copyright (c) 2011 Alexander Macdonald
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import time
+import json
+
+# ------------------------------------------------------------------------------
+# Phase profiler
+# ------------------------------------------------------------------------------
+
+# Records how long is spent in each phase of a run. Phases are entered
+# and left by wrapped functions (see wrap and instrument) and time is
+# charged to whichever phase is innermost, so a phase's time never
+# includes the phases it calls into. Nothing is wrapped unless profiling
+# is asked for, so an ordinary run pays nothing for this.
+class Profile:
+    def __init__(self):
+        self.times = {}
+        self.counts = {}
+        self.files = []
+        self.stack = []
+        self.last = None
+
+    def enter(self, phase):
+        now = time.time()
+        if len(self.stack) > 0:
+            self.charge(self.stack[-1], now - self.last)
+        self.stack.append(phase)
+        self.last = now
+
+    def leave(self):
+        now = time.time()
+        self.charge(self.stack.pop(), now - self.last)
+        self.last = now
+
+    def charge(self, phase, seconds):
+        self.times[phase] = self.times.get(phase, 0.0) + seconds
+
+    def count(self, name, n=1):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    # Wraps func so that calls to it are charged to phase. If counter is
+    # given it is incremented on every call, by measure(args, result) if
+    # that is given too.
+    def wrap(self, phase, func, counter=None, measure=None):
+        def wrapped(*args):
+            self.enter(phase)
+            try:
+                result = func(*args)
+            finally:
+                self.leave()
+            if counter is not None:
+                self.count(counter, 1 if measure is None else measure(args, result))
+            return result
+        wrapped.__name__ = func.__name__
+        return wrapped
+
+    # Replaces functions in namespace (a module's or script's globals)
+    # by wrapped ones; phases maps each function name to its phase and,
+    # optionally, a counter and measure for it.
+    def instrument(self, namespace, phases):
+        for (name, phase) in phases.items():
+            if type(phase) is tuple:
+                namespace[name] = self.wrap(phase[0], namespace[name], *phase[1:])
+            else:
+                namespace[name] = self.wrap(phase, namespace[name])
+
+    # Hands back the times and counts gathered since the last take, for
+    # a worker to send to the parent process.
+    def take(self):
+        taken = (self.times, self.counts)
+        (self.times, self.counts) = ({}, {})
+        return taken
+
+    def merge(self, taken):
+        (times, counts) = taken
+        for (phase, seconds) in times.items():
+            self.charge(phase, seconds)
+        for (name, n) in counts.items():
+            self.count(name, n)
+
+    def addfile(self, file, seconds):
+        self.files.append((seconds, file))
+
+    def slowest(self, n):
+        return sorted(self.files, reverse=True)[:n]
+
+    def report(self, dst, wall, top=10):
+        total = sum(self.times.values())
+        dst.write("profile: %.3fs wall, %.3fs in phases over all processes\n" % (wall, total))
+        for (seconds, phase) in sorted(((v, k) for (k, v) in self.times.items()), reverse=True):
+            dst.write("  %-20s %9.3fs %5.1f%%\n" % (phase, seconds, 100.0 * seconds / max(total, 1e-9)))
+        for (name, n) in sorted(self.counts.items()):
+            dst.write("  %-20s %9d\n" % (name, n))
+        if len(self.files) > 0:
+            dst.write("slowest files:\n")
+            for (seconds, file) in self.slowest(top):
+                dst.write("  %9.3fs %s\n" % (seconds, file))
+
+    def dump(self, file, wall, top=10):
+        dst = open(file, 'w')
+        json.dump({
+            "wall": wall,
+            "phases": self.times,
+            "counts": self.counts,
+            "slowest": [{"file": f, "seconds": s} for (s, f) in self.slowest(top)],
+        }, dst, indent=2, sort_keys=True)
+        dst.write("\n")
+        dst.close()
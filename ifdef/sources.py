@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# -*- Mode: Python; indent-tabs-mode: nil -*-
+# vi: set ts=4 sw=4 expandtab:
+#
+# The MIT License
+#
+# Copyright (c) 2011 Alexander Macdonald
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import os
+
+# ------------------------------------------------------------------------------
+# Source files
+# ------------------------------------------------------------------------------
+
+# What the tools take to be a source file when they look for them.
+SOURCE_EXTENSIONS = [".c", ".cpp", ".h", ".mm"]
+
+def issource(file):
+    return any(file.endswith(x) for x in SOURCE_EXTENSIONS)
+
+# The files a tool should look at: those named in args or, if there are
+# none, every source file under the current directory (as "./" paths).
+# If changed is given (see vcs.changedfiles) it is used instead of either,
+# less any files that no longer exist. Files whose name is in ignored are
+# always left out.
+def findsources(args, ignored=(), changed=None):
+    if changed is not None:
+        for fullpath in changed:
+            if os.path.basename(fullpath) in ignored or not os.path.exists(fullpath):
+                continue
+            yield fullpath
+    elif len(args) == 0:
+        for (path, dirs, files) in os.walk("."):
+            for file in files:
+                if file in ignored:
+                    continue
+                if issource(file):
+                    yield "%s/%s" % (path, file)
+    else:
+        for fullpath in args:
+            if os.path.basename(fullpath) in ignored:
+                continue
+            yield fullpath
@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+# -*- Mode: Python; indent-tabs-mode: nil -*-
+# vi: set ts=4 sw=4 expandtab:
+#
+# The MIT License
+#
+# Copyright (c) 2011 Alexander Macdonald
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import os
+import subprocess
+
+# ------------------------------------------------------------------------------
+# Version control
+# ------------------------------------------------------------------------------
+
+def git(args):
+    proc = subprocess.Popen(["git"] + args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    (out, err) = proc.communicate()
+    if proc.returncode != 0:
+        # the first line says what went wrong, anything after is usage
+        raise RuntimeError("git %s failed: %s" % (" ".join(args), (err.strip().splitlines() or [""])[0]))
+    return out
+
+# Lists the files under the current directory that differ from rev,
+# including uncommitted changes and files git doesn't know about yet,
+# as "./" paths like the ones a walk of "." gives. Files that have been
+# deleted are included too, so that whatever was made from them can be
+# updated. Only the local repository is looked at.
+def changedfiles(rev, extensions):
+    names = set(git(["diff", "--name-only", "--relative", "--no-renames", "-z", rev, "--"]).split("\0"))
+    names.update(git(["ls-files", "--others", "--exclude-standard", "-z"]).split("\0"))
+    return ["./" + n for n in sorted(names) if any(n.endswith(x) for x in extensions)]
@@ -126,7 +126,7 @@ from lepl.matchers.derived import Apply, args, KApply, Join, \
     SignedEFloat, Float, Word, DropEmpty, Literals, String, SingleLineString, \
     SkipString, SkipTo, Columns
 from lepl.matchers.error import Error, make_error, raise_error
-from lepl.matchers.memo import RMemo, LMemo, MemoException
+from lepl.matchers.memo import RMemo, LMemo, MemoException, MemoTable
 from lepl.matchers.operators import Override, Separator, SmartSeparator1, \
     GREEDY, NON_GREEDY, DEPTH_FIRST, BREADTH_FIRST, DroppedSpace
 from lepl.matchers.support import function_matcher, function_matcher_factory, \
@@ -258,6 +258,7 @@ __all__ = [
         'RMemo',
         'LMemo',
         'MemoException',
+        'MemoTable',
         # lepl.regexp.core
         'RegexpError',
         # lepl.regexp.matchers
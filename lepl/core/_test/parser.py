@@ -32,10 +32,11 @@ Tests for the lepl.core.parser module.
 '''
 
 from traceback import format_exc
-from types import MethodType
+from types import MethodType, GeneratorType
 from unittest import TestCase
 
-from lepl import Literal, Any, function_matcher
+from lepl import Literal, Any, Delayed, Token, Integer, function_matcher
+from lepl.core.parser import GeneratorWrapper, untag
 
 
 # pylint: disable-msg=C0103, C0111, C0301, W0702, C0324, C0102, E1101
@@ -107,4 +108,56 @@ class ErrorTest(TestCase):
         except TestException:
             trace = format_exc()
             assert "TestException('here')" in trace, trace
-            
\ No newline at end of file
+            
+
+class TrampolineTest(TestCase):
+    
+    def test_monitors(self):
+        matcher = Literal('a')[:] & Literal('b')
+        matcher.config.no_full_first_match()
+        plain = matcher.get_parse_string()
+        matcher.config.trace(True).manage()
+        monitored = matcher.get_parse_string()
+        assert plain('aab') == monitored('aab') == ['a', 'a', 'b']
+        assert plain('aac') is None
+        assert monitored('aac') is None
+        
+    def test_untag(self):
+        matcher = Literal('a')[:] & Literal('b')
+        matcher.config.no_full_first_match()
+        plain = matcher.get_parse_string()
+        # the parser evaluates a copy that makes no wrappers
+        assert plain.matcher is not matcher
+        assert type(plain.matcher._match('ab')) is GeneratorType
+        assert type(matcher._match('ab')) is GeneratorWrapper
+        assert type(untag(matcher)._match('ab')) is GeneratorType
+        
+    def grammar(self):
+        number = Token(Integer()) >> int
+        symbol = Token('[^0-9 ]')
+        expr = Delayed()
+        group = ~symbol('(') & expr & ~symbol(')')
+        factor = number | group
+        expr += factor & (symbol('+') & factor)[:]
+        return expr
+        
+    def assert_same(self, configure):
+        '''
+        Plain and monitored parsers agree, whatever else is configured.
+        '''
+        text = '1 + (2 + (3 + 4)) + 5'
+        matcher = self.grammar()
+        configure(matcher.config)
+        plain = matcher.get_parse()
+        matcher.config.trace(True).manage()
+        monitored = matcher.get_parse()
+        assert plain(text) == monitored(text) == \
+            [1, '+', 2, '+', 3, '+', 4, '+', 5], plain(text)
+        
+    def test_memoized(self):
+        # memoizers still make wrappers
+        self.assert_same(lambda config: config.auto_memoize())
+        
+    def test_compiled(self):
+        # compiled matchers are left as they are
+        self.assert_same(lambda config: config.compile_closures())
@@ -397,11 +397,15 @@ class ConfigBuilder(object):
         from lepl.core.rewriters import OptimizeOr
         return self.remove_all_rewriters(OptimizeOr)
         
-    def lexer(self, alphabet=None, discard=None, source=None):
+    def lexer(self, alphabet=None, discard=None, source=None, cache=None):
         '''
         Detect the use of `Token()` and modify the parser to use the lexer.
         If tokens are not used, this has no effect on parsing.
         
+        If ``cache`` is given it is a directory where the compiled lexer
+        is saved, so that other processes using the same tokens can load
+        it rather than compiling it again (see `DfaCache`).
+        
         This is part of the default configuration.  It can be disabled with
         `no_lexer`.
         '''
@@ -409,7 +413,7 @@ class ConfigBuilder(object):
         self.alphabet(alphabet)
         return self.add_rewriter(
             AddLexer(alphabet=self.__get_alphabet(), discard=discard, 
-                     source=source))
+                     source=source, cache=cache))
         
     def no_lexer(self):
         '''
@@ -437,6 +441,30 @@ class ConfigBuilder(object):
         from lepl.core.rewriters import DirectEvaluation
         return self.remove_all_rewriters(DirectEvaluation)
     
+    def compile_closures(self, conservative=False):
+        '''
+        Evaluate matchers as nested Python closures, rather than as 
+        generators on the trampoline, wherever possible.  This avoids 
+        creating a generator for every matcher call, but recursion (via 
+        `Delayed`) then uses the Python stack and monitors do not see the 
+        compiled matchers.
+        
+        Matchers in left-recursive loops are not compiled; ``conservative``
+        controls how these are detected (see `auto_memoize()`).
+        
+        This is not part of the default configuration.  It can be removed
+        with `no_compile_closures`.
+        '''
+        from lepl.core.rewriters import CompileClosures
+        return self.add_rewriter(CompileClosures(conservative))
+    
+    def no_compile_closures(self):
+        '''
+        Disable the compilation of matchers to closures.
+        '''
+        from lepl.core.rewriters import CompileClosures
+        return self.remove_all_rewriters(CompileClosures)
+    
     def compose_transforms(self):
         '''
         Combine transforms (functions applied to results) with matchers.
@@ -455,7 +483,7 @@ class ConfigBuilder(object):
         from lepl.core.rewriters import ComposeTransforms
         return self.remove_all_rewriters(ComposeTransforms)
         
-    def auto_memoize(self, conservative=False, full=False):
+    def auto_memoize(self, conservative=False, full=False, table=None):
         '''
         LEPL can add memoization so that (1) complex matching is more 
         efficient and (2) left recursive grammars do not loop indefinitely.  
@@ -475,6 +503,8 @@ class ConfigBuilder(object):
         True, all nodes are memozied; when False (the default) only 
         left-recursive nodes are memoized.
         
+        The ``table`` parameter is described in `right_memoize()`.
+        
         This is part of the default configuration.
         
         See also `no_memoize()`.
@@ -483,29 +513,39 @@ class ConfigBuilder(object):
         from lepl.matchers.memo import LMemo, RMemo
         self.no_memoize()
         return self.add_rewriter(AutoMemoize(conservative, LMemo,
-                                             RMemo if full else None))
+                                             RMemo if full else None, table))
     
-    def left_memoize(self):
+    def left_memoize(self, table=None):
         '''
         Add memoization that can detect and stabilise left-recursion.  This
         makes the parser more robust (so it can handle more grammars) but
         also significantly slower.
+        
+        The ``table`` parameter is described in `right_memoize()`; see
+        `MemoTable` before bounding it here.
         '''
         from lepl.core.rewriters import Memoize
         from lepl.matchers.memo import LMemo
         self.no_memoize()
-        return self.add_rewriter(Memoize(LMemo))
+        return self.add_rewriter(Memoize(LMemo, table))
     
-    def right_memoize(self):
+    def right_memoize(self, table=None):
         '''
         Add memoization that can make some complex parsers (with a lot of
         backtracking) more efficient.  In most cases, however, it makes
         the parser slower.
+        
+        By default each memoizer keeps every result for the lifetime of 
+        the parser, which can exhaust memory on large inputs.  If ``table``
+        is a `MemoTable` it is shared by all memoizers; constructed with 
+        a ``size`` (eg ``MemoTable(size=100000)``) it is bounded, giving a
+        packrat parser with limited memory, and its attributes give
+        statistics (hits, misses and evictions).
         '''      
         from lepl.core.rewriters import Memoize
         from lepl.matchers.memo import RMemo
         self.no_memoize()
-        return self.add_rewriter(Memoize(RMemo))
+        return self.add_rewriter(Memoize(RMemo, table))
     
     def no_memoize(self):
         '''
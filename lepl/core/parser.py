@@ -40,6 +40,7 @@ rewritten beforehand.
 from collections import deque
 from logging import getLogger
 from traceback import format_exc
+from types import GeneratorType, MethodType
 
 from lepl.core.monitor import prepare_monitors
 from lepl.support.lib import format
@@ -47,13 +48,15 @@ from lepl.support.lib import format
     
 def tagged(method):
     '''
-    Decorator for generators to add extra attributes.
+    Decorator for generators to add extra attributes.  The undecorated
+    method is kept as `untagged` (see `untag()`).
     '''
     def tagged_method(matcher, stream):
         '''
         Wrap the result.
         '''
         return GeneratorWrapper(method(matcher, stream), matcher, stream)
+    tagged_method.untagged = method
     return tagged_method
 
 
@@ -96,6 +99,13 @@ class GeneratorWrapper(object):
     
     def __str__(self):
         return self.__repr__()
+    
+    def close(self):
+        '''
+        Close the generator (so that wrapped and plain generators can be 
+        discarded in the same way).
+        '''
+        self.generator.close()
         
 
 def trampoline(main, m_stack=None, m_value=None):
@@ -103,7 +113,9 @@ def trampoline(main, m_stack=None, m_value=None):
     The main parser loop.  Evaluates matchers as coroutines.
     
     A dedicated version for when monitor not present increased the speed of
-    the nat_lang performance test by only around 1% (close to noise). 
+    the nat_lang performance test by only around 1% (close to noise).  The
+    version used without monitors, `bare_trampoline()`, gains more because
+    it also lets matchers skip creating a `GeneratorWrapper` per call.
     
     Replacing stack append/pop with a manually allocated non-decreasing array
     and index made no significant difference (at around 1% level)
@@ -204,6 +216,104 @@ def trampoline(main, m_stack=None, m_value=None):
             m_stack.pop(pop())
                     
                 
+def bare_trampoline(main):
+    '''
+    The parser loop used when there are no monitors.  Matchers may return
+    plain generators (see `untag()`) as well as `GeneratorWrapper` 
+    instances, and only the plain generators are kept on the stack.
+    '''
+    stack = deque()
+    push = stack.append
+    pop = stack.pop
+    value = main
+    exception_being_raised = False
+    epoch = 0
+    log = getLogger('lepl.parser.trampoline')
+    while True:
+        epoch += 1
+        try:
+            # is the value a coroutine that should be added to our stack
+            # and evaluated?
+            value_type = type(value)
+            if value_type is GeneratorWrapper:
+                value = value.generator
+                value_type = GeneratorType
+            if value_type is GeneratorType:
+                push(value)
+                value = next(value)
+            # if we don't have a coroutine then we have a result that
+            # must be passed up the stack.
+            else:
+                # drop top of the stack (which returned the value)
+                pop()
+                # if we still have coroutines left, pass the value in
+                if stack:
+                    if exception_being_raised:
+                        exception_being_raised = False
+                        value = stack[-1].throw(value)
+                    else:
+                        value = stack[-1].send(value)
+                # otherwise, the stack is completely unwound so return
+                # to main caller 
+                else:
+                    if exception_being_raised:
+                        raise value
+                    else:
+                        yield value
+                    # this allows us to restart with a new evaluation
+                    # (backtracking) if called again.
+                    value = main
+        except StopIteration as exception:
+            # this occurs when we need to exit the main loop
+            if exception_being_raised:
+                raise
+            # otherwise, we will propagate this value
+            value = exception
+            exception_being_raised = True
+        except Exception:
+            # do some logging etc before re-raising
+            log.error(format('Exception at epoch {0}: {1!s}',
+                             epoch, value))
+            if stack:
+                log.debug(format('Top of stack: {0}', stack[-1]))
+                try:
+                    log.warn(format_exc())
+                except:
+                    log.warn('Exception cannot be formatted!')
+                for generator in stack:
+                    log.debug(format('Stack: {0}', generator))
+            raise
+                    
+                
+def untag(graph):
+    '''
+    Clone the graph, with each copy using the undecorated version of its
+    `_match()` (if it is `tagged`), so that matchers return plain 
+    generators without creating a `GeneratorWrapper` for each call.
+    
+    The result can only be evaluated by `bare_trampoline()`, since 
+    monitors need the wrappers.  `Compiled` matchers are kept as they are,
+    since their closures cannot be rebuilt while the graph is half cloned
+    (and they make a single generator for the whole compiled subgraph).
+    '''
+    # delayed import to avoid dependency loops
+    from lepl.core.rewriters import DelayedClone, clone
+    from lepl.matchers.closures import Compiled
+    from lepl.matchers.matcher import Matcher
+    def new_clone(node, args, kargs):
+        '''
+        Clone, replacing a tagged `_match()`.
+        '''
+        if isinstance(node, Compiled):
+            return node
+        copy = clone(node, args, kargs)
+        untagged = getattr(type(copy)._match, 'untagged', None)
+        if untagged:
+            copy._match = MethodType(untagged, copy)
+        return copy
+    return graph.postorder(DelayedClone(new_clone), Matcher)
+
+
 def make_raw_parser(matcher, stream_factory, config):
     '''
     Make a parser.  Rewrite the matcher and prepare the input for a parser.
@@ -218,9 +328,15 @@ def make_raw_parser(matcher, stream_factory, config):
     # pylint: disable-msg=W0212, E0601
     # (_match is meant to be hidden)
     # pylint: disable-msg=W0142
-    parser = lambda arg, **kargs: \
-        trampoline(matcher._match(stream_factory(arg, **kargs)), 
-                   m_stack=m_stack, m_value=m_value)
+    if m_stack or m_value:
+        parser = lambda arg, **kargs: \
+            trampoline(matcher._match(stream_factory(arg, **kargs)), 
+                       m_stack=m_stack, m_value=m_value)
+    else:
+        # nothing needs the wrappers, so they need not be made
+        matcher = untag(matcher)
+        parser = lambda arg, **kargs: \
+            bare_trampoline(matcher._match(stream_factory(arg, **kargs)))
     parser.matcher = matcher
     return parser
 
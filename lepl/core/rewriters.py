@@ -57,6 +57,7 @@ class Rewriter(LogMixin):
     LEXER = 70
     DIRECT_EVALUATION = 80
     MEMOIZE = 90
+    COMPILE_CLOSURES = 100
        
     def __init__(self, order, name=None, exclusive=True):
         super(Rewriter, self).__init__()
@@ -314,15 +315,21 @@ class Memoize(Rewriter):
     '''
     A rewriter that adds the given memoizer to all nodes in the matcher
     graph.
+    
+    If a `MemoTable` is given then it is shared by all the memoizers.
     '''
     
-    def __init__(self, memoizer):
+    def __init__(self, memoizer, table=None):
         super(Memoize, self).__init__(Rewriter.MEMOIZE,
-                                      format('Memoize({0})', memoizer.__name__))
+            format('Memoize({0}, {1!r})', memoizer.__name__, table))
         self.memoizer = memoizer
+        self.table = table
         
     def __call__(self, graph):
-        return graph.postorder(DelayedClone(post_clone(self.memoizer)), Matcher)
+        memoizer = self.memoizer
+        if self.table is not None:
+            memoizer = lambda matcher: self.memoizer(matcher, self.table)
+        return graph.postorder(DelayedClone(post_clone(memoizer)), Matcher)
 
 
 class AutoMemoize(Rewriter):
@@ -332,14 +339,27 @@ class AutoMemoize(Rewriter):
     
     `conservative` refers to the algorithm used to detect loops; False
     may classify some left--recursive loops as right--recursive.
+    
+    If a `MemoTable` is given then it is shared by all the memoizers.
     '''
     
-    def __init__(self, conservative=False, left=None, right=None):
+    def __init__(self, conservative=False, left=None, right=None, table=None):
         super(AutoMemoize, self).__init__(Rewriter.MEMOIZE,
-            format('AutoMemoize({0}, {1}, {2})', conservative, left, right))
+            format('AutoMemoize({0}, {1}, {2}, {3!r})', 
+                   conservative, left, right, table))
         self.conservative = conservative
         self.left = left
         self.right = right
+        self.table = table
+        
+    def __memoize(self, memoizer, node):
+        '''
+        Apply the memoizer, with the shared table if one was given.
+        '''
+        if self.table is None:
+            return memoizer(node)
+        else:
+            return memoizer(node, self.table)
 
     def __call__(self, graph):
         dangerous = set()
@@ -359,12 +379,12 @@ class AutoMemoize(Rewriter):
                 return copy
             elif node in dangerous:
                 if self.left:
-                    return self.left(copy)
+                    return self.__memoize(self.left, copy)
                 else:
                     return copy
             else:
                 if self.right:
-                    return self.right(copy)
+                    return self.__memoize(self.right, copy)
                 else:
                     return copy
         return graph.postorder(DelayedClone(new_clone), Matcher)
@@ -537,6 +557,41 @@ class DirectEvaluation(Rewriter):
         return graph.postorder(DelayedClone(new_clone), Matcher)
     
     
+class CompileClosures(Rewriter):
+    '''
+    Replace matchers with `Compiled` matchers that evaluate their children
+    as nested closures, rather than via the trampoline (see 
+    `lepl.matchers.closures`).
+    
+    This comes after memoization, so memoizers and `Delayed` are left on
+    the trampoline, as are all matchers in left-recursive loops.  
+    '''
+    
+    def __init__(self, conservative=False):
+        super(CompileClosures, self).__init__(Rewriter.COMPILE_CLOSURES,
+            format('CompileClosures({0})', conservative))
+        self.conservative = conservative
+
+    def __call__(self, graph):
+        from lepl.matchers.closures import Compiled, compile_closure
+        dangerous = set()
+        for head in order(graph, NONTREE, Matcher):
+            for loop in either_loops(head, self.conservative):
+                for node in loop:
+                    dangerous.add(node)
+        def new_clone(node, args, kargs):
+            '''
+            Clone, compiling the copy where possible.
+            '''
+            copy = clone(node, args, kargs)
+            if node not in dangerous:
+                closure = compile_closure(copy)
+                if closure:
+                    return Compiled(copy, closure)
+            return copy
+        return graph.postorder(DelayedClone(new_clone), Matcher)
+    
+    
 class FullFirstMatch(Rewriter):
     '''
     If the parser fails, raise an error at the maxiumum depth.
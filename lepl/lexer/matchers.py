@@ -307,7 +307,7 @@ class Lexer(NamespaceMixin, BaseMatcher):
     '''
     
     def __init__(self, matcher, tokens, alphabet, discard, 
-                  t_regexp=None, s_regexp=None, source=None):
+                  t_regexp=None, s_regexp=None, source=None, cache=None):
         '''
         matcher is the head of the original matcher graph, which will be called
         with a tokenised stream. 
@@ -323,6 +323,9 @@ class Lexer(NamespaceMixin, BaseMatcher):
         and should not be provided by non-cloning callers.
         
         source is the source used to generate the final stream.
+        
+        cache is an optional `DfaCache` used to avoid compiling the 
+        regular expressions.
         '''
         super(Lexer, self).__init__(TOKENS, TokenNamespace)
         if t_regexp is None:
@@ -332,10 +335,16 @@ class Lexer(NamespaceMixin, BaseMatcher):
                 self._debug(format('Token: {0}', token))
                 # this just reduces the work for the regexp compiler
                 unique[token.id_] = token
-            t_regexp = Compiler.multiple(alphabet, 
-                            [(t.id_, t.regexp) for t in unique.values()]).dfa()
+            regexps = [(t.id_, t.regexp) for t in unique.values()]
+            if cache:
+                t_regexp = cache.multiple(alphabet, regexps)
+            else:
+                t_regexp = Compiler.multiple(alphabet, regexps).dfa()
         if s_regexp is None and discard is not None:
-            s_regexp = Compiler.single(alphabet, discard).dfa()
+            if cache:
+                s_regexp = cache.single(alphabet, discard)
+            else:
+                s_regexp = Compiler.single(alphabet, discard).dfa()
         self._arg(matcher=matcher)
         self._arg(tokens=tokens)
         self._arg(alphabet=alphabet)
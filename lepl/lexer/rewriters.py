@@ -36,6 +36,7 @@ from collections import deque
 from lepl.core.rewriters import Rewriter
 from lepl.lexer.matchers import BaseToken, Lexer, LexerError, NonToken
 from lepl.matchers.matcher import Matcher, is_child
+from lepl.regexp.cache import DfaCache
 from lepl.regexp.unicode import UnicodeAlphabet
 from lepl.support.lib import format
 
@@ -105,25 +106,31 @@ class AddLexer(Rewriter):
     
     source is the source used to generate the final stream (it is used for
     offside parsing).
+    
+    cache is an optional directory in which the compiled regular expressions
+    are saved, so that they can be reused by other processes (see 
+    `DfaCache`).
     '''
 
-    def __init__(self, alphabet=None, discard=None, source=None):
+    def __init__(self, alphabet=None, discard=None, source=None, cache=None):
         if alphabet is None:
             alphabet = UnicodeAlphabet.instance()
         # use '' to have no discard at all
         if discard is None:
             discard = '[ \t\r\n]'
         super(AddLexer, self).__init__(Rewriter.LEXER,
-            format('Lexer({0}, {1}, {2})', alphabet, discard, source))
+            format('Lexer({0}, {1}, {2}, {3})', alphabet, discard, source, 
+                   cache))
         self.alphabet = alphabet
         self.discard = discard
         self.source = source
+        self.cache = DfaCache(cache) if cache else None
         
     def __call__(self, graph):
         tokens = find_tokens(graph)
         if tokens:
             return Lexer(graph, tokens, self.alphabet, self.discard, 
-                         source=self.source)
+                         source=self.source, cache=self.cache)
         else:
             self._info('Lexer rewriter used, but no tokens found.')
             return graph
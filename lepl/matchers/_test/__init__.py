@@ -38,6 +38,7 @@ from sys import version
 
 # pylint: disable-msg=E0611
 #@PydevCodeAnalysisIgnore
+import lepl.matchers._test.closures
 import lepl.matchers._test.combine
 import lepl.matchers._test.core
 import lepl.matchers._test.derived
@@ -0,0 +1,89 @@
+
+# The contents of this file are subject to the Mozilla Public License
+# (MPL) Version 1.1 (the "License"); you may not use this file except
+# in compliance with the License. You may obtain a copy of the License
+# at http://www.mozilla.org/MPL/
+#
+# Software distributed under the License is distributed on an "AS IS"
+# basis, WITHOUT WARRANTY OF ANY KIND, either express or implied. See
+# the License for the specific language governing rights and
+# limitations under the License.
+#
+# The Original Code is LEPL (http://www.acooke.org/lepl)
+# The Initial Developer of the Original Code is Andrew Cooke.
+# Portions created by the Initial Developer are Copyright (C) 2009-2010
+# Andrew Cooke (andrew@acooke.org). All Rights Reserved.
+#
+# Alternatively, the contents of this file may be used under the terms
+# of the LGPL license (the GNU Lesser General Public License,
+# http://www.gnu.org/licenses/lgpl.html), in which case the provisions
+# of the LGPL License are applicable instead of those above.
+#
+# If you wish to allow use of your version of this file only under the
+# terms of the LGPL License and not to allow others to use your version
+# of this file under the MPL, indicate your decision by deleting the
+# provisions above and replace them with the notice and other provisions
+# required by the LGPL License.  If you do not delete the provisions
+# above, a recipient may use your version of this file under either the
+# MPL or the LGPL License.
+
+'''
+Tests for the lepl.matchers.closures module.
+'''
+
+from unittest import TestCase
+
+from lepl import Delayed, Any, Optional, Literal, Regexp, Token, Drop, \
+    PostCondition
+from lepl.matchers.closures import Compiled
+
+
+# pylint: disable-msg=C0103, C0111, C0301, W0702, C0324, C0102, C0321
+# (dude this is just a test)
+
+
+class ClosuresTest(TestCase):
+    
+    def assert_same(self, matcher, text, lexer=False):
+        '''
+        All matches are the same with and without compilation.
+        '''
+        matcher.config.no_full_first_match()
+        if lexer:
+            matcher.config.lexer()
+        expected = list(matcher.match_string(text))
+        matcher.config.compile_closures()
+        parser = matcher.get_match_string()
+        assert expected == list(parser(text)), (expected, list(parser(text)))
+        return parser
+    
+    def test_sequences(self):
+        self.assert_same(Any()[:] & Any()[1:2], 'abc')
+        self.assert_same(Any()[::'b'] & Literal('c'), 'abc')
+        self.assert_same((Literal('a') | Any()) & Any(), 'ab')
+        self.assert_same(Any()[2:3, ...] | Literal('a'), 'abcd')
+        
+    def test_transforms(self):
+        self.assert_same((Any()[:, ...] >> len) & Any(), 'abc')
+        self.assert_same(PostCondition(Any()[:], lambda r: len(r) % 2), 
+                         'abcd')
+        self.assert_same(Any() & Any()[:] > (lambda r: [''.join(r)]), 'abc')
+        
+    def test_recursion(self):
+        expr = Delayed()
+        number = Regexp('[0-9]+') >> int
+        expr += number | (Drop('(') & expr[:] & Drop(')'))
+        parser = self.assert_same(expr, '(1(2)((3)4))')
+        assert isinstance(parser.matcher.matcher, Compiled), parser.matcher
+        
+    def test_left_recursion(self):
+        seq = Delayed()
+        seq += Optional(seq) & Any()
+        seq.config.clear().left_memoize()
+        self.assert_same(seq, 'abc')
+        
+    def test_tokens(self):
+        word = Token('[a-z]+')
+        number = Token('[0-9]+')
+        line = (word('a') | word) & number[:] & Optional(word(Any()[2]))
+        self.assert_same(line, 'a 1 2 bc', lexer=True)
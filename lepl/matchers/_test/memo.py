@@ -35,7 +35,8 @@ Tests for the lepl.matchers.memo module.
 from time import time
 from unittest import TestCase
 
-from lepl import Delayed, Any, Optional, Node, Literals, Eos, Token, Or
+from lepl import Delayed, Any, Optional, Node, Literals, Eos, Token, Or, \
+    MemoTable, MemoException
 
 
 # pylint: disable-msg=C0103, C0111, C0301, W0702, C0324, C0102, C0321
@@ -379,4 +380,73 @@ class RecursionTest(TestCase):
 #            return matcher
 #        memo = self.best_of(n, count, memo_factory)
 #        assert default > 10 * memo, (default, memo)
-        
\ No newline at end of file
+        
+
+
+class MemoTableTest(TestCase):
+    
+    def test_unbounded(self):
+        table = MemoTable()
+        for i in range(100):
+            assert table.get(i, lambda: i) == i
+        assert table.get(0, lambda: None) == 0
+        assert len(table) == 100, len(table)
+        assert (table.hits, table.misses, table.evictions) == (1, 100, 0)
+        
+    def test_bounded(self):
+        table = MemoTable(10)
+        for i in range(100):
+            table.get(i, lambda: i)
+            assert len(table) <= 10, len(table)
+        assert table.misses == 100, table.misses
+        assert table.evictions == 100 - len(table), table
+        
+    def test_recent(self):
+        # an entry that is used repeatedly is not evicted
+        table = MemoTable(4)
+        table.get('x', lambda: 1)
+        for i in range(100):
+            table.get(i, lambda: i)
+            assert table.get('x', lambda: 2) == 1
+        assert table.misses == 101, table.misses
+        
+    def test_size(self):
+        self.assertRaises(MemoException, MemoTable, 1)
+        
+    def test_right(self):
+        matcher = Delayed()
+        matcher += Any() & Optional(matcher)
+        table = MemoTable(20)
+        matcher.config.clear().right_memoize(table)
+        parser = matcher.get_parse_string()
+        text = 'abcdefghij' * 10
+        result = parser(text)
+        assert result == list(text), result
+        assert len(table) <= 20, len(table)
+        assert table.evictions > 0, table
+        
+    def test_left(self):
+        matcher = Delayed()
+        matcher += Optional(matcher) & Any()
+        table = MemoTable(20)
+        matcher.config.clear().left_memoize(table)
+        parser = matcher.get_parse_string()
+        for text in ('ab', 'abcdefghij' * 3):
+            result = parser(text)
+            assert result == list(text), result
+        assert len(table) <= 20, len(table)
+        assert table.evictions > 0, table
+        
+    def test_separate_parses(self):
+        # streams for the same text compare equal, but each parse has its
+        # own entries in the table
+        matcher = Delayed()
+        matcher += Optional(matcher) & Any()
+        table = MemoTable()
+        matcher.config.clear().left_memoize(table)
+        parser = matcher.get_parse_string()
+        assert parser('abc') == ['a', 'b', 'c']
+        (size, hits) = (len(table), table.hits)
+        assert parser('abc') == ['a', 'b', 'c']
+        assert len(table) == 2 * size, (len(table), size)
+        assert table.hits == 2 * hits, (table.hits, hits)
@@ -0,0 +1,377 @@
+
+# The contents of this file are subject to the Mozilla Public License
+# (MPL) Version 1.1 (the "License"); you may not use this file except
+# in compliance with the License. You may obtain a copy of the License
+# at http://www.mozilla.org/MPL/
+#
+# Software distributed under the License is distributed on an "AS IS"
+# basis, WITHOUT WARRANTY OF ANY KIND, either express or implied. See
+# the License for the specific language governing rights and
+# limitations under the License.
+#
+# The Original Code is LEPL (http://www.acooke.org/lepl)
+# The Initial Developer of the Original Code is Andrew Cooke.
+# Portions created by the Initial Developer are Copyright (C) 2009-2010
+# Andrew Cooke (andrew@acooke.org). All Rights Reserved.
+#
+# Alternatively, the contents of this file may be used under the terms
+# of the LGPL license (the GNU Lesser General Public License,
+# http://www.gnu.org/licenses/lgpl.html), in which case the provisions
+# of the LGPL License are applicable instead of those above.
+#
+# If you wish to allow use of your version of this file only under the
+# terms of the LGPL License and not to allow others to use your version
+# of this file under the MPL, indicate your decision by deleting the
+# provisions above and replace them with the notice and other provisions
+# required by the LGPL License.  If you do not delete the provisions
+# above, a recipient may use your version of this file under either the
+# MPL or the LGPL License.
+
+'''
+Evaluation of matchers as nested Python closures, without the trampoline.
+
+Every call to a matcher normally creates a generator (and a
+`GeneratorWrapper`) that is evaluated by `trampoline()`.  For the common
+combinators (`And`, `Or`, repetition, transformations and tokens) that is
+more work than needed: here each is replaced by a `Compiled` matcher whose
+`closure` calls the closures of its children directly, as plain Python
+generators.
+
+A `Delayed` matcher (which closes a recursive loop) is called through to
+the matcher it refers to, so recursion uses the Python stack, one level
+for each nested call.  Other matchers (in particular the memoizers, and 
+anything in a left-recursive loop) are not compiled.  When a compiled 
+matcher needs one of these it evaluates it with a separate trampoline.
+
+See `CompileClosures()`.
+'''
+
+# pylint: disable-msg=C0103,W0212
+# (consistent interfaces)
+# pylint: disable-msg=E1101
+# (_args create attributes)
+# pylint: disable-msg=R0901, R0904, W0142
+# lepl conventions
+
+from collections import deque
+
+from lepl.core.parser import GeneratorWrapper, bare_trampoline
+from lepl.matchers.combine import And, AndNoTrampoline, Or, OrNoTrampoline, \
+    DepthFirst, DepthNoTrampoline, BreadthFirst, BreadthNoTrampoline
+from lepl.matchers.core import Delayed
+from lepl.matchers.matcher import is_child
+from lepl.matchers.support import OperatorMatcher, NoTrampoline, \
+    TrampolineWrapper
+from lepl.matchers.transform import Transform, raise_
+
+
+def closure(matcher):
+    '''
+    A function that, given a stream, returns an iterator over the matcher's
+    (result, stream) pairs.
+    '''
+    if isinstance(matcher, Compiled):
+        return matcher.closure
+    elif isinstance(matcher, NoTrampoline):
+        return matcher._untagged_match
+    elif type(matcher) is Delayed:
+        return delayed(matcher)
+    else:
+        return trampolined(matcher)
+    
+    
+def delayed(matcher):
+    '''
+    Call through a `Delayed` matcher.  This is bound later than the graph is
+    compiled, so the closure for the matcher it refers to is found on the 
+    first call.
+    '''
+    cache = []
+    def match(stream):
+        '''
+        Call the closure, finding it first if necessary.
+        '''
+        if not cache:
+            if not matcher.matcher:
+                raise ValueError('Delayed matcher still unbound.')
+            cache.append(closure(matcher.matcher))
+        return cache[0](stream)
+    return match
+
+    
+def trampolined(matcher):
+    '''
+    Evaluate a matcher that cannot be compiled on its own trampoline.
+    '''
+    def match(stream):
+        '''
+        Run the trampoline for a single call.
+        '''
+        return bare_trampoline(matcher._match(stream))
+    return match
+
+
+def fail():
+    '''
+    The matcher given to a transformation once there are no more results.
+    '''
+    return raise_(StopIteration)
+
+
+def and_closure(matchers):
+    '''
+    Match the matchers in sequence, backtracking depth first (like `And`).
+    '''
+    if not matchers:
+        return lambda stream: iter(())
+    first = closure(matchers[0])
+    if len(matchers) == 1:
+        def match(stream_in):
+            '''
+            The last matcher in the sequence.
+            '''
+            for (value, stream_out) in first(stream_in):
+                yield ([] + value, stream_out)
+    else:
+        rest = and_closure(matchers[1:])
+        def match(stream_in):
+            '''
+            A matcher followed by the rest of the sequence.
+            '''
+            for (value1, stream1) in first(stream_in):
+                for (value2, stream2) in rest(stream1):
+                    yield (value1 + value2, stream2)
+    return match
+
+
+def or_closure(matchers):
+    '''
+    Try each matcher in turn (like `Or`).
+    '''
+    matchers = [closure(matcher) for matcher in matchers]
+    def match(stream_in):
+        '''
+        All results from the first matcher, then the second, etc.
+        '''
+        for matcher in matchers:
+            for result in matcher(stream_in):
+                yield result
+    return match
+
+
+def depth_closure(first, start, stop, rest):
+    '''
+    Depth first repetition (like `DepthFirst`).
+    '''
+    (first, rest) = (closure(first), closure(rest))
+    def match(stream):
+        '''
+        The same search as `DepthNoTrampoline`.
+        '''
+        stack = deque()
+        try:
+            stack.append((0, [], stream, first(stream)))
+            while stack:
+                (count1, acc1, stream1, generator) = stack[-1]
+                extended = False
+                if stop is None or count1 < stop:
+                    count2 = count1 + 1
+                    try:
+                        (value, stream2) = next(generator)
+                        acc2 = acc1 + value
+                        stack.append((count2, acc2, stream2, rest(stream2)))
+                        extended = True
+                    except StopIteration:
+                        pass
+                if not extended:
+                    if count1 >= start and (stop is None or count1 <= stop):
+                        yield (acc1, stream1)
+                    stack.pop()
+        finally:
+            for (_count, _acc, _stream, generator) in stack:
+                generator.close()
+    return match
+
+
+def breadth_closure(first, start, stop, rest):
+    '''
+    Breadth first repetition (like `BreadthFirst`).
+    '''
+    (first, rest) = (closure(first), closure(rest))
+    def match(stream):
+        '''
+        The same search as `BreadthNoTrampoline`.
+        '''
+        queue = deque()
+        try:
+            queue.append((0, [], stream, first(stream)))
+            while queue:
+                (count1, acc1, stream1, generator) = queue.popleft()
+                if count1 >= start and (stop is None or count1 <= stop):
+                    yield (acc1, stream1)
+                count2 = count1 + 1
+                for (value, stream2) in generator:
+                    acc2 = acc1 + value
+                    if stop is None or count2 <= stop:
+                        queue.append((count2, acc2, stream2, rest(stream2)))
+        finally:
+            for (_count, _acc, _stream, generator) in queue:
+                generator.close()
+    return match
+
+
+def wrapped_closure(inner, function):
+    '''
+    Apply a transformation in the same way as `TrampolineWrapper` (where a
+    rejected result is treated like the end of the results).
+    '''
+    def match(stream_in):
+        '''
+        Transform each result, then let the transformation add more.
+        '''
+        for results in inner(stream_in):
+            try:
+                transformed = function(stream_in, lambda: results)
+            except StopIteration:
+                yield function(stream_in, fail)
+            else:
+                yield transformed
+        while True:
+            yield function(stream_in, fail)
+    return match
+
+
+def transform_closure(inner, function):
+    '''
+    Apply a transformation in the same way as `Transform` (where a rejected
+    result is simply dropped).
+    '''
+    def match(stream_in):
+        '''
+        Transform each result, then let the transformation add more.
+        '''
+        for results in inner(stream_in):
+            try:
+                transformed = function(stream_in, lambda: results)
+            except StopIteration:
+                pass
+            else:
+                yield transformed
+        while True:
+            yield function(stream_in, fail)
+    return match
+
+
+def token_closure(token):
+    '''
+    Match a token and, optionally, its contents (like `BaseToken`).
+    '''
+    id_ = token.id_
+    if token.content is None:
+        def match(stream):
+            '''
+            The whole token.
+            '''
+            if stream:
+                (tokens, contents) = stream[0]
+                if id_ in tokens:
+                    yield ([contents], stream[1:])
+    else:
+        content = closure(token.content)
+        complete = token.complete
+        new_stream = token._BaseToken__new_stream
+        def match(stream):
+            '''
+            The token's contents, matched against the content matcher.
+            '''
+            if stream:
+                (tokens, contents) = stream[0]
+                if id_ in tokens:
+                    for (result, stream_out) in \
+                            content(new_stream(contents, stream)):
+                        if not stream_out or not complete:
+                            yield (result, stream[1:])
+    return match
+
+
+def compile_closure(matcher):
+    '''
+    Return a closure that evaluates the matcher (using the closures of 
+    its children) or None, if the matcher is not one that can be compiled.
+    '''
+    from lepl.lexer.matchers import BaseToken
+    if isinstance(matcher, BaseToken):
+        if matcher.compiled:
+            return token_closure(matcher)
+        else:
+            return None
+    elif isinstance(matcher, Transform):
+        return transform_closure(closure(matcher.matcher), 
+                                 matcher.wrapper.function)
+    elif is_child(matcher, And, fail=False) or \
+            is_child(matcher, AndNoTrampoline, fail=False):
+        inner = and_closure(matcher.matchers)
+    elif is_child(matcher, Or, fail=False) or \
+            is_child(matcher, OrNoTrampoline, fail=False):
+        inner = or_closure(matcher.matchers)
+    elif is_child(matcher, DepthFirst, fail=False) or \
+            is_child(matcher, DepthNoTrampoline, fail=False):
+        inner = depth_closure(matcher.first, matcher.start, 
+                              matcher.stop, matcher.rest)
+    elif is_child(matcher, BreadthFirst, fail=False) or \
+            is_child(matcher, BreadthNoTrampoline, fail=False):
+        inner = breadth_closure(matcher.first, matcher.start, 
+                                matcher.stop, matcher.rest)
+    else:
+        return None
+    function = matcher.wrapper.function
+    if not function:
+        return inner
+    elif isinstance(matcher, TrampolineWrapper):
+        return wrapped_closure(inner, function)
+    else:
+        # SequenceWrapper, which stops at a rejected result
+        return sequence_closure(inner, function)
+
+
+def sequence_closure(inner, function):
+    '''
+    Apply a transformation in the same way as `SequenceWrapper` (where a 
+    rejected result ends the match).
+    '''
+    def match(stream_in):
+        '''
+        Transform each result, then let the transformation add more.
+        '''
+        for results in inner(stream_in):
+            yield function(stream_in, lambda: results)
+        while True:
+            yield function(stream_in, fail)
+    return match
+
+
+class Compiled(NoTrampoline, OperatorMatcher):
+    '''
+    A matcher evaluated by a closure (see `compile_closure()`) rather than
+    the trampoline.  The original matcher is kept (as `matcher`) so that the
+    graph can still be displayed and cloned.
+    '''
+    
+    def __init__(self, matcher, closure_=None):
+        super(Compiled, self).__init__()
+        self._arg(matcher=matcher)
+        if closure_ is None:
+            closure_ = compile_closure(matcher)
+        self.closure = closure_
+        
+    def _match(self, stream):
+        '''
+        Evaluate the closure as a single generator for the trampoline.
+        '''
+        return GeneratorWrapper(self.closure(stream), self, stream)
+    
+    def _untagged_match(self, stream):
+        '''
+        The closure, called directly.
+        '''
+        return self.closure(stream)
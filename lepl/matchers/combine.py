@@ -68,7 +68,7 @@ def _cleanup(queue):
     Utility to discard queued/stacked values.
     '''
     for (_count, _acc, _stream, generator) in queue:
-        generator.generator.close()
+        generator.close()
         
 
 def search_factory(factory):
@@ -286,7 +286,7 @@ def And(*matchers):
                         pass
             finally:
                 for (result, generator, queued) in stack:
-                    generator.generator.close()
+                    generator.close()
                     
     return match
 
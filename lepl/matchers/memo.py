@@ -41,12 +41,13 @@ generators implemented here.
 
 from abc import ABCMeta
 from itertools import count
+from logging import getLogger
 
 from lepl.matchers.core import OperatorMatcher
 from lepl.matchers.matcher import is_child
 from lepl.core.parser import tagged, GeneratorWrapper
 from lepl.support.state import State
-from lepl.support.lib import LogMixin, empty, format
+from lepl.support.lib import empty, format
 
 
 # pylint: disable-msg=W0105, C0103, R0903, W0212
@@ -66,14 +67,116 @@ class MemoException(Exception):
     Exception raised for problems with memoisation.
     '''
     
-def RMemo(matcher):
+    
+def position(stream):
+    '''
+    The part of the memo key that identifies the stream.  For location streams
+    this is a pair of integers (see `StreamView.position`), which avoids the
+    cost of hashing and comparing the stream itself (a chain of calls through
+    the line and source, repeated for each layer of a token stream).  Other
+    streams (strings, lists etc) are used directly.
+    '''
+    try:
+        return stream.position
+    except AttributeError:
+        return stream
+    
+
+class MemoTable(object):
+    '''
+    The table of cached values used by the memoizers.  By default each 
+    memoizer has its own table, which grows without limit (and persists 
+    between calls to the parser).  A single instance can also be given to
+    all memoizers (see `ConfigBuilder.right_memoize()` etc), in which case
+    its size can be bounded, making memoization usable on large inputs.
+    
+    When bounded, entries are kept in two generations: new entries go into
+    the current generation and, when that reaches half the size, it 
+    replaces the previous generation (whose entries are discarded).  
+    Entries in the previous generation that are used again are moved to the
+    current generation, so this approximates least-recently-used eviction,
+    and a matcher that is called repeatedly (for example, in a 
+    left-recursive loop) keeps its entry.  The size should therefore be 
+    much larger than the number of memoized matchers.  Discarded values are
+    simply calculated again if needed.
+    
+    Entries are evicted whether or not they are still in use.  For the 
+    right (non left-recursive) memoizers that only costs time, but the 
+    left-recursive memoizers (`LMemo`) keep the counters that curtail 
+    recursion, and the results that nested calls read, in their entries.
+    An entry evicted in the middle of a parse is silently started afresh,
+    so the left recursion is no longer curtailed as intended.  With `LMemo`
+    the size should be well above the number of entries a single parse 
+    needs at once, or the table left unbounded.
+    
+    ``hits``, ``misses`` and ``evictions`` count lookups and discarded
+    entries; ``len()`` gives the number of entries.
+    '''
+    
+    def __init__(self, size=None):
+        super(MemoTable, self).__init__()
+        if size is not None and size < 2:
+            raise MemoException(
+                    format('A memo table must hold at least 2 entries: {0}', 
+                           size))
+        self.size = size
+        self.__limit = None if size is None else size // 2
+        self.__current = {}
+        self.__previous = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        
+    def get(self, key, factory):
+        '''
+        Return the value for the key, calling factory() to create it if it
+        is not already present.
+        '''
+        current = self.__current
+        if key in current:
+            self.hits += 1
+            return current[key]
+        if key in self.__previous:
+            self.hits += 1
+            value = self.__previous.pop(key)
+        else:
+            self.misses += 1
+            value = factory()
+        if self.__limit is not None and len(current) >= self.__limit:
+            self.evictions += len(self.__previous)
+            self.__previous = current
+            current = self.__current = {}
+        current[key] = value
+        return value
+    
+    def clear(self):
+        '''
+        Discard all entries (the statistics are not reset).
+        '''
+        self.evictions += len(self)
+        self.__current = {}
+        self.__previous = {}
+        
+    def __len__(self):
+        return len(self.__current) + len(self.__previous)
+    
+    def __str__(self):
+        return format('MemoTable(size={0}, entries={1}, hits={2}, '
+                      'misses={3}, evictions={4})', self.size, len(self),
+                      self.hits, self.misses, self.evictions)
+    
+    def __repr__(self):
+        return format('MemoTable({0})', self.size)
+    
+    
+def RMemo(matcher, table=None):
     '''
     Wrap in the _RMemo cache if required.
     '''
     if is_child(matcher, NoMemo, fail=False):
         return matcher
     else:
-        return _RMemo(matcher)
+        return _RMemo(matcher, table)
 
 
 class _RMemo(OperatorMatcher):
@@ -88,10 +191,11 @@ class _RMemo(OperatorMatcher):
     # pylint: disable-msg=E1101
     # (using _args to define attributes)
     
-    def __init__(self, matcher):
+    def __init__(self, matcher, table=None):
         super(_RMemo, self).__init__()
         self._arg(matcher=matcher)
-        self.__table = {}
+        self._karg(table=table)
+        self.__table = MemoTable() if table is None else table
         self.__state = State.singleton()
         
     def _match(self, stream):
@@ -101,15 +205,15 @@ class _RMemo(OperatorMatcher):
         # pylint: disable-msg=W0212
         # (_match is an internal interface)
         try:
-            key = (stream, self.__state.hash)
-            if key not in self.__table:
-                # we have no cache for this stream, so we need to generate the
-                # entry.  we do not care about nested calls with the same stream
-                # because this memoization is not for left recursion.  that 
-                # means that we can return a table around this generator 
-                # immediately.
-                self.__table[key] = RTable(self.matcher._match(stream))
-            return GeneratorWrapper(self.__table[key].generator(self.matcher, stream),
+            # if we have no cache for this stream, we need to generate the
+            # entry.  we do not care about nested calls with the same stream
+            # because this memoization is not for left recursion.  that 
+            # means that we can return a table around this generator 
+            # immediately.
+            table = self.__table.get(
+                            (self, position(stream), self.__state.hash),
+                            lambda: RTable(self.matcher._match(stream)))
+            return GeneratorWrapper(table.generator(self.matcher, stream),
                                     self, stream)
         except TypeError as e: # unhashable type; cannot cache
             self._warn(format('Cannot memoize (cannot hash {0!r}: {1})', 
@@ -121,10 +225,9 @@ class _RMemo(OperatorMatcher):
         Match the stream without trampolining (we don't need to worry about
         recursion).
         '''
-        key = (stream, self.__state.hash)
-        if key not in self.__table:
-            self.__table[key] = ([], self.matcher._untagged_match(stream))
-        (known, generator) = self.__table[key]
+        (known, generator) = self.__table.get(
+                    (self, position(stream), self.__state.hash),
+                    lambda: ([], self.matcher._untagged_match(stream)))
         for result in known:
             yield result
         for result in generator:
@@ -132,10 +235,13 @@ class _RMemo(OperatorMatcher):
             yield result
 
 
-class RTable(LogMixin):
+class RTable(object):
     '''
     Wrap a generator so that separate uses all call the same core generator,
     which is itself tabulated as it unrolls.
+    
+    This (like `PerStreamCache` and `PerCallCache`) is created for each new
+    memo entry, so avoids the cost of `LogMixin`.
     '''
     
     def __init__(self, generator):
@@ -204,14 +310,14 @@ class _DummyMatcher(object):
         return self.__cached_repr
         
         
-def LMemo(matcher):
+def LMemo(matcher, table=None):
     '''
     Wrap in the _LMemo cache if required.
     '''
     if is_child(matcher, NoMemo, fail=False):
         return matcher
     else:
-        return _LMemo(matcher)
+        return _LMemo(matcher, table)
 
 
 class _LMemo(OperatorMatcher):
@@ -222,20 +328,20 @@ class _LMemo(OperatorMatcher):
     # pylint: disable-msg=E1101
     # (using _args to define attributes)
     
-    def __init__(self, matcher):
+    def __init__(self, matcher, table=None):
         super(_LMemo, self).__init__()
         self._arg(matcher=matcher)
-        self.__caches = {}
+        self._karg(table=table)
+        self.__caches = MemoTable() if table is None else table
         self.__state = State.singleton()
         
     def _match(self, stream):
         '''
         Attempt to match the stream.
         '''
-        key = (stream, self.__state.hash)
-        if key not in self.__caches:
-            self.__caches[key] = PerStreamCache(self.matcher)
-        return self.__caches[key]._match(stream)
+        return self.__caches.get((self, position(stream), self.__state.hash),
+                                 lambda: PerStreamCache(self.matcher)
+                                 )._match(stream)
     
     def _untagged_match(self, stream):
         '''
@@ -247,7 +353,7 @@ class _LMemo(OperatorMatcher):
                 'recursive loops, which require a trampoline.')
         
 
-class PerStreamCache(LogMixin):
+class PerStreamCache(object):
     '''
     Manage the counter (one for each different stream) that limits the 
     number of (left-)recursive calls.  Each permitted call receives a separate
@@ -288,7 +394,7 @@ class PerStreamCache(LogMixin):
             return self.__first.view()
         
 
-class PerCallCache(LogMixin):
+class PerCallCache(object):
     '''
     The "final" cache for a matcher at a certain recursive depth and with a
     certain input stream.
@@ -328,7 +434,7 @@ class PerCallCache(LogMixin):
             while True:
                 result = yield self.__generator
                 if self.__unstable:
-                    self._warn(
+                    getLogger('lepl.matchers.memo.PerCallCache').warn(
                         format('A view completed before the cache was '
                                'complete: {0!r}. This typically means that '
                                'the grammar contains a matcher that does not '
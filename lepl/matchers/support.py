@@ -309,12 +309,15 @@ class TrampolineWrapper(TransformableWrapper):
     Typically only used for advanced matchers.
     '''
     
-    @tagged
-    def _match(self, stream_in):
+    def __evaluate(self, stream_in, wrap):
+        '''
+        Evaluate the generator via the trampoline, transforming the results.
+        '''
         from lepl.matchers.transform import raise_
         function = self.wrapper.function
-        generator = GeneratorWrapper(self._cached_matcher(self, stream_in), 
-                                     self, stream_in)
+        generator = self._cached_matcher(self, stream_in)
+        if wrap:
+            generator = GeneratorWrapper(generator, self, stream_in)
         while True:
             try:
                 value = yield generator
@@ -325,6 +328,19 @@ class TrampolineWrapper(TransformableWrapper):
                     yield function(stream_in, lambda: raise_(StopIteration))
                 else:
                     raise e
+    
+    @tagged
+    def _match(self, stream_in):
+        return self.__evaluate(stream_in, True)
+    
+    def __unwrapped_match(self, stream_in):
+        '''
+        The version of `_match()` used by `untag()`, which leaves the inner
+        generator unwrapped too.
+        '''
+        return self.__evaluate(stream_in, False)
+    
+    _match.untagged = __unwrapped_match
                 
     
 class NoTrampoline(object):
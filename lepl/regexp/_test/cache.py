@@ -0,0 +1,105 @@
+
+# The contents of this file are subject to the Mozilla Public License
+# (MPL) Version 1.1 (the "License"); you may not use this file except
+# in compliance with the License. You may obtain a copy of the License
+# at http://www.mozilla.org/MPL/
+#
+# Software distributed under the License is distributed on an "AS IS"
+# basis, WITHOUT WARRANTY OF ANY KIND, either express or implied. See
+# the License for the specific language governing rights and
+# limitations under the License.
+#
+# The Original Code is LEPL (http://www.acooke.org/lepl)
+# The Initial Developer of the Original Code is Andrew Cooke.
+# Portions created by the Initial Developer are Copyright (C) 2009-2010
+# Andrew Cooke (andrew@acooke.org). All Rights Reserved.
+#
+# Alternatively, the contents of this file may be used under the terms
+# of the LGPL license (the GNU Lesser General Public License,
+# http://www.gnu.org/licenses/lgpl.html), in which case the provisions
+# of the LGPL License are applicable instead of those above.
+#
+# If you wish to allow use of your version of this file only under the
+# terms of the LGPL License and not to allow others to use your version
+# of this file under the MPL, indicate your decision by deleting the
+# provisions above and replace them with the notice and other provisions
+# required by the LGPL License.  If you do not delete the provisions
+# above, a recipient may use your version of this file under either the
+# MPL or the LGPL License.
+
+'''
+Tests for the lepl.regexp.cache module.
+'''
+
+from os import listdir, path
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import TestCase
+
+from lepl import UnicodeAlphabet, Token, Integer
+from lepl.regexp.cache import DfaCache
+from lepl.regexp.core import Compiler
+
+
+# pylint: disable-msg=C0103, C0111, C0301
+# (dude this is just a test)
+
+
+class DfaCacheTest(TestCase):
+    
+    def setUp(self):
+        self.directory = mkdtemp()
+        
+    def tearDown(self):
+        rmtree(self.directory)
+    
+    def test_single(self):
+        alphabet = UnicodeAlphabet.instance()
+        cache = DfaCache(self.directory)
+        dfa = cache.single(alphabet, 'a*b')
+        assert (cache.hits, cache.misses) == (0, 1)
+        assert len(listdir(self.directory)) == 1
+        cache = DfaCache(self.directory)
+        cached = cache.single(alphabet, 'a*b')
+        assert (cache.hits, cache.misses) == (1, 0)
+        expected = Compiler.single(alphabet, 'a*b').dfa().match('aabc')
+        assert dfa.match('aabc') == expected, dfa.match('aabc')
+        assert cached.match('aabc') == expected, cached.match('aabc')
+        cache.single(alphabet, 'a*c')
+        assert (cache.hits, cache.misses) == (1, 1)
+        
+    def test_multiple(self):
+        alphabet = UnicodeAlphabet.instance()
+        regexps = [('a', 'a+'), ('b', 'b+')]
+        cache = DfaCache(self.directory)
+        cache.multiple(alphabet, regexps)
+        dfa = DfaCache(self.directory).multiple(alphabet, regexps)
+        assert dfa.match('bba') == (['b'], 'bb', 'a'), dfa.match('bba')
+        
+    def parser(self):
+        matcher = Token(Integer())[:] 
+        matcher.config.lexer(cache=self.directory)
+        return matcher.get_parse()
+    
+    def test_lexer(self):
+        results = self.parser()('1 2 3')
+        assert results == ['1', '2', '3'], results
+        assert len(listdir(self.directory)) == 2
+        results = self.parser()('1 2 3')
+        assert results == ['1', '2', '3'], results
+        
+    def test_corrupt(self):
+        alphabet = UnicodeAlphabet.instance()
+        cache = DfaCache(self.directory)
+        cache.single(alphabet, 'a')
+        for name in listdir(self.directory):
+            with open(path.join(self.directory, name), 'wb') as output:
+                output.write(b'junk')
+        cache = DfaCache(self.directory)
+        dfa = cache.single(alphabet, 'a')
+        assert (cache.hits, cache.misses) == (0, 1)
+        assert dfa.match('a') == (['label'], 'a', ''), dfa.match('a')
+        # the bad entry was replaced
+        cache = DfaCache(self.directory)
+        cache.single(alphabet, 'a')
+        assert (cache.hits, cache.misses) == (1, 0)
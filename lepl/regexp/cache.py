@@ -0,0 +1,131 @@
+
+# The contents of this file are subject to the Mozilla Public License
+# (MPL) Version 1.1 (the "License"); you may not use this file except
+# in compliance with the License. You may obtain a copy of the License
+# at http://www.mozilla.org/MPL/
+#
+# Software distributed under the License is distributed on an "AS IS"
+# basis, WITHOUT WARRANTY OF ANY KIND, either express or implied. See
+# the License for the specific language governing rights and
+# limitations under the License.
+#
+# The Original Code is LEPL (http://www.acooke.org/lepl)
+# The Initial Developer of the Original Code is Andrew Cooke.
+# Portions created by the Initial Developer are Copyright (C) 2009-2010
+# Andrew Cooke (andrew@acooke.org). All Rights Reserved.
+#
+# Alternatively, the contents of this file may be used under the terms
+# of the LGPL license (the GNU Lesser General Public License,
+# http://www.gnu.org/licenses/lgpl.html), in which case the provisions
+# of the LGPL License are applicable instead of those above.
+#
+# If you wish to allow use of your version of this file only under the
+# terms of the LGPL License and not to allow others to use your version
+# of this file under the MPL, indicate your decision by deleting the
+# provisions above and replace them with the notice and other provisions
+# required by the LGPL License.  If you do not delete the provisions
+# above, a recipient may use your version of this file under either the
+# MPL or the LGPL License.
+
+'''
+A cache of compiled DFAs on disk, so that separate processes using the
+same grammar do not each repeat the (relatively slow) parsing and compilation
+of the lexer's regular expressions.
+'''
+
+from hashlib import sha1
+from os import close, makedirs, path, remove, rename
+from pickle import dump, load, HIGHEST_PROTOCOL
+from sys import version
+from tempfile import mkstemp
+
+from lepl.regexp.core import Compiler
+from lepl.support.lib import format, str, LogMixin
+
+
+class DfaCache(LogMixin):
+    '''
+    Compiled DFAs (`DfaPattern` instances), saved in a directory.  
+    
+    Each is saved in a file named after a hash of the regular expression
+    (which includes the labels), the alphabet, and the LEPL and Python 
+    versions, so a change to any of these simply misses the cache.  Files 
+    are written under a temporary name and then renamed, so processes 
+    sharing a directory never see a partial entry.  A file that cannot be 
+    read is treated as missing.
+    '''
+    
+    def __init__(self, directory):
+        super(DfaCache, self).__init__()
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        
+    def single(self, alphabet, regexp, label='label'):
+        '''
+        The DFA for a single expression (as `Compiler.single()`).
+        '''
+        return self.__dfa(alphabet, ('single', label, str(regexp)),
+                          lambda: Compiler.single(alphabet, regexp, label))
+    
+    def multiple(self, alphabet, regexps):
+        '''
+        The DFA for several labelled expressions (as `Compiler.multiple()`).
+        '''
+        return self.__dfa(alphabet, 
+                          ('multiple', [(label, str(regexp)) 
+                                        for (label, regexp) in regexps]),
+                          lambda: Compiler.multiple(alphabet, regexps))
+        
+    def key(self, alphabet, expression):
+        '''
+        The hash used to identify a compiled expression.  This uses the
+        text of the expressions, so that a hit avoids parsing them.
+        '''
+        from lepl import __version__
+        text = repr((__version__, version, 
+                     type(alphabet).__name__, str(alphabet), expression))
+        return sha1(text.encode('utf8')).hexdigest()
+    
+    def __dfa(self, alphabet, expression, compiler):
+        '''
+        Return the DFA from the cache if possible (otherwise it is compiled
+        and saved).
+        '''
+        file_ = path.join(self.directory, 
+                          self.key(alphabet, expression) + '.dfa')
+        try:
+            with open(file_, 'rb') as input_:
+                pattern = load(input_)
+            self.hits += 1
+            return pattern
+        except Exception as err:
+            if path.exists(file_):
+                self._warn(format('Cannot read {0}: {1}', file_, err))
+        self.misses += 1
+        pattern = compiler().dfa()
+        self.save(file_, pattern)
+        return pattern
+    
+    def save(self, file_, pattern):
+        '''
+        Save a pattern, failing quietly (with a warning) since the cache
+        is only an optimisation.
+        '''
+        try:
+            if not path.isdir(self.directory):
+                makedirs(self.directory)
+            (handle, temp) = mkstemp(dir=self.directory, suffix='.tmp')
+            close(handle)
+            try:
+                with open(temp, 'wb') as output:
+                    dump(pattern, output, HIGHEST_PROTOCOL)
+                rename(temp, file_)
+            except:
+                remove(temp)
+                raise
+        except (IOError, OSError) as err:
+            self._warn(format('Cannot save {0}: {1}', file_, err))
+            
+    def __str__(self):
+        return format('DfaCache({0!r})', self.directory)
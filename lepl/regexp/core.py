@@ -915,6 +915,23 @@ class DfaPattern(LogMixin):
                     row[interval] = (dest, labels)
             self.__table[src] = row
             
+    def __getstate__(self):
+        '''
+        Only the table is needed for matching (the graph and alphabet are
+        large and the alphabet cannot be pickled), so that is all that is
+        kept when a pattern is saved (see `lepl.regexp.cache`).
+        '''
+        return (self.__table, self.__empty_labels)
+    
+    def __setstate__(self, state):
+        '''
+        Restore a pattern saved by `__getstate__()`.
+        '''
+        LogMixin.__init__(self)
+        (self.__table, self.__empty_labels) = state
+        self.__graph = None
+        self.__alphabet = None
+            
     def match(self, stream_in):
         '''
         Match against the stream.
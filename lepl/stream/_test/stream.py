@@ -92,6 +92,18 @@ class StreamTest(TestCase):
     def test_read(self):
         s1 = DEFAULT_STREAM_FACTORY.from_string('12\n123\n')
         assert '12\n' == s1.text
+        
+    def test_position(self):
+        s1 = DEFAULT_STREAM_FACTORY.from_string('abc\npqr\nxyz')
+        (serial, offset) = s1.position
+        assert offset == 0, offset
+        assert s1[5:].position == (serial, 5), s1[5:].position
+        assert s1[2:][3:].position == s1[5:].position
+        assert s1[9:].position == (serial, 9), s1[9:].position
+        # a new source has a new serial, even with the same text
+        s2 = DEFAULT_STREAM_FACTORY.from_string('abc\npqr\nxyz')
+        assert s2 == s1
+        assert s2.position != s1.position
 
 
 class SimpleStreamTester(object):
@@ -112,6 +112,10 @@ def facade_factory(stream):
         def source(self):
             return self.__stream.source
         
+        @property
+        def position(self):
+            return self.__stream.position
+        
         @property
         def stream(self):
             return self.__stream
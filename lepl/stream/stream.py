@@ -121,6 +121,7 @@ be delegated to the source (and similarly for equality).
 
 from abc import ABCMeta, abstractmethod, abstractproperty
 from io import StringIO, IOBase
+from itertools import count
 
 from lepl.support.lib import open_stop, sample, format, basestring, str, \
     LogMixin
@@ -428,6 +429,16 @@ class StreamView(object):
         Expose the underlying source.
         '''
         return self.__line.source
+    
+    @property
+    def position(self):
+        '''
+        A pair of integers that identify this point in the stream: the 
+        serial number of the source and the offset from its start.  Unlike
+        the hash, this is cheap to calculate (it is used by the memoizers).
+        '''
+        line = self.__line
+        return (line.source.serial, line.previous_length + self.__offset)
 
 
 LocationStream.register(StreamView)
@@ -637,6 +648,9 @@ DEFAULT_STREAM_FACTORY = DefaultStreamFactory()
 _Source = ABCMeta('_Source', (object, ), {})
 '''ABC used to identify sources.'''
 
+_SERIAL = count()
+'''Distinct serial numbers for sources.'''
+
 
 class Source(_Source):
     '''
@@ -647,7 +661,11 @@ class Source(_Source):
         '''
         `description` and `join` should be obvious; base is used as the
         source of identity.
+        
+        Each instance also has a distinct ``serial`` number, which identifies
+        it (and not its base) in `StreamView.position`.
         '''
+        self.serial = next(_SERIAL)
         self.__description = description
         self.join = join
         self.total_length = None